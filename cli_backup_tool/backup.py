@@ -1,12 +1,34 @@
 import os
-import shutil
 import argparse
+import json
 import logging
+import stat
 from datetime import datetime
-import sqlite3
-import hashlib
 import time
 import sys
+import threading
+import signal
+from collections import namedtuple
+
+from catalog import DEFAULT_BATCH_SIZE, Catalog, open_catalog
+import cas
+import pack
+import snapshot
+import migrations
+from copier import ENGINES, copy_and_hash, copy_file
+from compression import CODEC_SUFFIXES, CODECS, compress_file, parse_policy
+from delta import DELTA_MIN_SIZE, BlockSignature, delta_copy
+from fanout import DEFAULT_MAX_LAG, FanOut
+from filters import EXCLUDE, INCLUDE, compile_filter
+from logsink import LogSink, flush_queued_logging, start_queued_logging
+from inotify import DEFAULT_DEBOUNCE, TreeWatcher
+from manifest import Manifest, ManifestBuilder, diff_manifests
+from hashcache import DEFAULT_MAX_ENTRIES, HashCache
+from hashing import DEFAULT_ALGORITHM, SUPPORTED_ALGORITHMS, algorithm_for_digest, hash_file, new_hasher
+from pipeline import run_pipeline
+from restore import hash_backup_file, hash_packed, restore_file, restore_packed
+from throttle import IOLimiter, Throttle, parse_ioprio, set_priority
+from walker import scan_paths, scan_tree
 
 """Logger"""
 def setup_logger(log_filename, verbose, db_name):
@@ -18,186 +40,888 @@ def setup_logger(log_filename, verbose, db_name):
     file_handler = logging.FileHandler(log_filename)
     file_handler.setLevel(logging.DEBUG)
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    handlers = [file_handler]
 
     if verbose:
         console_handler = logging.StreamHandler()
         console_handler.setLevel(logging.INFO)
         console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-    
+        handlers.append(console_handler)
+
+    # File and console output happen on a listener thread so they never block the backup loop
+    start_queued_logging(logger, handlers)
 
     return logger
 
 
-def get_md5_hash(file_path):
-    if os.path.isfile(file_path):
-        file_content = open(file_path, "rb").read()
-        hash_value = hashlib.md5(file_content).hexdigest()
-        return hash_value
-    else:
-        return None
+def get_md5_hash(file_path, algorithm=DEFAULT_ALGORITHM, use_mmap=False, hash_cache=None, limiter=None, refresh=False):
+    if hash_cache is not None:
+        # refresh (--paranoid) re-reads the file: a cached digest is keyed on the stat tuple being distrusted
+        return hash_cache.hash_file(file_path, algorithm, use_mmap, limiter, refresh)
+    return hash_file(file_path, algorithm=algorithm, use_mmap=use_mmap, limiter=limiter)
+
+"""Change detection"""
+def stat_signature(file_stat):
+    if file_stat is None:
+        return (None, None, None, None)
+    return (file_stat.st_size, file_stat.st_mtime_ns, file_stat.st_ino, file_stat.st_dev)
+
+def get_file_record(db_name, directory, filename):
+    with open_catalog(db_name) as catalog:
+        return catalog.fetchone('''
+            SELECT File_id, Md5hash, Size, Mtime_ns, Inode, Device
+            FROM file
+            WHERE Directory = ? AND Filename = ?
+        ''', (directory, filename))
+
+def update_file_stat(db_name, file_id, file_stat):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('''
+            UPDATE file SET Size = ?, Mtime_ns = ?, Inode = ?, Device = ?
+            WHERE File_id = ?
+        ''', stat_signature(file_stat) + (file_id,))
+
+def is_unchanged(record, file_stat):
+    """Stat fast path: a file whose size, mtime, inode and device match the catalog is not re-read"""
+    return record is not None and record[2] is not None and tuple(record[2:6]) == stat_signature(file_stat)
 
 """Database"""
 def create_database(db_name):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS file (
-            File_id INTEGER PRIMARY KEY,
-            Directory TEXT NOT NULL,
-            Filename TEXT NOT NULL,
-            Last_backup_datetime TEXT,
-            Md5hash TEXT NOT NULL
-        )
-    ''')
-    conn.commit()
-    conn.close()
-
-def insert_file_info(db_name, directory, filename, last_backup_datetime, md5hash):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO file (Directory, Filename, Last_backup_datetime, Md5hash)
-        VALUES (?, ?, ?, ?)
-    ''', (directory, filename, last_backup_datetime, md5hash))
-    conn.commit()
-    conn.close()
+    """Bring the catalog to the current schema; every table the tool uses comes from migrations.MIGRATIONS"""
+    migrations.migrate(db_name)
+
+def insert_file_info(db_name, directory, filename, last_backup_datetime, md5hash, file_stat=None, codec=None, stored_size=None):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('''
+            INSERT INTO file (Directory, Filename, Last_backup_datetime, Md5hash, Size, Mtime_ns, Inode, Device, Codec, Stored_size)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (Directory, Filename) DO UPDATE SET
+                Last_backup_datetime = excluded.Last_backup_datetime,
+                Md5hash = excluded.Md5hash,
+                Size = excluded.Size,
+                Mtime_ns = excluded.Mtime_ns,
+                Inode = excluded.Inode,
+                Device = excluded.Device,
+                Codec = excluded.Codec,
+                Stored_size = excluded.Stored_size
+        ''', (directory, filename, last_backup_datetime, md5hash) + stat_signature(file_stat) + (codec, stored_size))
+        # lastrowid is not set when the upsert updates an existing row
+        return catalog.fetchone('SELECT File_id FROM file WHERE Directory = ? AND Filename = ?', (directory, filename))[0]
 
 
 def create_notes_table(db_name):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Notes (
-            note_id INTEGER PRIMARY KEY,
-            note_text TEXT NOT NULL,
-            entry_id INTEGER,
-            FOREIGN KEY (entry_id) REFERENCES Logentry(entry_id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        migrations.create_notes_table(catalog)
 
 
 def create_logentry_table(db_name):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Logentry (
-            entry_id INTEGER PRIMARY KEY,
-            entry_datetime TEXT NOT NULL,
-            severity_level TEXT NOT NULL,
-            Message TEXT NOT NULL,
-            file_id INTEGER,
-            job_id INTEGER,
-            FOREIGN KEY (file_id) REFERENCES file(File_id),
-            FOREIGN KEY (job_id) REFERENCES BackupJob(Job_id)
-        )
-    ''')
-    conn.commit()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        migrations.create_logentry_table(catalog)
 
 
 def insert_log_entry(db_name, entry_datetime, severity_level, message, file_id=None, job_id=None):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO Logentry (entry_datetime, severity_level, Message, file_id, job_id)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (entry_datetime, severity_level, message, file_id, job_id))
-    conn.commit()
-    entry_id = cursor.lastrowid
-    conn.close()
-    return entry_id
+    if isinstance(db_name, LogSink):
+        db_name.put(entry_datetime, severity_level, message, file_id, job_id)
+        return None
+    with open_catalog(db_name) as catalog:
+        return catalog.execute('''
+            INSERT INTO Logentry (entry_datetime, severity_level, Message, file_id, job_id)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (entry_datetime, severity_level, message, file_id, job_id))
 
 
 def create_backup_job_table(db_name):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS BackupJob (
-            Job_id INTEGER PRIMARY KEY,
-            Commandline TEXT NOT NULL,
-            Execution_datetime TEXT NOT NULL
-        );
-    ''')
-    conn.commit()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        migrations.create_backup_job_table(catalog)
+        migrations.add_job_stats_columns(catalog)
 
 def insert_backup_job(db_name, commandline, execution_datetime):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        INSERT INTO BackupJob (Commandline, Execution_datetime)
-        VALUES (?, ?)
-    ''', (commandline, execution_datetime))
-    job_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return job_id
+    with open_catalog(db_name) as catalog:
+        return catalog.execute('''
+            INSERT INTO BackupJob (Commandline, Execution_datetime)
+            VALUES (?, ?)
+        ''', (commandline, execution_datetime))
+
+def record_job_stats(db_name, job_id, files_scanned, files_copied, bytes_copied, duration_seconds):
+    """Add one run to the job's stats, so the batches of a --watch job add up instead of replacing each other"""
+    with open_catalog(db_name) as catalog:
+        catalog.execute('''
+            UPDATE BackupJob SET Files_scanned = IFNULL(Files_scanned, 0) + ?, Files_copied = IFNULL(Files_copied, 0) + ?,
+                Bytes_copied = IFNULL(Bytes_copied, 0) + ?, Duration_seconds = IFNULL(Duration_seconds, 0) + ?
+            WHERE Job_id = ?
+        ''', (files_scanned, files_copied, bytes_copied, duration_seconds, job_id))
+
+def get_recent_throughput(db_name, jobs=10):
+    """Bytes per second copied by the last jobs that copied anything, or None without history"""
+    with open_catalog(db_name) as catalog:
+        row = catalog.fetchone('''
+            SELECT SUM(Bytes_copied), SUM(Duration_seconds) FROM (
+                SELECT Bytes_copied, Duration_seconds FROM BackupJob
+                WHERE Bytes_copied > 0 AND Duration_seconds > 0
+                ORDER BY Job_id DESC LIMIT ?
+            )
+        ''', (jobs,))
+    return row[0] / row[1] if row and row[0] else None
+
+def get_block_signature(db_name, file_id):
+    with open_catalog(db_name) as catalog:
+        row = catalog.fetchone('SELECT Block_size, Weak, Strong FROM BlockSignature WHERE File_id = ?', (file_id,))
+    return BlockSignature.unpack(*row) if row else None
+
+def save_block_signature(db_name, file_id, signature):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('''
+            INSERT OR REPLACE INTO BlockSignature (File_id, Block_size, Weak, Strong)
+            VALUES (?, ?, ?, ?)
+        ''', (file_id,) + signature.pack())
+
+def delete_block_signature(db_name, file_id):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('DELETE FROM BlockSignature WHERE File_id = ?', (file_id,))
+
+def insert_snapshot(db_name, job_id, destination_dir, path, created_datetime):
+    with open_catalog(db_name) as catalog:
+        return catalog.execute('''
+            INSERT INTO Snapshot (Job_id, Destination, Path, Created_datetime)
+            VALUES (?, ?, ?, ?)
+        ''', (job_id, os.path.abspath(destination_dir), path, created_datetime))
+
+def get_latest_snapshot(db_name, destination_dir):
+    with open_catalog(db_name) as catalog:
+        row = catalog.fetchone('''
+            SELECT Path FROM Snapshot WHERE Destination = ?
+            ORDER BY Snapshot_id DESC LIMIT 1
+        ''', (os.path.abspath(destination_dir),))
+    return row[0] if row and os.path.isdir(row[0]) else None
+
+def insert_pack_entry(db_name, file_id, job_id, location, md5hash):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('''
+            INSERT OR REPLACE INTO PackEntry (File_id, Job_id, Segment, Offset, Length, Md5hash)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (file_id, job_id) + tuple(location) + (md5hash,))
+
+def delete_pack_entry(db_name, file_id):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('DELETE FROM PackEntry WHERE File_id = ?', (file_id,))
+
+def get_destination_hashes(db_name, directory, filename):
+    with open_catalog(db_name) as catalog:
+        return dict(catalog.fetchall('SELECT Destination, Md5hash FROM DestinationFile WHERE Directory = ? AND Filename = ?',
+                                     (directory, filename)))
+
+def save_destination_file(db_name, destination_dir, directory, filename, md5hash, job_id=None):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('''
+            INSERT OR REPLACE INTO DestinationFile (Destination, Directory, Filename, Md5hash, Backup_datetime, Job_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (os.path.abspath(destination_dir), directory, filename, md5hash, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime()), job_id))
+
+def save_manifest(db_name, job_id, manifest):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('''
+            INSERT OR REPLACE INTO Manifest (Job_id, Entries, Digest_size, Ids, Sizes, Mtimes, Digests)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (job_id,) + manifest.pack())
+
+def get_manifest(db_name, job_id):
+    with open_catalog(db_name) as catalog:
+        row = catalog.fetchone('SELECT Digest_size, Ids, Sizes, Mtimes, Digests FROM Manifest WHERE Job_id = ?', (job_id,))
+    return Manifest.unpack(*row) if row else None
+
+def journal_path(db_name, job_id, path):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('INSERT OR IGNORE INTO JobProgress (Job_id, Path) VALUES (?, ?)', (job_id, path))
+
+def get_journal(db_name, job_id):
+    with open_catalog(db_name) as catalog:
+        return {row[0] for row in catalog.fetchall('SELECT Path FROM JobProgress WHERE Job_id = ?', (job_id,))}
+
+def clear_journal(db_name, job_id):
+    with open_catalog(db_name) as catalog:
+        catalog.execute('DELETE FROM JobProgress WHERE Job_id = ?', (job_id,))
 
 """Making backup"""
-def backup_files(source_dir, destination_dir, db_name, logger, file_id=None, job_id=None):
+FileResult = namedtuple("FileResult", "status source_file_path destination_file_path directory filename record file_stat md5hash error signature bytes_written codec stored_size pack",
+                        defaults=(None, None, None, None, None))
+BackupOptions = namedtuple("BackupOptions", "hash_algorithm hash_mmap paranoid store job_name delta delta_min_size compression snapshot_dir previous_snapshot copy_engine single_pass hash_cache throttle pack_threshold pack_writer",
+                           defaults=(DEFAULT_ALGORITHM, False, False, "copy", None, False, DELTA_MIN_SIZE, None, None, None, "auto", False, None, None, 0, None))
+STORE_MODES = ("copy", "cas", "snapshot")
+
+def walk_source(source_dir, paths, onerror, path_filter=None):
+    """The whole tree, or only the given paths, minus what the filter excludes"""
+    if paths is None:
+        return scan_tree(source_dir, onerror, path_filter.excluded if path_filter else None)
+    return scan_paths(source_dir, paths, onerror, path_filter.excluded_path if path_filter else None)
+
+def ensure_parent_dir(path, created_dirs=None):
+    parent = os.path.dirname(path)
+    if created_dirs is None or getattr(created_dirs, "last", None) != parent:
+        os.makedirs(parent, exist_ok=True)
+        if created_dirs is not None:
+            created_dirs.last = parent
+
+def compression_codec(options, path):
+    if options.compression is None or options.store != "copy":
+        return None
+    return options.compression.codec_for(path)
+
+def uses_delta(options, file_stat, path):
+    return (options.delta and options.store == "copy" and compression_codec(options, path) is None
+            and file_stat is not None and file_stat.st_size >= options.delta_min_size)
+
+def uses_single_pass(options, file_stat, path):
+    return (options.single_pass and options.store in ("copy", "snapshot") and compression_codec(options, path) is None
+            and not uses_delta(options, file_stat, path) and file_stat is not None and stat.S_ISREG(file_stat.st_mode))
+
+def uses_pack(options, file_stat, path):
+    return (options.pack_writer is not None and options.store == "copy" and compression_codec(options, path) is None
+            and file_stat is not None and stat.S_ISREG(file_stat.st_mode) and file_stat.st_size < options.pack_threshold)
+
+def destination_path(entry, destination_dir, options):
+    if options.store == "cas":
+        return os.path.join(cas.job_tree_dir(destination_dir, options.job_name), entry.relative_path)
+    if options.store == "snapshot":
+        return os.path.join(options.snapshot_dir, entry.relative_path)
+    codec = compression_codec(options, entry.name)
+    return os.path.join(destination_dir, entry.relative_path) + (CODEC_SUFFIXES[codec] if codec else "")
+
+def destination_state(entry, destination_dir, options):
+    """Return "missing", "partial" or "complete"; every copy path sets the source mtime only after writing the data"""
+    if uses_pack(options, entry.stat, entry.name):
+        # Packed files have no file of their own; their index row is committed together with the journal entry
+        return "complete"
     try:
-        if not os.path.exists(destination_dir):
-            os.makedirs(destination_dir)
-        files = os.listdir(source_dir)
-
-        for file in files:
-            source_file_path = os.path.join(source_dir, file)
-            destination_file_path = os.path.join(destination_dir, file)
-            source_md5 = get_md5_hash(source_file_path)
-            conn = sqlite3.connect(db_name)
-            cursor = conn.cursor()
-            cursor.execute('SELECT File_id FROM file WHERE Directory = ? AND Filename = ?', (source_dir, file))
-            result = cursor.fetchone()
-            conn.close()
-            file_id = result[0] if result else None
-
-            if source_md5:
-                conn = sqlite3.connect(db_name)
-                cursor = conn.cursor()
-                cursor.execute('SELECT Md5hash FROM file WHERE Directory = ? AND Filename = ?', (source_dir, file))
-                result = cursor.fetchone()
-                conn.close()
-                if result and result[0] == source_md5:
-                    logger.info(f"{datetime.now()} - INFO - {source_file_path} - NO CHANGE, SKIPPING")
-                else:
-                    try:
-                        shutil.copy2(source_file_path, destination_file_path)
-                        logger.info(f"{datetime.now()} - INFO - {source_file_path} -> {destination_file_path} - SUCCESSFULLY COPIED")
-                        last_backup_datetime = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
-                        insert_file_info(db_name, source_dir, file, last_backup_datetime, source_md5)
-                        conn = sqlite3.connect(db_name)
-                        cursor = conn.cursor()
-                        cursor.execute('SELECT File_id FROM file WHERE Directory = ? AND Filename = ?', (source_dir, file))
-                        file_id = cursor.fetchone()[0]
-                        conn.close()
-                        """file_id = cursor.lastrowid"""
-                        insert_log_entry(db_name, datetime.now(), "INFO", f"{source_file_path} -> {destination_file_path} - SUCCESSFULLY COPIED", file_id=file_id, job_id=job_id)
-                        
-                    except Exception as e:
-                        error_message = f"{datetime.now()} - ERROR - {source_file_path} -> {destination_file_path} - {str(e)}"
-                        logger.error(error_message)
-                        insert_log_entry(db_name, datetime.now(), "ERROR", error_message, file_id=file_id, job_id=job_id)
+        destination_stat = os.stat(destination_path(entry, destination_dir, options))
+    except OSError:
+        return "missing"
+    if options.store == "cas" or entry.stat is None:
+        # Blobs and tree links are created by atomic renames and links
+        return "complete"
+    if destination_stat.st_mtime_ns != entry.stat.st_mtime_ns:
+        return "partial"
+    if compression_codec(options, entry.name) is None and destination_stat.st_size != entry.stat.st_size:
+        return "partial"
+    return "complete"
+
+def process_file(entry, record, destination_dir, options=BackupOptions(), created_dirs=None, old_signature=None):
+    """Hash and copy one scanned file without touching the catalog, so it can run on a worker thread"""
+    source_file_path = entry.path
+    codec = compression_codec(options, entry.name)
+    destination_file_path = destination_path(entry, destination_dir, options)
+    source_stat = entry.stat
+
+    def result(status, md5hash=None, error=None, signature=None, bytes_written=None, stored_size=None, location=None):
+        return FileResult(status, source_file_path, destination_file_path, entry.directory, entry.name, record, source_stat, md5hash, error,
+                          signature, bytes_written, codec, stored_size, location)
+
+    def store_in_cas(digest):
+        # Link the job tree entry to the blob, storing the blob first if this content is new
+        ensure_parent_dir(destination_file_path, created_dirs)
+        stored = cas.store_blob(destination_dir, source_file_path, digest, options.copy_engine, options.throttle)
+        cas.link_blob(destination_dir, digest, destination_file_path)
+        return stored
+
+    stat_unchanged = source_stat and stat.S_ISREG(source_stat.st_mode) and is_unchanged(record, source_stat)
+    if stat_unchanged and not options.paranoid:
+        source_md5 = None
+    elif not stat_unchanged and uses_single_pass(options, source_stat, entry.name):
+        # The file has changed or is new: copy it and hash the same bytes instead of reading it twice
+        try:
+            ensure_parent_dir(destination_file_path, created_dirs)
+            source_md5 = copy_and_hash(source_file_path, destination_file_path, options.hash_algorithm, throttle=options.throttle)
+        except Exception as e:
+            return result("failed", None, str(e))
+        return result("unchanged" if record and record[1] == source_md5 else "copied", source_md5)
+    elif uses_pack(options, source_stat, entry.name):
+        # Small file: one read serves both the hash and the append to the pack segment
+        try:
+            data = pack.read_small_file(source_file_path, source_stat.st_size)
+            if options.throttle:
+                options.throttle.read.acquire(len(data))
+            hasher = new_hasher(options.hash_algorithm)
+            hasher.update(data)
+            source_md5 = hasher.hexdigest()
+            if record and record[1] == source_md5:
+                return result("unchanged", source_md5)
+            location = options.pack_writer.append(data)
+        except Exception as e:
+            return result("failed", None, str(e))
+        return result("copied", source_md5, location=location)
+    else:
+        source_md5 = get_md5_hash(source_file_path, options.hash_algorithm, options.hash_mmap, options.hash_cache,
+                                  options.throttle.read if options.throttle else None, options.paranoid)
+        if not source_md5:
+            return result("invalid")
+
+    if record and (source_md5 is None or record[1] == source_md5):
+        if options.store == "cas":
+            try:
+                store_in_cas(record[1])
+            except Exception as e:
+                return result("failed", source_md5, str(e))
+        elif options.store == "snapshot":
+            previous_path = os.path.join(options.previous_snapshot, entry.relative_path) if options.previous_snapshot else None
+            try:
+                ensure_parent_dir(destination_file_path, created_dirs)
+                if snapshot.link_unchanged(previous_path, destination_file_path, source_file_path, source_stat,
+                                           options.copy_engine, options.throttle):
+                    return result("linked", source_md5)
+            except Exception as e:
+                return result("failed", source_md5, str(e))
+        return result("unchanged", source_md5)
+
+    try:
+        if options.store == "cas":
+            status = "copied" if store_in_cas(source_md5) else "deduplicated"
+        elif codec:
+            ensure_parent_dir(destination_file_path, created_dirs)
+            stored_size = compress_file(source_file_path, destination_file_path, codec, throttle=options.throttle)
+            return result("copied", source_md5, stored_size=stored_size)
+        elif uses_delta(options, source_stat, entry.name):
+            ensure_parent_dir(destination_file_path, created_dirs)
+            # The destination only matches the old signature if it still has the previously backed up size
+            if old_signature is not None and (not os.path.isfile(destination_file_path) or os.path.getsize(destination_file_path) != record[2]):
+                old_signature = None
+            signature, bytes_written = delta_copy(source_file_path, destination_file_path, old_signature, throttle=options.throttle)
+            return result("copied", source_md5, signature=signature, bytes_written=bytes_written)
+        else:
+            ensure_parent_dir(destination_file_path, created_dirs)
+            if options.store == "snapshot":
+                snapshot.unlink_existing(destination_file_path)
+            copy_file(source_file_path, destination_file_path, options.copy_engine, options.throttle)
+            status = "copied"
+    except Exception as e:
+        return result("failed", source_md5, str(e))
+    return result(status, source_md5)
+
+def record_file_result(db_name, logger, result, job_id=None, log_db=None):
+    """Write the log lines and catalog rows for one processed file; the only place backup_files writes to the database.
+    Returns the File_id of a file that is now backed up, or None"""
+    file_id = result.record[0] if result.record else None
+    log_db = log_db or db_name
+
+    if result.status == "scan_error":
+        warning_message = f"{datetime.now()} - WARNING - {result.source_file_path} - Skipped due to unreadable source: {result.error}"
+        logger.warning(warning_message)
+        insert_log_entry(log_db, datetime.now(), "WARNING", warning_message, file_id=None, job_id=job_id)
+    elif result.status in ("unchanged", "linked"):
+        action = "NO CHANGE, LINKED TO PREVIOUS SNAPSHOT" if result.status == "linked" else "NO CHANGE, SKIPPING"
+        logger.info(f"{datetime.now()} - INFO - {result.source_file_path} - {action}")
+        if result.md5hash and not is_unchanged(result.record, result.file_stat):
+            update_file_stat(db_name, file_id, result.file_stat)
+        if job_id is not None:
+            journal_path(db_name, job_id, result.source_file_path)
+        return file_id
+    elif result.status == "invalid":
+        warning_message = f"{datetime.now()} - WARNING - {result.source_file_path} - Skipped due to invalid source file"
+        logger.warning(warning_message)
+        insert_log_entry(log_db, datetime.now(), "WARNING", warning_message, file_id=file_id, job_id=job_id)
+    elif result.status == "failed":
+        error_message = f"{datetime.now()} - ERROR - {result.source_file_path} -> {result.destination_file_path} - {result.error}"
+        logger.error(error_message)
+        insert_log_entry(log_db, datetime.now(), "ERROR", error_message, file_id=file_id, job_id=job_id)
+    else:
+        action = "DEDUPLICATED" if result.status == "deduplicated" else "PACKED" if result.pack else "SUCCESSFULLY COPIED"
+        try:
+            logger.info(f"{datetime.now()} - INFO - {result.source_file_path} -> {result.destination_file_path} - {action}")
+            last_backup_datetime = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+            file_id = insert_file_info(db_name, result.directory, result.filename, last_backup_datetime, result.md5hash, result.file_stat,
+                                       result.codec, result.stored_size)
+            if result.signature is not None:
+                save_block_signature(db_name, file_id, result.signature)
+            else:
+                # Any other copy rewrote the destination, so an older signature no longer describes it
+                delete_block_signature(db_name, file_id)
+            if result.pack is not None:
+                insert_pack_entry(db_name, file_id, job_id, result.pack, result.md5hash)
             else:
-                warning_message = f"{datetime.now()} - WARNING - {source_file_path} - Skipped due to invalid source file"
-                logger.warning(warning_message)
-                insert_log_entry(db_name, datetime.now(), "WARNING", warning_message, file_id=file_id, job_id=job_id)
+                # A file that was packed before and is now stored on its own must not be restored from the old pack;
+                # result.record is None for resumed partial copies, so it cannot tell whether there is one
+                delete_pack_entry(db_name, file_id)
+            insert_log_entry(log_db, datetime.now(), "INFO", f"{result.source_file_path} -> {result.destination_file_path} - {action}", file_id=file_id, job_id=job_id)
+            if job_id is not None:
+                # Same transaction as the file row, so a committed journal entry always has its catalog row
+                journal_path(db_name, job_id, result.source_file_path)
+            return file_id
+
+        except Exception as e:
+            error_message = f"{datetime.now()} - ERROR - {result.source_file_path} -> {result.destination_file_path} - {str(e)}"
+            logger.error(error_message)
+            insert_log_entry(log_db, datetime.now(), "ERROR", error_message, file_id=file_id, job_id=job_id)
+
+def backup_files(source_dir, destination_dir, db_name, logger, file_id=None, job_id=None,
+                 hash_algorithm=DEFAULT_ALGORITHM, hash_mmap=False, paranoid=False, workers=1, store="copy",
+                 delta=False, delta_min_size=DELTA_MIN_SIZE, compression=None, copy_engine="auto", single_pass=False, resume=False, paths=None,
+                 hash_cache=None, max_read_bps=None, max_write_bps=None, pack_threshold=0, pack_segment_size=pack.DEFAULT_SEGMENT_SIZE,
+                 path_filter=None):
+    started = datetime.now()
+    job_name = str(job_id) if job_id is not None else started.strftime("%Y%m%d-%H%M%S")
+    totals = {"copied": [0, 0], "deduplicated": [0, 0], "linked": [0, 0], "delta": [0, 0, 0], "compressed": [0, 0, 0], "resumed": [0], "scanned": [0]}
+    timer = time.perf_counter()
+
+    # Logentry rows go through a background writer; leaving the block writes every queued row
+    with open_catalog(db_name, batch_size=DEFAULT_BATCH_SIZE) as catalog, LogSink(catalog) as log_sink:
+        snapshot_dir = previous_snapshot = None
+        if store == "snapshot":
+            snapshot_dir = (resume and snapshot.find_snapshot_dir(destination_dir, job_id)) or snapshot.snapshot_dir(destination_dir, job_id, started)
+            previous_snapshot = get_latest_snapshot(catalog, destination_dir)
+        journal = get_journal(catalog, job_id) if resume and job_id is not None else set()
+        # One budget for all workers, so the limits hold for the job as a whole
+        throttle = Throttle(max_read_bps, max_write_bps)
+        pack_writer = pack.PackWriter(destination_dir, job_name, pack_segment_size, throttle) if pack_threshold and store == "copy" else None
+        options = BackupOptions(hash_algorithm, hash_mmap, paranoid, store, job_name, delta, delta_min_size, compression,
+                                snapshot_dir, previous_snapshot, copy_engine, single_pass, hash_cache, throttle if throttle else None,
+                                pack_threshold, pack_writer)
+        created_dirs = threading.local()
+        # Only a scan of the whole tree describes the job's state; watch batches cover a few paths
+        manifest = ManifestBuilder() if job_id is not None and paths is None else None
+
+        def scan():
+            # Runs on the scanner thread: walk the tree and look up each file's catalog row
+            scan_errors = []
+            onerror = lambda path, error: scan_errors.append((path, error))
+            for entry in walk_source(source_dir, paths, onerror, path_filter):
+                while scan_errors:
+                    path, error = scan_errors.pop(0)
+                    yield FileResult("scan_error", path, None, None, None, None, None, None, str(error)), None, None
+                record = get_file_record(catalog, entry.directory, entry.name)
+                if resume:
+                    state = destination_state(entry, destination_dir, options)
+                    if state == "complete" and entry.path in journal:
+                        totals["resumed"][0] += 1
+                        if manifest is not None and record:
+                            manifest.add(record[0], record[2], record[3], record[1])
+                        continue
+                    if state == "partial" or (state == "missing" and entry.path in journal):
+                        # Interrupted or lost write: ignore the catalog row so the file is copied again in full
+                        record = None
+                old_signature = get_block_signature(catalog, record[0]) if record and uses_delta(options, entry.stat, entry.name) else None
+                yield entry, record, old_signature
+            for path, error in scan_errors:
+                yield FileResult("scan_error", path, None, None, None, None, None, None, str(error)), None, None
+
+        def work(item):
+            entry, record, old_signature = item
+            if isinstance(entry, FileResult):
+                return entry
+            return process_file(entry, record, destination_dir, options, created_dirs, old_signature)
+
+        def emit(result):
+            totals["scanned"][0] += 1
+            if result.status in totals:
+                totals[result.status][0] += 1
+                totals[result.status][1] += result.file_stat.st_size
+            if result.bytes_written is not None:
+                totals["delta"][0] += 1
+                totals["delta"][1] += result.bytes_written
+                totals["delta"][2] += result.file_stat.st_size
+            if result.stored_size is not None:
+                totals["compressed"][0] += 1
+                totals["compressed"][1] += result.file_stat.st_size
+                totals["compressed"][2] += result.stored_size
+            path_id = record_file_result(catalog, logger, result, job_id, log_sink)
+            if manifest is not None and path_id is not None:
+                manifest.add(path_id, result.file_stat.st_size, result.file_stat.st_mtime_ns, result.md5hash or result.record[1])
+
+        try:
+            if not os.path.exists(destination_dir):
+                os.makedirs(destination_dir)
+            if snapshot_dir:
+                os.makedirs(snapshot_dir, exist_ok=True)
+            run_pipeline(scan(), work, emit, workers=workers)
+            if manifest is not None:
+                save_manifest(catalog, job_id, manifest.build())
+            if job_id is not None:
+                clear_journal(catalog, job_id)
+                record_job_stats(catalog, job_id, totals["scanned"][0] + totals["resumed"][0], totals["copied"][0],
+                                 totals["copied"][1], time.perf_counter() - timer)
+            if resume:
+                logger.info(f"{datetime.now()} - INFO - Resumed job {job_id}: {totals['resumed'][0]} files already done were skipped")
+            if snapshot_dir:
+                # Recorded only once the tree is complete, so an interrupted snapshot is never used as a link base
+                insert_snapshot(catalog, job_id, destination_dir, snapshot_dir, started)
+                logger.info(f"{datetime.now()} - INFO - Snapshot {snapshot_dir}: {totals['copied'][0]} files copied ({totals['copied'][1]} bytes), "
+                            f"{totals['linked'][0]} hardlinked to {previous_snapshot} ({totals['linked'][1]} bytes not copied)")
+            if store == "cas":
+                logger.info(f"{datetime.now()} - INFO - CAS store: {totals['copied'][0]} new blobs ({totals['copied'][1]} bytes), "
+                            f"{totals['deduplicated'][0]} deduplicated files ({totals['deduplicated'][1]} bytes not copied)")
+            if delta:
+                logger.info(f"{datetime.now()} - INFO - Delta transfer: {totals['delta'][0]} files, "
+                            f"{totals['delta'][1]} of {totals['delta'][2]} bytes written")
+            if hash_cache is not None:
+                hash_cache.flush()
+                logger.info(f"{datetime.now()} - INFO - Hash cache: {hash_cache.hits} hits, {hash_cache.misses} misses")
+            if compression is not None:
+                logger.info(f"{datetime.now()} - INFO - Compression: {totals['compressed'][0]} files, "
+                            f"{totals['compressed'][1]} bytes stored as {totals['compressed'][2]} bytes")
+            if throttle:
+                logger.info(f"{datetime.now()} - INFO - Throttling: {throttle.read.throttled_seconds:.2f} s waiting for the read budget, "
+                            f"{throttle.write.throttled_seconds:.2f} s for the write budget")
+            if pack_writer is not None:
+                logger.info(f"{datetime.now()} - INFO - Pack: {pack_writer.files} files ({pack_writer.bytes} bytes) "
+                            f"appended to {pack_writer.segments} segments")
+
+        except Exception as e:
+            error_message = f"{datetime.now()} - ERROR - An error occurred: {str(e)}"
+            logger.error(error_message)
+            insert_log_entry(log_sink, datetime.now(), "ERROR", error_message, file_id=file_id, job_id=job_id)
+        finally:
+            if pack_writer is not None:
+                pack_writer.close()
+    flush_queued_logging(logger)
 
+def holds_record(path, record):
+    """A plain copy with the size and mtime of the catalog row, as a single-destination backup leaves it"""
+    try:
+        destination_stat = os.stat(path)
+    except OSError:
+        return False
+    return record[2] is not None and (destination_stat.st_size, destination_stat.st_mtime_ns) == (record[2], record[3])
+
+def fan_out_file(entry, record, targets, destination_dirs, fan_out, hash_algorithm=DEFAULT_ALGORITHM, hash_mmap=False, paranoid=False,
+                 hash_cache=None, throttle=None):
+    """Copy one scanned file to every destination in targets from a single read, without touching the catalog"""
+    source_stat = entry.stat
+
+    def result(status, md5hash=None, error=None):
+        shown = ", ".join(targets.values()) if targets else None
+        return FileResult(status, entry.path, shown, entry.directory, entry.name, record, source_stat, md5hash, error)
+
+    source_md5 = None
+    if source_stat and stat.S_ISREG(source_stat.st_mode) and is_unchanged(record, source_stat):
+        if paranoid:
+            source_md5 = get_md5_hash(entry.path, hash_algorithm, hash_mmap, hash_cache, throttle.read if throttle else None, refresh=True)
+            if not source_md5:
+                return result("invalid")
+            if source_md5 != record[1]:
+                targets = {index: os.path.join(destination_dir, entry.relative_path) for index, destination_dir in enumerate(destination_dirs)}
+        if not targets:
+            return result("unchanged", source_md5)
+    else:
+        # The content may have changed, so every destination gets the version read now
+        targets = {index: os.path.join(destination_dir, entry.relative_path) for index, destination_dir in enumerate(destination_dirs)}
+    try:
+        source_md5 = fan_out.copy(entry.path, targets, (entry.directory, entry.name))
     except Exception as e:
-        error_message = f"{datetime.now()} - ERROR - An error occurred: {str(e)}"
+        return result("failed", None, str(e))
+    return result("unchanged" if record and record[1] == source_md5 else "copied", source_md5)
+
+def record_destination_result(db_name, logger, completion, destination_dir, job_id=None, log_db=None):
+    """Write the destination state, or the error, of one finished copy of a fan-out backup"""
+    log_db = log_db or db_name
+    if completion.error is not None:
+        error_message = f"{datetime.now()} - ERROR - {completion.source_path} -> {completion.destination_path} - {completion.error}"
         logger.error(error_message)
-        insert_log_entry(db_name, datetime.now(), "ERROR", error_message, file_id=file_id, job_id=job_id)
+        insert_log_entry(log_db, datetime.now(), "ERROR", error_message, file_id=None, job_id=job_id)
+        return
+    if completion.deferred:
+        logger.info(f"{datetime.now()} - INFO - {completion.source_path} -> {completion.destination_path} - COPIED AFTER FALLING BEHIND")
+    directory, filename = completion.key
+    save_destination_file(db_name, destination_dir, directory, filename, completion.digest, job_id)
+
+def fan_out_files(source_dir, destination_dirs, db_name, logger, file_id=None, job_id=None, hash_algorithm=DEFAULT_ALGORITHM,
+                  hash_mmap=False, paranoid=False, workers=1, resume=False, paths=None, hash_cache=None, max_read_bps=None,
+                  max_write_bps=None, path_filter=None, max_lag=DEFAULT_MAX_LAG):
+    """Back up source_dir to several plain-copy destinations, reading each changed file once for all of them.
+    DestinationFile rows are committed per copy, so a later run, or a resumed one, only copies what each destination lacks"""
+    destinations = [os.path.abspath(destination_dir) for destination_dir in destination_dirs]
+    totals = {"copied": [0, 0], "scanned": [0]}
+    timer = time.perf_counter()
+
+    with open_catalog(db_name, batch_size=DEFAULT_BATCH_SIZE) as catalog, LogSink(catalog) as log_sink:
+        throttle = Throttle(max_read_bps, max_write_bps)
+        manifest = ManifestBuilder() if job_id is not None and paths is None else None
+        fan_out = None
+
+        def scan():
+            # Runs on the scanner thread: look up each file's catalog row and which destinations lack that version
+            scan_errors = []
+            for entry in walk_source(source_dir, paths, lambda path, error: scan_errors.append((path, error)), path_filter):
+                while scan_errors:
+                    path, error = scan_errors.pop(0)
+                    yield FileResult("scan_error", path, None, None, None, None, None, None, str(error)), None, None, None
+                record = get_file_record(catalog, entry.directory, entry.name)
+                stored = get_destination_hashes(catalog, entry.directory, entry.name) if record else {}
+                targets, adopted = {}, []
+                for index, destination_dir in enumerate(destinations):
+                    path = os.path.join(destination_dir, entry.relative_path)
+                    if record and stored.get(destination_dir) == record[1]:
+                        continue
+                    if record and destination_dir not in stored and holds_record(path, record):
+                        # Copied by a single-destination backup, which keeps no per-destination rows
+                        adopted.append(index)
+                        continue
+                    targets[index] = path
+                yield entry, record, targets, adopted
+            for path, error in scan_errors:
+                yield FileResult("scan_error", path, None, None, None, None, None, None, str(error)), None, None, None
+
+        def work(item):
+            entry, record, targets, adopted = item
+            if isinstance(entry, FileResult):
+                return entry, ()
+            return fan_out_file(entry, record, targets, destinations, fan_out, hash_algorithm, hash_mmap, paranoid, hash_cache,
+                                throttle if throttle else None), adopted
+
+        def record_completions():
+            for completion in fan_out.completed():
+                record_destination_result(catalog, logger, completion, destinations[completion.destination], job_id, log_sink)
+
+        def emit(item):
+            result, adopted = item
+            totals["scanned"][0] += 1
+            if result.status == "copied":
+                totals["copied"][0] += 1
+                totals["copied"][1] += result.file_stat.st_size
+            path_id = record_file_result(catalog, logger, result, job_id, log_sink)
+            if manifest is not None and path_id is not None:
+                manifest.add(path_id, result.file_stat.st_size, result.file_stat.st_mtime_ns, result.md5hash or result.record[1])
+            for index in adopted:
+                save_destination_file(catalog, destinations[index], result.directory, result.filename, result.record[1], job_id)
+            record_completions()
+
+        try:
+            for destination_dir in destinations:
+                os.makedirs(destination_dir, exist_ok=True)
+            fan_out = FanOut(len(destinations), hash_algorithm, max_lag, throttle if throttle else None)
+            run_pipeline(scan(), work, emit, workers=workers)
+            # Waits for the slowest destination, including the files it fell too far behind on
+            fan_out.close()
+            record_completions()
+            if manifest is not None:
+                save_manifest(catalog, job_id, manifest.build())
+            if job_id is not None:
+                clear_journal(catalog, job_id)
+                record_job_stats(catalog, job_id, totals["scanned"][0], totals["copied"][0], totals["copied"][1], time.perf_counter() - timer)
+            for index, destination_dir in enumerate(destinations):
+                files, written, errors, caught_up = fan_out.stats(index)
+                logger.info(f"{datetime.now()} - INFO - Destination {destination_dir}: {files} files written ({written} bytes), "
+                            f"{errors} failed, {caught_up} copied after falling behind")
+            if hash_cache is not None:
+                hash_cache.flush()
+                logger.info(f"{datetime.now()} - INFO - Hash cache: {hash_cache.hits} hits, {hash_cache.misses} misses")
+            if throttle:
+                logger.info(f"{datetime.now()} - INFO - Throttling: {throttle.read.throttled_seconds:.2f} s waiting for the read budget, "
+                            f"{throttle.write.throttled_seconds:.2f} s for the write budget")
+
+        except Exception as e:
+            error_message = f"{datetime.now()} - ERROR - An error occurred: {str(e)}"
+            logger.error(error_message)
+            insert_log_entry(log_sink, datetime.now(), "ERROR", error_message, file_id=file_id, job_id=job_id)
+        finally:
+            if fan_out is not None:
+                fan_out.close()
+                record_completions()
+    flush_queued_logging(logger)
+
+def watch_files(source_dir, destination_dir, db_name, logger, job_id=None, debounce=DEFAULT_DEBOUNCE, backup=backup_files, **backup_options):
+    """Back up the whole tree once, then only the paths inotify reports as changed, until interrupted"""
+    resume = backup_options.pop("resume", False)
+    path_filter = backup_options.get("path_filter")
+    def watch_failed(path, error):
+        logger.warning(f"{datetime.now()} - WARNING - {path} - Cannot watch for changes: {error}")
+
+    with TreeWatcher(source_dir, path_filter.excluded if path_filter else None, watch_failed) as watcher:
+        # The watches exist before the initial scan, so changes made during it are picked up afterwards
+        backup(source_dir, destination_dir, db_name, logger, job_id=job_id, resume=resume, **backup_options)
+        logger.info(f"{datetime.now()} - INFO - Watching {source_dir} for changes")
+        for batch in watcher.batches(debounce):
+            if batch.full_rescan:
+                logger.warning(f"{datetime.now()} - WARNING - Change events were lost, rescanning {source_dir}")
+                backup(source_dir, destination_dir, db_name, logger, job_id=job_id, **backup_options)
+            else:
+                logger.info(f"{datetime.now()} - INFO - {len(batch.paths)} changed paths")
+                backup(source_dir, destination_dir, db_name, logger, job_id=job_id, paths=batch.paths, **backup_options)
+
+def plan_backup(source_dir, db_name, logger, json_path=None, path_filter=None):
+    """Dry run: walk source_dir and compare stats with the catalog, without hashing or copying, and estimate the duration"""
+    started = time.perf_counter()
+    plan = {"files": 0, "new": 0, "changed": 0, "unchanged": 0, "unreadable": 0, "bytes_total": 0, "bytes_to_copy": 0}
+    scan_errors = []
+    with open_catalog(db_name) as catalog:
+        for entry in scan_tree(source_dir, lambda path, error: scan_errors.append(path), path_filter.excluded if path_filter else None):
+            plan["files"] += 1
+            if entry.stat is None:
+                plan["unreadable"] += 1
+                continue
+            plan["bytes_total"] += entry.stat.st_size
+            record = get_file_record(catalog, entry.directory, entry.name)
+            if is_unchanged(record, entry.stat):
+                plan["unchanged"] += 1
+                continue
+            # A stat change may turn out to be the same content once hashed, so these are upper bounds
+            plan["new" if record is None else "changed"] += 1
+            plan["bytes_to_copy"] += entry.stat.st_size
+        throughput = get_recent_throughput(catalog)
+    plan["unreadable"] += len(scan_errors)
+    plan["scan_seconds"] = round(time.perf_counter() - started, 3)
+    plan["throughput_bps"] = round(throughput) if throughput else None
+    plan["estimated_seconds"] = round(plan["scan_seconds"] + plan["bytes_to_copy"] / throughput, 1) if throughput else None
+
+    if plan["estimated_seconds"] is not None:
+        estimate = f"estimated {plan['estimated_seconds']} s at {throughput / (1024 * 1024):.1f} MiB/s from recent jobs"
+    else:
+        estimate = "no duration estimate until a job has copied data with this catalog"
+    logger.info(f"Plan for {source_dir}: {plan['files']} files, {plan['new'] + plan['changed']} to copy "
+                f"({plan['new']} new, {plan['changed']} changed, {plan['bytes_to_copy']} of {plan['bytes_total']} bytes), "
+                f"{plan['unchanged']} unchanged, {plan['unreadable']} unreadable; {estimate}")
+    if json_path == "-":
+        print(json.dumps(plan, indent=2))
+    elif json_path:
+        with open(json_path, "w") as f:
+            json.dump(plan, f, indent=2)
+    return plan
+
+"""Restore"""
+RestoreItem = namedtuple("RestoreItem", "relative_path backup_path codec expected pack mtime_ns", defaults=(None, None))
+RestoreResult = namedtuple("RestoreResult", "item status digest size error", defaults=(None, 0, None))
+
+def get_restore_items(db_name, source_dir, destination_dir, store="copy", restore_job=None):
+    """Yield what to restore: the latest version of every catalogued file under source_dir, or the tree of one job"""
+    with open_catalog(db_name) as catalog:
+        if restore_job is None:
+            if store == "snapshot":
+                snapshot_base = get_latest_snapshot(catalog, destination_dir)
+                if snapshot_base is None:
+                    raise ValueError(f"No snapshot found in {destination_dir}")
+            # Directories are catalogued as given on the command line, so only the trailing separator is dropped
+            source_dir = source_dir.rstrip(os.sep) or os.sep
+            prefix = source_dir if source_dir.endswith(os.sep) else source_dir + os.sep
+            # LIKE ignores ASCII case, which would pull in a sibling such as /data/SRC for /data/src
+            rows = catalog.fetchall('''
+                SELECT Directory, Filename, file.Md5hash, Codec, Mtime_ns, Segment, Offset, Length
+                FROM file LEFT JOIN PackEntry ON PackEntry.File_id = file.File_id
+                WHERE Directory = ? OR substr(Directory, 1, ?) = ?
+                ORDER BY Directory, Filename
+            ''', (source_dir, len(prefix), prefix))
+            for directory, filename, md5hash, codec, mtime_ns, segment, offset, length in rows:
+                relative_path = os.path.relpath(os.path.join(directory, filename), source_dir)
+                if os.path.isabs(relative_path) or relative_path.split(os.sep)[0] == os.pardir:
+                    raise ValueError(f"Catalog entry {os.path.join(directory, filename)} lies outside {source_dir}")
+                if store == "copy" and segment is not None:
+                    location = pack.PackLocation(segment, offset, length)
+                    yield RestoreItem(relative_path, os.path.join(destination_dir, segment), None, (md5hash,), location, mtime_ns)
+                    continue
+                if store == "cas":
+                    backup_path = cas.blob_path(destination_dir, md5hash)
+                elif store == "snapshot":
+                    backup_path = os.path.join(snapshot_base, relative_path)
+                else:
+                    backup_path = os.path.join(destination_dir, relative_path) + (CODEC_SUFFIXES[codec] if codec else "")
+                yield RestoreItem(relative_path, backup_path, codec, (md5hash,))
+            return
+
+        if store == "cas":
+            tree = cas.job_tree_dir(destination_dir, str(restore_job))
+        elif store == "snapshot":
+            row = catalog.fetchone('SELECT Path FROM Snapshot WHERE Job_id = ?', (restore_job,))
+            tree = row[0] if row else None
+        else:
+            raise ValueError("The copy store keeps only the latest version of each file; restore a job from a cas or snapshot store")
+        if not tree or not os.path.isdir(tree):
+            raise ValueError(f"No backup tree found for job {restore_job} in {destination_dir}")
+        for entry in scan_tree(tree):
+            relative_dir = os.path.dirname(entry.relative_path)
+            directory = os.path.join(source_dir, relative_dir) if relative_dir else source_dir
+            # The job may hold an older version of the file, so every hash in its history is accepted
+            hashes = [row[0] for row in catalog.fetchall('''
+                SELECT Md5hash FROM file WHERE Directory = ? AND Filename = ?
+                UNION
+                SELECT FileVersion.Md5hash FROM FileVersion JOIN file ON FileVersion.File_id = file.File_id
+                WHERE file.Directory = ? AND file.Filename = ?
+            ''', (directory, entry.name, directory, entry.name))]
+            yield RestoreItem(entry.relative_path, entry.path, None, tuple(hashes))
+
+def restore_one(item, target_dir):
+    """Restore and verify one file without touching the catalog, so it can run on a worker thread"""
+    if not os.path.isfile(item.backup_path):
+        return RestoreResult(item, "missing")
+    algorithm = algorithm_for_digest(item.expected[0]) if item.expected else DEFAULT_ALGORITHM
+    try:
+        target_path = os.path.join(target_dir, item.relative_path)
+        if item.pack is not None:
+            digest, size = restore_packed(item.backup_path, item.pack.offset, item.pack.length, target_path, algorithm, item.mtime_ns)
+        else:
+            digest, size = restore_file(item.backup_path, target_path, item.codec, algorithm)
+    except Exception as e:
+        return RestoreResult(item, "failed", error=str(e))
+    return RestoreResult(item, "restored" if digest in item.expected else "mismatch", digest, size)
+
+def verify_one(item, limiter=None):
+    """Re-hash one backed up file within the I/O budget, so it can run on a worker thread"""
+    if not os.path.isfile(item.backup_path):
+        return RestoreResult(item, "missing")
+    algorithm = algorithm_for_digest(item.expected[0]) if item.expected else DEFAULT_ALGORITHM
+    try:
+        if item.pack is not None:
+            digest, size = hash_packed(item.backup_path, item.pack.offset, item.pack.length, algorithm, limiter)
+        else:
+            digest, size = hash_backup_file(item.backup_path, item.codec, algorithm, limiter)
+    except Exception as e:
+        return RestoreResult(item, "failed", error=str(e))
+    return RestoreResult(item, "verified" if digest in item.expected else "mismatch", digest, size)
+
+def check_backup_items(source_dir, destination_dir, db_name, logger, work, ok_status, title, store="copy", restore_job=None, job_id=None,
+                       workers=1, target_dir=None, limiter=None):
+    """Run work() over the restore items on a worker pool and log every file that is not ok_status as an ERROR"""
+    totals = {ok_status: 0, "mismatch": 0, "missing": 0, "failed": 0, "bytes": 0}
+    started = time.perf_counter()
+
+    with open_catalog(db_name, batch_size=DEFAULT_BATCH_SIZE) as catalog, LogSink(catalog) as log_sink:
+        def emit(result):
+            item = result.item
+            location = f"{item.backup_path} -> {os.path.join(target_dir, item.relative_path)}" if target_dir else item.backup_path
+            totals[result.status] += 1
+            totals["bytes"] += result.size
+            if result.status == ok_status:
+                logger.info(f"{datetime.now()} - INFO - {location} - {ok_status.upper()}")
+                return
+            if result.status == "mismatch":
+                expected = ", ".join(item.expected) or "no catalog entry"
+                error_message = f"{datetime.now()} - ERROR - {location} - HASH MISMATCH: {result.digest}, expected {expected}"
+            elif result.status == "missing":
+                error_message = f"{datetime.now()} - ERROR - {location} - Backup file is missing"
+            else:
+                error_message = f"{datetime.now()} - ERROR - {location} - {result.error}"
+            logger.error(error_message)
+            insert_log_entry(log_sink, datetime.now(), "ERROR", error_message, job_id=job_id)
+
+        try:
+            items = get_restore_items(catalog, source_dir, destination_dir, store, restore_job)
+            run_pipeline(items, work, emit, workers=workers)
+            elapsed = max(time.perf_counter() - started, 1e-9)
+            files = totals[ok_status] + totals["mismatch"]
+            message = (f"{title}: {files} files, {totals['bytes']} bytes in {elapsed:.2f} s "
+                       f"({totals['bytes'] / elapsed / (1024 * 1024):.1f} MiB/s, {files / elapsed:.0f} files/s), "
+                       f"{totals['mismatch']} mismatches, {totals['missing']} missing, {totals['failed']} failed")
+            if limiter:
+                message += f", {limiter.throttled_seconds:.2f} s throttled"
+            logger.info(f"{datetime.now()} - INFO - {message}")
+            insert_log_entry(log_sink, datetime.now(), "INFO", message, job_id=job_id)
+        except Exception as e:
+            error_message = f"{datetime.now()} - ERROR - An error occurred: {str(e)}"
+            logger.error(error_message)
+            insert_log_entry(log_sink, datetime.now(), "ERROR", error_message, job_id=job_id)
+    flush_queued_logging(logger)
+    return totals
+
+def restore_files(source_dir, destination_dir, target_dir, db_name, logger, store="copy", restore_job=None, job_id=None, workers=1):
+    """Restore the backup of source_dir from destination_dir into target_dir, verifying every file against the catalog"""
+    return check_backup_items(source_dir, destination_dir, db_name, logger, lambda item: restore_one(item, target_dir), "restored", "Restore",
+                              store, restore_job, job_id, workers, target_dir=target_dir)
+
+def verify_files(source_dir, destination_dir, db_name, logger, store="copy", restore_job=None, job_id=None, workers=1,
+                 max_read_bps=None, max_iops=None):
+    """Scrub the backup of source_dir in destination_dir: re-hash every file within the I/O budget and compare with the catalog"""
+    limiter = IOLimiter(max_read_bps, max_iops)
+    return check_backup_items(source_dir, destination_dir, db_name, logger, lambda item: verify_one(item, limiter), "verified", "Verify",
+                              store, restore_job, job_id, workers, limiter=limiter)
 
 """Query/Display information"""
 def query_files(db_name, directory, logger):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('SELECT Filename FROM file WHERE Directory = ?', (directory,))
-    files = cursor.fetchall()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        files = catalog.fetchall('SELECT Filename FROM file WHERE Directory = ?', (directory,))
 
     if files:
         logger.info(f"Files in directory '{directory}': {', '.join(file[0] for file in files)}")
@@ -205,9 +929,6 @@ def query_files(db_name, directory, logger):
         logger.info(f"No files found in directory '{directory}'")
 
 def query_logs(db_name, directory, filename, date, logger):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
     query = 'SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message FROM Logentry JOIN file ON Logentry.file_id = file.File_id WHERE file.Filename = ? AND file.Directory = ?'
     parameters = [directory, filename]
 
@@ -215,9 +936,8 @@ def query_logs(db_name, directory, filename, date, logger):
         query += ' AND Logentry.entry_datetime >= ?'
         parameters.append(date)
 
-    cursor.execute(query, parameters)
-    logs = cursor.fetchall()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        logs = catalog.fetchall(query, parameters)
 
     if logs:
         logger.info(f"Logs for file '{filename}' in directory '{directory}':")
@@ -227,9 +947,6 @@ def query_logs(db_name, directory, filename, date, logger):
         logger.info(f"No logs found for file '{filename}' in directory '{directory}'")
 
 def query_all_logs(db_name, directory, date, logger):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    
     query = 'SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message FROM Logentry JOIN file ON Logentry.file_id = file.File_id WHERE file.Directory = ?'
     parameters = [directory]
 
@@ -237,9 +954,8 @@ def query_all_logs(db_name, directory, date, logger):
         query += ' AND Logentry.entry_datetime >= ?'
         parameters.append(date)
 
-    cursor.execute(query, parameters)
-    logs = cursor.fetchall()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        logs = catalog.fetchall(query, parameters)
 
     if logs:
         logger.info(f"All logs for files in directory '{directory}':")
@@ -250,30 +966,27 @@ def query_all_logs(db_name, directory, date, logger):
     
 """Display"""
 def display_backup_job_info(db_name, job_id, logger):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM BackupJob WHERE Job_id = ?', (job_id,))
-    job_info = cursor.fetchone()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        job_info = catalog.fetchone('SELECT * FROM BackupJob WHERE Job_id = ?', (job_id,))
+        snapshot_row = catalog.fetchone('SELECT Path FROM Snapshot WHERE Job_id = ?', (job_id,))
 
     if job_info:
         logger.info(f"Backup Job Information:")
         logger.info(f"Job ID: {job_info[0]}")
         logger.info(f"Commandline: {job_info[1]}")
         logger.info(f"Execution Datetime: {job_info[2]}")
+        if snapshot_row:
+            logger.info(f"Snapshot: {snapshot_row[0]}")
     else:
         logger.info(f"No information found for Job ID: {job_id}")
 
 def display_job_logs(db_name, job_id, logger):
-    conn = sqlite3.connect(db_name)
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message
-        FROM Logentry
-        WHERE job_id = ?
-    ''', (job_id,))
-    logs = cursor.fetchall()
-    conn.close()
+    with open_catalog(db_name) as catalog:
+        logs = catalog.fetchall('''
+            SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message
+            FROM Logentry
+            WHERE job_id = ?
+        ''', (job_id,))
 
     if logs:
         logger.info(f"Logs for Backup Job ID {job_id}:")
@@ -282,14 +995,73 @@ def display_job_logs(db_name, job_id, logger):
     else:
         logger.info(f"No logs found for Backup Job ID: {job_id}")
 
+def diff_jobs(db_name, job_a, job_b, logger):
+    """Log the files added, changed and removed between the manifests of two jobs"""
+    with open_catalog(db_name) as catalog:
+        manifests = [get_manifest(catalog, job_a), get_manifest(catalog, job_b)]
+        for job, loaded in zip((job_a, job_b), manifests):
+            if loaded is None:
+                logger.info(f"No manifest found for Backup Job ID: {job}")
+                return None
+        diff = diff_manifests(*manifests)
+        logger.info(f"Changes from Backup Job ID {job_a} to {job_b}: {len(diff.added)} added, {len(diff.changed)} changed, {len(diff.removed)} removed")
+        for label, ids in (("ADDED", diff.added), ("CHANGED", diff.changed), ("REMOVED", diff.removed)):
+            # Only the differing ids are resolved to paths, in batches that stay below SQLite's variable limit
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500].tolist()
+                rows = catalog.fetchall(f'SELECT Directory, Filename FROM file WHERE File_id IN ({", ".join("?" * len(batch))}) ORDER BY Directory, Filename', batch)
+                for directory, filename in rows:
+                    logger.info(f"{label} - {os.path.join(directory, filename)}")
+    return diff
+
 """CLI + Execution"""
 def main():
     parser = argparse.ArgumentParser(description="Backup tool with database")
     parser.add_argument("-s", "--source", required=True, help="Source directory")
-    parser.add_argument("-d", "--destination", required=True, help="Destination directory")
+    parser.add_argument("-d", "--destination", required=True, nargs="+",
+                        help="Destination directory; with several, each changed file is read once and written to all of them concurrently")
     parser.add_argument("-l", "--log", help="Log filename")
     parser.add_argument("-v", "--verbose", action="store_true", help="Verbose mode (log successful copies)")
     parser.add_argument("-db", "--database", help="Path to the database file")
+    parser.add_argument("--hash-algorithm", choices=SUPPORTED_ALGORITHMS, default=DEFAULT_ALGORITHM, help="Hash algorithm used for change detection")
+    parser.add_argument("--hash-mmap", action="store_true", help="Hash large files through mmap instead of buffered reads")
+    parser.add_argument("--store", choices=STORE_MODES, default="copy",
+                        help="Destination layout: plain copy, content-addressable store with per-job hardlink trees, or dated snapshots hardlinked to the previous one")
+    parser.add_argument("--delta", action="store_true", help="Rewrite only changed blocks of large modified files (copy store only)")
+    parser.add_argument("--delta-min-size", type=int, default=DELTA_MIN_SIZE, help="Minimum file size in bytes for delta transfer")
+    parser.add_argument("--compress", choices=CODECS, help="Compress copied files with this codec (copy store only)")
+    parser.add_argument("--compress-ext", action="append", default=[], metavar="EXT=CODEC",
+                        help="Per-extension codec override, e.g. .log=lzma or .csv=none (repeatable, copy store only)")
+    parser.add_argument("--copy-engine", choices=ENGINES, default="auto",
+                        help="How file data is copied: copy_file_range, sendfile or buffered reads; auto tries them in that order")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="Hash changed files while copying them to a temporary file that is renamed into place, reading each file once")
+    parser.add_argument("--resume", type=int, metavar="JOB_ID", help="Resume an interrupted backup job, skipping files it already finished")
+    parser.add_argument("--watch", action="store_true", help="Keep running and back up files as inotify reports changes (Linux only)")
+    parser.add_argument("--debounce", type=float, default=DEFAULT_DEBOUNCE, help="Seconds without changes before a watch batch is backed up")
+    parser.add_argument("--hash-cache", metavar="PATH", help="Shared hash cache database, reusable across catalogs and concurrent jobs")
+    parser.add_argument("--hash-cache-size", type=int, default=DEFAULT_MAX_ENTRIES, help="Maximum number of hash cache entries kept (least recently used are evicted)")
+    parser.add_argument("--restore", metavar="TARGET_DIR", help="Restore the backup of --source from --destination into TARGET_DIR and verify every file")
+    parser.add_argument("--restore-job", type=int, metavar="JOB_ID", help="With --restore or --verify, use the tree of this job (cas and snapshot stores)")
+    parser.add_argument("--verify", action="store_true", help="Re-hash the backup of --source in --destination and log mismatches with the catalog")
+    parser.add_argument("--max-read-bps", type=int, help="Read budget in bytes per second for backups and --verify")
+    parser.add_argument("--max-write-bps", type=int, help="Write budget in bytes per second for backups")
+    parser.add_argument("--max-iops", type=int, help="Read operations per second budget for --verify")
+    parser.add_argument("--exclude", dest="filter_rules", action="append", type=lambda pattern: (EXCLUDE, pattern), metavar="PATTERN",
+                        help="Skip files and directories matching this glob (repeatable; the first matching --include/--exclude wins)")
+    parser.add_argument("--include", dest="filter_rules", action="append", type=lambda pattern: (INCLUDE, pattern), metavar="PATTERN",
+                        help="Back up paths matching this glob even if a later --exclude matches them (repeatable)")
+    parser.add_argument("--ignore-file", help="File of .gitignore-style exclude rules, applied after --include/--exclude")
+    parser.add_argument("--pack-threshold", type=int, default=0,
+                        help="Append files smaller than this many bytes to pack segments instead of copying them one by one (copy store only)")
+    parser.add_argument("--pack-segment-size", type=int, default=pack.DEFAULT_SEGMENT_SIZE, help="Size in bytes at which a new pack segment is started")
+    parser.add_argument("--max-lag", type=int, default=DEFAULT_MAX_LAG,
+                        help="With several destinations, bytes a destination may fall behind the fastest one before it copies a file on its own after the scan")
+    parser.add_argument("--nice", type=int, help="Run with this CPU niceness (os.setpriority), e.g. 19 for the lowest priority")
+    parser.add_argument("--ionice", help="Run with this Linux I/O priority: idle, best-effort[:0-7] or realtime[:0-7]")
+    parser.add_argument("--workers", type=int, default=1, help="Number of parallel hash/copy worker threads")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Number of database writes grouped into one transaction")
+    parser.add_argument("--paranoid", action="store_true", help="Hash every file even when its size, mtime, inode and device are unchanged")
 
     parser.add_argument("-q1", "--query-files", help="Query files in a certain directory")
     parser.add_argument("-q2", "--query-logs", nargs=2, metavar=('directory', 'filename'), help="Query logs related to a certain file")
@@ -297,11 +1069,15 @@ def main():
     parser.add_argument("-dt", "--date", help="Filter logs by date")
     parser.add_argument("--display-job-info", type=int, help="Display information for a specific backup job")
     parser.add_argument("--display-job-logs", type=int, help="Display log entries for a specific backup job")
+    parser.add_argument("--plan", action="store_true", help="Dry run: report the files and bytes a backup would copy and estimate its duration")
+    parser.add_argument("--plan-json", metavar="PATH", help="With --plan, also write the plan as JSON to PATH, or to stdout for -")
+    parser.add_argument("--diff", type=int, nargs=2, metavar=("JOB_A", "JOB_B"), help="List the files added, changed and removed between two backup jobs")
 
     args = parser.parse_args()
 
     source_dir = args.source
-    destination_dir = args.destination
+    destination_dirs = args.destination
+    destination_dir = destination_dirs[0]
 
     log_filename = args.log
     verbose = args.verbose
@@ -313,37 +1089,113 @@ def main():
     else:
         logger = setup_logger("backup.log", verbose, db_name)
 
-    create_database(db_name)
-    create_notes_table(db_name)
-    create_logentry_table(db_name)
-    create_backup_job_table(db_name)
-    logger.info(f"{datetime.now()} - INFO - Backup job started")
+    compression = None
+    if args.compress or args.compress_ext:
+        try:
+            compression = parse_policy(args.compress, args.compress_ext)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.store != "copy":
+            parser.error("--compress and --compress-ext only apply to --store copy")
 
-    file_id = None
-    job_id = insert_backup_job(db_name, ' '.join(sys.argv), datetime.now())
-    
-    if args.display_job_info:
-        display_backup_job_info(db_name, args.display_job_info, logger)
-    elif args.display_job_logs:
-        display_job_logs(db_name, args.display_job_logs, logger)
-    else:
-        backup_files(source_dir, destination_dir, db_name, logger, file_id=file_id, job_id=job_id)
+    try:
+        path_filter = compile_filter(args.filter_rules, args.ignore_file)
+    except (OSError, ValueError) as e:
+        parser.error(f"Invalid filter rules: {e}")
 
-    if args.query_files:
-        query_files(db_name, args.query_files, logger)
-    
-    elif args.query_logs:
-        directory, filename = args.query_logs
-        query_logs(db_name, filename, directory, args.date, logger)
-    
-    elif args.query_all_logs:
-        query_all_logs(db_name, args.query_all_logs, args.date, logger)
-    
-    else:
-        backup_files(source_dir, destination_dir, db_name, logger, file_id=file_id)
+    if args.ionice:
+        try:
+            parse_ioprio(args.ionice)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.pack_threshold and args.store != "copy":
+        parser.error("--pack-threshold only applies to --store copy")
+
+    if args.watch and args.store == "snapshot":
+        parser.error("--watch cannot be combined with --store snapshot, whose trees must be complete")
+
+    if len(destination_dirs) > 1:
+        if args.restore:
+            parser.error("--restore reads from a single --destination")
+        if args.store != "copy" or args.delta or compression is not None or args.pack_threshold:
+            parser.error("Several destinations are only supported with --store copy, without --delta, --compress or --pack-threshold")
+
+    # Turn SIGTERM into SystemExit so the finally block below flushes queued log rows and commits
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(128 + signum))
+    if args.nice is not None or args.ionice:
+        # Set before any worker thread starts, since threads inherit the priority of their creator
+        try:
+            set_priority(args.nice, args.ionice)
+        except OSError as e:
+            logger.warning(f"{datetime.now()} - WARNING - Could not lower the process priority: {e}")
+    catalog = Catalog(db_name, batch_size=args.batch_size)
+    hash_cache = HashCache(args.hash_cache, args.hash_cache_size) if args.hash_cache else None
+    try:
+        migrations.migrate(catalog)
+        logger.info(f"{datetime.now()} - INFO - Backup job started")
+
+        file_id = None
+        if args.resume:
+            if not catalog.fetchone('SELECT 1 FROM BackupJob WHERE Job_id = ?', (args.resume,)):
+                parser.error(f"No backup job with Job_id {args.resume} to resume")
+            job_id = args.resume
+            logger.info(f"{datetime.now()} - INFO - Resuming backup job {job_id}")
+        else:
+            job_id = insert_backup_job(catalog, ' '.join(sys.argv), datetime.now())
+
+        if args.display_job_info:
+            display_backup_job_info(catalog, args.display_job_info, logger)
+        elif args.display_job_logs:
+            display_job_logs(catalog, args.display_job_logs, logger)
+        elif args.plan:
+            plan_backup(source_dir, catalog, logger, args.plan_json, path_filter)
+        elif args.diff:
+            diff_jobs(catalog, args.diff[0], args.diff[1], logger)
+        elif args.verify:
+            for destination_dir in destination_dirs:
+                verify_files(source_dir, destination_dir, catalog, logger, store=args.store, restore_job=args.restore_job, job_id=job_id,
+                             workers=args.workers, max_read_bps=args.max_read_bps, max_iops=args.max_iops)
+        elif len(destination_dirs) > 1:
+            fan_out_options = dict(hash_algorithm=args.hash_algorithm, hash_mmap=args.hash_mmap, paranoid=args.paranoid, workers=args.workers,
+                                   resume=bool(args.resume), hash_cache=hash_cache, max_read_bps=args.max_read_bps,
+                                   max_write_bps=args.max_write_bps, path_filter=path_filter, max_lag=args.max_lag)
+            if args.watch:
+                watch_files(source_dir, destination_dirs, catalog, logger, job_id=job_id, debounce=args.debounce, backup=fan_out_files,
+                            **fan_out_options)
+            else:
+                fan_out_files(source_dir, destination_dirs, catalog, logger, file_id=file_id, job_id=job_id, **fan_out_options)
+        elif args.restore:
+            restore_files(source_dir, destination_dir, args.restore, catalog, logger, store=args.store, restore_job=args.restore_job,
+                          job_id=job_id, workers=args.workers)
+        else:
+            backup_options = dict(hash_algorithm=args.hash_algorithm, hash_mmap=args.hash_mmap, paranoid=args.paranoid, workers=args.workers, store=args.store,
+                                  delta=args.delta, delta_min_size=args.delta_min_size, compression=compression,
+                                  copy_engine=args.copy_engine, single_pass=args.single_pass, resume=bool(args.resume),
+                                  hash_cache=hash_cache, max_read_bps=args.max_read_bps, max_write_bps=args.max_write_bps,
+                                  pack_threshold=args.pack_threshold, pack_segment_size=args.pack_segment_size, path_filter=path_filter)
+            if args.watch:
+                watch_files(source_dir, destination_dir, catalog, logger, job_id=job_id, debounce=args.debounce, **backup_options)
+            else:
+                backup_files(source_dir, destination_dir, catalog, logger, file_id=file_id, job_id=job_id, **backup_options)
+
+        if args.query_files:
+            query_files(catalog, args.query_files, logger)
+
+        elif args.query_logs:
+            directory, filename = args.query_logs
+            query_logs(catalog, filename, directory, args.date, logger)
+
+        elif args.query_all_logs:
+            query_all_logs(catalog, args.query_all_logs, args.date, logger)
 
-    logger.info(f"{datetime.now()} - INFO - Backup job finished")
-    insert_log_entry(db_name, datetime.now(), 'INFO', "Backup job finished", file_id=file_id)
+        logger.info(f"{datetime.now()} - INFO - Backup job finished")
+        insert_log_entry(catalog, datetime.now(), 'INFO', "Backup job finished", file_id=file_id)
+    finally:
+        if hash_cache is not None:
+            hash_cache.close()
+            logger.info(f"{datetime.now()} - INFO - Hash cache: {hash_cache.evicted} least recently used entries evicted")
+        catalog.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,89 @@
+"""
+bench_copy.py: Throughput of the copy engines on same-filesystem and cross-filesystem copies
+
+Copies one file with shutil.copy2 and with each engine of copier.copy_file, both into the directory
+of the source (same filesystem) and into --other-dir (ideally on a different filesystem, e.g. a tmpfs
+or another disk). Destinations are fsynced inside the timed section so page-cache writeback counts.
+
+Usage:
+    python3 benchmarks/bench_copy.py --size 512 --source-dir /data/tmp --other-dir /dev/shm
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from copier import available_engines, copy_file
+
+ENGINES = ("shutil.copy2", "copy_file_range", "sendfile", "buffered")
+
+
+def copy_with(engine, source, destination):
+    if engine == "shutil.copy2":
+        shutil.copy2(source, destination)
+        return engine
+    return copy_file(source, destination, engine)
+
+
+def timed_copy(engine, source, destination, repeat):
+    best = None
+    used = engine
+    for _ in range(repeat):
+        start = time.perf_counter()
+        used = copy_with(engine, source, destination)
+        fd = os.open(destination, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        os.remove(destination)
+    return best, used
+
+
+def same_device(first, second):
+    return os.stat(first).st_dev == os.stat(second).st_dev
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy engine throughput benchmark")
+    parser.add_argument("--size", type=int, default=256, help="File size in MiB")
+    parser.add_argument("--source-dir", default=None, help="Directory for the source file (default: system temp dir)")
+    parser.add_argument("--other-dir", default="/dev/shm" if os.path.isdir("/dev/shm") else None,
+                        help="Destination directory for the cross-filesystem run")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per engine; the fastest is reported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.source_dir) as source_dir:
+        source = os.path.join(source_dir, "source.bin")
+        with open(source, "wb") as f:
+            for _ in range(args.size):
+                f.write(os.urandom(1024 * 1024))
+
+        targets = [("same-fs", source_dir)]
+        if args.other_dir:
+            label = "same-fs*" if same_device(source_dir, args.other_dir) else "cross-fs"
+            targets.append((label, args.other_dir))
+
+        print(f"{'target':>9} {'engine':>16} {'used':>16} {'seconds':>8} {'MiB/s':>8}")
+        for label, target_dir in targets:
+            with tempfile.TemporaryDirectory(dir=target_dir) as destination_dir:
+                destination = os.path.join(destination_dir, "destination.bin")
+                for engine in ENGINES:
+                    if engine != "shutil.copy2" and engine not in available_engines(engine):
+                        print(f"{label:>9} {engine:>16} {'unavailable':>16}")
+                        continue
+                    seconds, used = timed_copy(engine, source, destination, args.repeat)
+                    print(f"{label:>9} {engine:>16} {used:>16} {seconds:>8.3f} {args.size / seconds:>8.1f}")
+        if len(targets) > 1 and targets[1][0] == "same-fs*":
+            print("* --other-dir is on the same filesystem as the source; pass a directory on another filesystem")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+bench_delta.py: Bytes written by delta transfer compared with a full copy
+
+Backs up a file once, modifies it with an append-only and a random-write pattern and reports the bytes
+written and time taken by delta.delta_copy against shutil.copy2 for each new version.
+
+Usage:
+    python3 benchmarks/bench_delta.py --size 256 --random-writes 32
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from delta import BLOCK_SIZE, delta_copy
+
+
+def append_only(path, size_mb, random_writes):
+    with open(path, "ab") as f:
+        f.write(os.urandom(max(1, size_mb // 64) * 1024 * 1024))
+
+
+def random_write(path, size_mb, random_writes):
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        for _ in range(random_writes):
+            f.seek(random.randrange(0, size - 4096))
+            f.write(os.urandom(4096))
+
+
+PATTERNS = {"append-only": append_only, "random-write": random_write}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delta transfer benchmark")
+    parser.add_argument("--size", type=int, default=256, help="Initial file size in MiB")
+    parser.add_argument("--random-writes", type=int, default=32, help="Number of 4 KiB writes in the random-write pattern")
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Delta block size in bytes")
+    args = parser.parse_args()
+    random.seed(0)
+
+    print(f"{'pattern':>13} {'file MiB':>9} {'full MiB':>9} {'delta MiB':>10} {'full s':>7} {'delta s':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, modify in PATTERNS.items():
+            source = os.path.join(tmp_dir, "source.bin")
+            delta_destination = os.path.join(tmp_dir, "delta.bin")
+            full_destination = os.path.join(tmp_dir, "full.bin")
+            with open(source, "wb") as f:
+                for _ in range(args.size):
+                    f.write(os.urandom(1024 * 1024))
+            signature, _ = delta_copy(source, delta_destination, block_size=args.block_size)
+            shutil.copy2(source, full_destination)
+
+            modify(source, args.size, args.random_writes)
+            size = os.path.getsize(source)
+
+            start = time.perf_counter()
+            shutil.copy2(source, full_destination)
+            full_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            _, written = delta_copy(source, delta_destination, signature)
+            delta_time = time.perf_counter() - start
+
+            mib = 1024 * 1024
+            print(f"{name:>13} {size / mib:>9.1f} {size / mib:>9.1f} {written / mib:>10.1f} {full_time:>7.2f} {delta_time:>8.2f}")
+            for path in (source, delta_destination, full_destination):
+                os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+bench_fanout.py: Backing up to two destinations, one run per destination against one fan-out run
+
+Creates a tree of --files files of --size bytes and backs it up to two fresh destinations twice:
+first with backup_files once per destination (the source is read and hashed twice), then with
+fan_out_files (read and hashed once, written to both). With --drop-caches the page cache is dropped
+before each pass over the source (needs root), so the second read comes from the disk as well.
+
+Usage:
+    python3 benchmarks/bench_fanout.py --files 2000 --size 262144 --workers 4
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backup
+import migrations
+
+
+def make_tree(root, files, size, per_dir):
+    for i in range(files):
+        directory = os.path.join(root, f"dir_{i // per_dir:04d}")
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"file_{i:07d}.bin"), "wb") as f:
+            f.write(os.urandom(size))
+
+
+def drop_caches():
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-destination backup benchmark")
+    parser.add_argument("--files", type=int, default=2000, help="Number of files")
+    parser.add_argument("--size", type=int, default=256 * 1024, help="Size of each file in bytes")
+    parser.add_argument("--per-dir", type=int, default=200, help="Files per directory")
+    parser.add_argument("--workers", type=int, default=4, help="Worker threads")
+    parser.add_argument("--drop-caches", action="store_true", help="Drop the page cache before each run (root only)")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench_fanout")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    with tempfile.TemporaryDirectory() as root:
+        source = os.path.join(root, "source")
+        make_tree(source, args.files, args.size, args.per_dir)
+        total = args.files * args.size
+        print(f"{'mode':>24} {'seconds':>8} {'MiB/s':>8}")
+        for mode in ("one run per destination", "fan-out"):
+            run_root = tempfile.mkdtemp(dir=root)
+            db_name = os.path.join(run_root, "catalog.db")
+            migrations.migrate(db_name)
+            destinations = [os.path.join(run_root, "onsite"), os.path.join(run_root, "offsite")]
+            if args.drop_caches:
+                drop_caches()
+            start = time.perf_counter()
+            if mode == "fan-out":
+                backup.fan_out_files(source, destinations, db_name, logger, workers=args.workers)
+            else:
+                for destination in destinations:
+                    # Each destination needs its own catalog, or the second run would find nothing to copy
+                    destination_db = os.path.join(run_root, f"{os.path.basename(destination)}.db")
+                    migrations.migrate(destination_db)
+                    backup.backup_files(source, destination, destination_db, logger, workers=args.workers)
+                    if args.drop_caches:
+                        drop_caches()
+            elapsed = time.perf_counter() - start
+            print(f"{mode:>24} {elapsed:>8.3f} {total / elapsed / (1024 * 1024):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
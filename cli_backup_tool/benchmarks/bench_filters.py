@@ -0,0 +1,83 @@
+"""
+bench_filters.py: Cost per path of the compiled filter as the number of rules grows
+
+Generates rule sets of increasing size with a realistic mix (directory and file names, "*.ext" rules,
+anchored paths and a share of free-form globs) and times filters.PathFilter.excluded over a fixed list
+of paths. For comparison, the same rules are also tried one by one with fnmatch, which is what a
+filter without compilation would do; that baseline grows linearly with the rule count.
+
+Usage:
+    python3 benchmarks/bench_filters.py --paths 50000 --rules 10 100 1000 10000
+"""
+
+import argparse
+import fnmatch
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from filters import EXCLUDE, PathFilter
+
+
+def make_rules(count, rng, glob_share):
+    rules = []
+    for i in range(count):
+        kind = rng.random()
+        if kind < glob_share:
+            rules.append(f"tmp{i}-*-[0-9]?")
+        elif kind < 0.5:
+            rules.append(f"name{i}")
+        elif kind < 0.8:
+            rules.append(f"*.ext{i}")
+        else:
+            rules.append(f"/top{i}/sub{i}")
+    return [(EXCLUDE, pattern) for pattern in rules]
+
+
+def make_paths(count, rng):
+    paths = []
+    for _ in range(count):
+        depth = rng.randint(1, 6)
+        parts = [f"dir{rng.randint(0, 50)}" for _ in range(depth - 1)]
+        parts.append(f"file{rng.randint(0, 10000)}.{rng.choice(['py', 'txt', 'ext3', 'json', 'tar.gz'])}")
+        paths.append("/".join(parts))
+    return paths
+
+
+def per_path(function, paths):
+    start = time.perf_counter()
+    for path in paths:
+        function(path)
+    return (time.perf_counter() - start) / len(paths) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Filter matcher cost per path")
+    parser.add_argument("--paths", type=int, default=50000, help="Number of paths matched per rule set")
+    parser.add_argument("--rules", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Rule set sizes")
+    parser.add_argument("--glob-share", type=float, default=0.05, help="Fraction of rules that are free-form globs")
+    parser.add_argument("--baseline-limit", type=int, default=1000, help="Largest rule set also timed with per-rule fnmatch")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    paths = make_paths(args.paths, rng)
+    print(f"{'rules':>7} {'compile ms':>10} {'us/path':>8} {'fnmatch us/path':>16}")
+    for count in args.rules:
+        rules = make_rules(count, rng, args.glob_share)
+        start = time.perf_counter()
+        path_filter = PathFilter(rules)
+        compile_ms = (time.perf_counter() - start) * 1000
+        compiled = per_path(path_filter.excluded, paths)
+        baseline = "-"
+        if count <= args.baseline_limit:
+            patterns = [pattern for _, pattern in rules]
+            names = [pattern.lstrip("/") for pattern in patterns]
+            baseline = f"{per_path(lambda path: any(fnmatch.fnmatchcase(path, name) for name in names), paths[:max(1, len(paths) // 10)]):.2f}"
+        print(f"{count:>7} {compile_ms:>10.1f} {compiled:>8.2f} {baseline:>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+bench_hashing.py: Peak memory and throughput of file hashing as the file size grows
+
+Compares the old whole-file read() hashing with the chunked and mmap paths of hashing.hash_file.
+Each measurement runs in a fresh subprocess so ru_maxrss reflects only that run.
+
+Usage:
+    python3 benchmarks/bench_hashing.py --sizes 16 64 256 --algorithm md5
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hashing import SUPPORTED_ALGORITHMS, hash_file
+
+MODES = ("read_all", "chunked", "mmap")
+
+
+def make_file(path, size_mb):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+
+def run_one(path, mode, algorithm):
+    start = time.perf_counter()
+    if mode == "read_all":
+        with open(path, "rb") as f:
+            hashlib.new(algorithm, f.read()).hexdigest()
+    else:
+        hash_file(path, algorithm=algorithm, use_mmap=(mode == "mmap"), mmap_threshold=0)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        max_rss *= 1024
+    print(json.dumps({"elapsed": elapsed, "max_rss": max_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hashing memory benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[16, 64, 256], help="File sizes in MiB")
+    parser.add_argument("--algorithm", choices=SUPPORTED_ALGORITHMS, default="md5")
+    parser.add_argument("--run-one", nargs=2, metavar=("path", "mode"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(args.run_one[0], args.run_one[1], args.algorithm)
+        return
+
+    print(f"{'size MiB':>9} {'mode':>9} {'peak RSS MiB':>13} {'MiB/s':>9}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size_mb in args.sizes:
+            path = os.path.join(tmp_dir, f"bench_{size_mb}.bin")
+            make_file(path, size_mb)
+            for mode in MODES:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--algorithm", args.algorithm, "--run-one", path, mode],
+                    check=True, capture_output=True, text=True
+                ).stdout
+                result = json.loads(output)
+                rss_mb = result["max_rss"] / (1024 * 1024)
+                throughput = size_mb / result["elapsed"] if result["elapsed"] else float("inf")
+                print(f"{size_mb:>9} {mode:>9} {rss_mb:>13.1f} {throughput:>9.1f}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+bench_log_queries.py: Log query times before and after the index migration
+
+Seeds a database at schema version 2 (no Logentry/Notes indexes) with --rows log entries,
+times the log queries used by backup.py and the dashboard, applies the remaining migrations
+and times the same queries again.
+
+Usage:
+    python3 benchmarks/bench_log_queries.py --rows 1000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import Catalog
+from migrations import migrate
+
+FILES = 10000
+JOBS = 1000
+SEVERITIES = ("INFO", "INFO", "INFO", "INFO", "WARNING", "ERROR")
+
+QUERIES = {
+    "display_job_logs": ('''
+        SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message
+        FROM Logentry
+        WHERE job_id = ?
+    ''', (JOBS // 2,)),
+    "query_logs": ('''
+        SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message
+        FROM Logentry JOIN file ON Logentry.file_id = file.File_id
+        WHERE file.Filename = ? AND file.Directory = ? AND Logentry.entry_datetime >= ?
+    ''', ("file_42.txt", "/data/dir_42", "2023-01-01")),
+    "query_all_logs": ('''
+        SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message
+        FROM Logentry JOIN file ON Logentry.file_id = file.File_id
+        WHERE file.Directory = ? AND Logentry.entry_datetime >= ?
+    ''', ("/data/dir_7", "2023-01-01")),
+    "get_recent_logs": ('''
+        SELECT Logentry.entry_datetime, Logentry.severity_level, Logentry.Message, file.Directory, file.Filename
+        FROM Logentry
+        LEFT JOIN file ON Logentry.file_id = file.File_id
+        WHERE Logentry.severity_level IN ('ERROR', 'WARNING')
+        ORDER BY Logentry.entry_datetime ASC
+        LIMIT 10
+    ''', ()),
+    "notes_for_entry": ('SELECT * FROM Notes WHERE entry_id = ?', (12345,)),
+}
+
+
+def seed(catalog, rows):
+    random.seed(0)
+    catalog.conn.executemany(
+        'INSERT INTO file (Directory, Filename, Md5hash) VALUES (?, ?, ?)',
+        ((f"/data/dir_{i % 100}", f"file_{i}.txt", f"{i:032x}") for i in range(FILES))
+    )
+    catalog.conn.executemany(
+        'INSERT INTO Logentry (entry_datetime, severity_level, Message, file_id, job_id) VALUES (?, ?, ?, ?, ?)',
+        ((
+            f"2023-{random.randint(1, 12):02d}-{random.randint(1, 28):02d} 12:00:00",
+            random.choice(SEVERITIES),
+            f"message {i}",
+            random.randint(1, FILES),
+            i * JOBS // rows + 1,
+        ) for i in range(rows))
+    )
+    catalog.conn.executemany(
+        'INSERT INTO Notes (note_text, entry_id) VALUES (?, ?)',
+        ((f"note {i}", random.randint(1, rows)) for i in range(rows // 100))
+    )
+    catalog.commit()
+
+
+def time_queries(catalog, repeat):
+    timings = {}
+    for name, (sql, parameters) in QUERIES.items():
+        start = time.perf_counter()
+        for _ in range(repeat):
+            catalog.fetchall(sql, parameters)
+        timings[name] = (time.perf_counter() - start) / repeat
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Log query benchmark")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of Logentry rows to seed")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with Catalog(os.path.join(tmp_dir, "bench.db")) as catalog:
+            migrate(catalog, target_version=2)
+            seed(catalog, args.rows)
+            before = time_queries(catalog, args.repeat)
+
+            start = time.perf_counter()
+            migrate(catalog)
+            migration_time = time.perf_counter() - start
+            after = time_queries(catalog, args.repeat)
+
+    print(f"{args.rows} log rows, index migration took {migration_time:.2f}s")
+    print(f"{'query':>18} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    for name in QUERIES:
+        speedup = before[name] / after[name] if after[name] else float("inf")
+        print(f"{name:>18} {before[name] * 1000:>10.2f} {after[name] * 1000:>10.2f} {speedup:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+bench_pack.py: Files per second for small files, per-file copies against pack segments
+
+Creates a tree of --files small files and stores it three ways: shutil.copy2 per file (the old copy
+path), copier.copy_file per file, and pack mode (one read per file, appended to pack segments through
+pack.PackWriter). Each run starts with a cold destination and ends with an fsync of what it wrote, so
+directory and inode creation is counted. A final run reads every packed file back through the index.
+
+Usage:
+    python3 benchmarks/bench_pack.py --files 20000 --size 2048 --destination-dir /data/tmp
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from copier import copy_file
+from pack import PackWriter, read_entry, read_small_file
+
+MODES = ("shutil.copy2", "copy_file", "pack")
+
+
+def make_tree(root, files, size, per_dir):
+    paths = []
+    for i in range(files):
+        directory = os.path.join(root, f"dir_{i // per_dir:04d}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"file_{i:07d}.txt")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def sync_tree(root):
+    for directory, _, names in os.walk(root):
+        for name in names:
+            fd = os.open(os.path.join(directory, name), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+
+def store(mode, source_root, paths, destination_root):
+    if mode == "pack":
+        with PackWriter(destination_root, "bench") as writer:
+            locations = [writer.append(read_small_file(path)) for path in paths]
+        sync_tree(destination_root)
+        return locations
+    created = set()
+    for path in paths:
+        destination = os.path.join(destination_root, os.path.relpath(path, source_root))
+        parent = os.path.dirname(destination)
+        if parent not in created:
+            os.makedirs(parent, exist_ok=True)
+            created.add(parent)
+        if mode == "shutil.copy2":
+            shutil.copy2(path, destination)
+        else:
+            copy_file(path, destination)
+    sync_tree(destination_root)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Small-file pack benchmark")
+    parser.add_argument("--files", type=int, default=20000, help="Number of files")
+    parser.add_argument("--size", type=int, default=2048, help="Size of each file in bytes")
+    parser.add_argument("--per-dir", type=int, default=500, help="Files per directory")
+    parser.add_argument("--source-dir", default=None, help="Directory for the source tree (default: system temp dir)")
+    parser.add_argument("--destination-dir", default=None, help="Directory for the destinations (default: system temp dir)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.source_dir) as source_root:
+        paths = make_tree(source_root, args.files, args.size, args.per_dir)
+        print(f"{'mode':>14} {'seconds':>8} {'files/s':>10} {'MiB/s':>8}")
+        for mode in MODES:
+            with tempfile.TemporaryDirectory(dir=args.destination_dir) as destination_root:
+                start = time.perf_counter()
+                locations = store(mode, source_root, paths, destination_root)
+                elapsed = time.perf_counter() - start
+                print(f"{mode:>14} {elapsed:>8.3f} {args.files / elapsed:>10.0f} {args.files * args.size / elapsed / (1024 * 1024):>8.1f}")
+                if locations is not None:
+                    start = time.perf_counter()
+                    for location in locations:
+                        read_entry(os.path.join(destination_root, location.segment), location.offset, location.length)
+                    elapsed = time.perf_counter() - start
+                    print(f"{'pack restore':>14} {elapsed:>8.3f} {args.files / elapsed:>10.0f} {args.files * args.size / elapsed / (1024 * 1024):>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
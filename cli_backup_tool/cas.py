@@ -0,0 +1,77 @@
+"""
+cas.py: Content-addressable destination store for the backup tool
+
+Each distinct file content is stored once under objects/<digest[:2]>/<digest[2:]> in the destination.
+Every job gets a tree under jobs/<job> whose files are hardlinks to those blobs, so storage and copy
+volume grow with unique content instead of with the number of files backed up.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from copier import copy_file
+from throttle import Throttle
+
+OBJECTS_DIR = "objects"
+JOBS_DIR = "jobs"
+
+
+def blob_path(store_dir: str, digest: str) -> str:
+    return os.path.join(store_dir, OBJECTS_DIR, digest[:2], digest[2:])
+
+
+def job_tree_dir(store_dir: str, job_name: str) -> str:
+    return os.path.join(store_dir, JOBS_DIR, job_name)
+
+
+def store_blob(store_dir: str, source_path: str, digest: str, copy_engine: str = "auto", throttle: Optional[Throttle] = None) -> bool:
+    """
+    Copy source_path into the store under digest unless that content is already stored.
+
+    The blob is written to a temporary file and renamed into place, so concurrent writers of the same
+    content and interrupted copies never leave a partial blob behind.
+
+    Args:
+        store_dir (str): Root of the CAS destination.
+        source_path (str): File to store.
+        digest (str): Content hash of the file.
+        copy_engine (str): Engine passed to copier.copy_file.
+        throttle (Throttle, optional): Budgets passed to copier.copy_file.
+
+    Returns:
+        bool: True if a new blob was written, False if the content was already stored.
+    """
+    path = blob_path(store_dir, digest)
+    if os.path.exists(path):
+        return False
+    blob_dir = os.path.dirname(path)
+    os.makedirs(blob_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=blob_dir, prefix=".tmp-")
+    os.close(fd)
+    try:
+        copy_file(source_path, temp_path, copy_engine, throttle)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return True
+
+
+def link_blob(store_dir: str, digest: str, tree_path: str) -> None:
+    """
+    Make tree_path a hardlink to the blob for digest.
+
+    Falls back to a copy when the filesystem refuses the link (no hardlink support or too many links).
+    """
+    path = blob_path(store_dir, digest)
+    if os.path.lexists(tree_path):
+        if os.path.samefile(path, tree_path):
+            return
+        os.remove(tree_path)
+    try:
+        os.link(path, tree_path)
+    except OSError:
+        shutil.copy2(path, tree_path)
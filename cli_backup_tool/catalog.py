@@ -0,0 +1,105 @@
+"""
+catalog.py: Single-connection database session for the backup tool
+
+A Catalog keeps one SQLite connection open for a whole job and groups writes into transactions of
+batch_size statements, instead of opening a connection and committing for every row.
+The database helpers in backup.py accept either a Catalog or a database path; a path gets a
+short-lived Catalog that commits and closes as soon as the helper returns.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Union
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class Catalog:
+    """
+    One connection and one pending transaction shared by every database helper in a job.
+
+    Access is serialised with a lock so the scanner thread can read while the writer thread
+    inserts. Reads on the same connection see rows that are not committed yet.
+    """
+
+    def __init__(self, db_name: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db_name = db_name
+        self.batch_size = max(1, batch_size)
+        self.conn = sqlite3.connect(db_name, check_same_thread=False)
+        self.lock = threading.RLock()
+        self.pending_writes = 0
+
+    def __enter__(self) -> "Catalog":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def fetchone(self, sql: str, parameters: Sequence = ()) -> Optional[tuple]:
+        with self.lock:
+            cursor = self.conn.execute(sql, parameters)
+            row = cursor.fetchone()
+            cursor.close()
+            return row
+
+    def fetchall(self, sql: str, parameters: Sequence = ()) -> List[tuple]:
+        with self.lock:
+            return self.conn.execute(sql, parameters).fetchall()
+
+    def execute(self, sql: str, parameters: Sequence = ()) -> Optional[int]:
+        """
+        Run a write statement in the current batch and commit once batch_size writes are pending.
+
+        Returns:
+            int or None: lastrowid of the statement.
+        """
+        with self.lock:
+            cursor = self.conn.execute(sql, parameters)
+            self.pending_writes += 1
+            if self.pending_writes >= self.batch_size:
+                self.commit()
+            return cursor.lastrowid
+
+    def executemany(self, sql: str, rows: Sequence[Sequence]) -> None:
+        """Run a write statement once per row; every row counts towards the batch."""
+        with self.lock:
+            self.conn.executemany(sql, rows)
+            self.pending_writes += len(rows)
+            if self.pending_writes >= self.batch_size:
+                self.commit()
+
+    def commit(self) -> None:
+        with self.lock:
+            self.conn.commit()
+            self.pending_writes = 0
+
+    def close(self) -> None:
+        with self.lock:
+            if self.conn is None:
+                return
+            self.commit()
+            self.conn.close()
+            self.conn = None
+
+
+@contextmanager
+def open_catalog(db: Union[str, Catalog], batch_size: int = 1) -> Iterator[Catalog]:
+    """
+    Use db as a Catalog: an existing Catalog is borrowed, a database path is opened and closed around the block.
+
+    Args:
+        db (str or Catalog): Database path or an open Catalog.
+        batch_size (int): Batch size when a new Catalog is opened for a path.
+
+    Yields:
+        Catalog: Session to run the statements through.
+    """
+    if isinstance(db, Catalog):
+        yield db
+        return
+    catalog = Catalog(db, batch_size=batch_size)
+    try:
+        yield catalog
+    finally:
+        catalog.close()
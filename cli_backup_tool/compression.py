@@ -0,0 +1,156 @@
+"""
+compression.py: Streaming compression of backed up files
+
+Files are compressed chunk by chunk with zlib, lzma or bz2 from the standard library, so memory use
+stays bounded for any file size. A CompressionPolicy picks the codec per file from a job default and
+per-extension overrides, and leaves already-compressed formats such as .jpg or .zip uncompressed.
+"""
+
+import bz2
+import lzma
+import os
+import shutil
+import zlib
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from throttle import Throttle
+
+CHUNK_SIZE = 1024 * 1024
+CODECS = ("zlib", "lzma", "bz2")
+CODEC_SUFFIXES = {"zlib": ".zz", "lzma": ".xz", "bz2": ".bz2"}
+COMPRESSED_EXTENSIONS = frozenset({
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic",
+    ".mp3", ".aac", ".ogg", ".flac", ".mp4", ".mkv", ".mov", ".avi", ".webm",
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".lz4", ".7z", ".rar", ".jar",
+    ".docx", ".xlsx", ".pptx", ".odt", ".pdf",
+})
+
+
+def new_compressor(codec: str):
+    if codec == "zlib":
+        return zlib.compressobj()
+    if codec == "lzma":
+        return lzma.LZMACompressor()
+    if codec == "bz2":
+        return bz2.BZ2Compressor()
+    raise ValueError(f"Unsupported codec '{codec}', expected one of {', '.join(CODECS)}")
+
+
+def new_decompressor(codec: str):
+    if codec == "zlib":
+        return zlib.decompressobj()
+    if codec == "lzma":
+        return lzma.LZMADecompressor()
+    if codec == "bz2":
+        return bz2.BZ2Decompressor()
+    raise ValueError(f"Unsupported codec '{codec}', expected one of {', '.join(CODECS)}")
+
+
+class CompressionPolicy(NamedTuple):
+    default: Optional[str] = None
+    extensions: Dict[str, Optional[str]] = {}
+
+    def codec_for(self, path: str) -> Optional[str]:
+        """Return the codec for path, or None to store it uncompressed."""
+        extension = os.path.splitext(path)[1].lower()
+        if extension in self.extensions:
+            return self.extensions[extension]
+        if extension in COMPRESSED_EXTENSIONS:
+            return None
+        return self.default
+
+
+def parse_policy(default: Optional[str], rules: Iterable[str] = ()) -> CompressionPolicy:
+    """
+    Build a policy from a job default codec and EXT=CODEC rules.
+
+    Args:
+        default (str, optional): Codec for files without a rule, or None.
+        rules (iterable): Rules such as ".log=lzma" or "csv=none"; "none" stores matching files uncompressed.
+
+    Returns:
+        CompressionPolicy: Policy for the job.
+    """
+    extensions = {}
+    for rule in rules:
+        extension, _, codec = rule.partition("=")
+        extension = extension.strip().lower()
+        if not extension.startswith("."):
+            extension = "." + extension
+        codec = codec.strip().lower()
+        if codec != "none" and codec not in CODECS:
+            raise ValueError(f"Invalid compression rule '{rule}', expected EXT=CODEC with CODEC one of none, {', '.join(CODECS)}")
+        extensions[extension] = None if codec == "none" else codec
+    return CompressionPolicy(default, extensions)
+
+
+def compress_file(
+    source_path: str,
+    destination_path: str,
+    codec: str,
+    chunk_size: int = CHUNK_SIZE,
+    throttle: Optional[Throttle] = None
+) -> int:
+    """
+    Write a compressed copy of source_path and copy its metadata like shutil.copy2.
+
+    The throttle's read budget is charged for the original bytes and its write budget for the compressed ones.
+
+    Returns:
+        int: Size of the compressed file in bytes.
+    """
+    compressor = new_compressor(codec)
+    stored_size = 0
+    throttle = throttle or Throttle()
+    with open(source_path, "rb") as raw_source, open(destination_path, "wb") as raw_destination:
+        source, destination = throttle.reader(raw_source), throttle.writer(raw_destination)
+        while True:
+            chunk = source.read(chunk_size)
+            if not chunk:
+                break
+            data = compressor.compress(chunk)
+            destination.write(data)
+            stored_size += len(data)
+        data = compressor.flush()
+        destination.write(data)
+        stored_size += len(data)
+    shutil.copystat(source_path, destination_path)
+    return stored_size
+
+
+def decompress_file(source_path: str, destination_path: str, codec: str, chunk_size: int = CHUNK_SIZE) -> int:
+    """
+    Write the decompressed content of source_path to destination_path.
+
+    Returns:
+        int: Size of the decompressed file in bytes.
+    """
+    decompressor = new_decompressor(codec)
+    size = 0
+    with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+        for chunk in iter_decompressed(source, decompressor, chunk_size):
+            destination.write(chunk)
+            size += len(chunk)
+    return size
+
+
+def iter_decompressed(source, decompressor, chunk_size: int = CHUNK_SIZE):
+    """Yield decompressed chunks of an open compressed file, each at most chunk_size bytes."""
+    if hasattr(decompressor, "unconsumed_tail"):
+        while not decompressor.eof:
+            compressed = decompressor.unconsumed_tail or source.read(chunk_size)
+            if not compressed:
+                break
+            data = decompressor.decompress(compressed, chunk_size)
+            if data:
+                yield data
+    else:
+        while not decompressor.eof:
+            compressed = source.read(chunk_size) if decompressor.needs_input else b""
+            if decompressor.needs_input and not compressed:
+                break
+            data = decompressor.decompress(compressed, chunk_size)
+            if data:
+                yield data
+    if not decompressor.eof:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached")
@@ -0,0 +1,166 @@
+"""
+copier.py: Zero-copy file transfer for the backup tool
+
+On Linux the kernel can move file data without a round trip through user-space buffers:
+os.copy_file_range copies inside the kernel (and becomes a reflink on XFS and btrfs), and os.sendfile
+streams between file descriptors. copy_file tries the engines in order, continues with the next one
+from the same offset when an engine is unsupported for the pair of files (old kernel, cross-filesystem
+copy, special filesystem), and finally falls back to buffered reads and writes. Metadata is copied
+like shutil.copy2 does.
+
+copy_and_hash is the single-pass alternative: it reads each chunk once, feeds it to the hasher and
+writes it to a temporary file that is renamed over the destination when the copy is complete.
+
+Both accept a throttle.Throttle. The kernel engines then move CHUNK_SIZE bytes per syscall instead of
+up to 1 GiB, so the budget is charged in small steps and the copy never runs far ahead of it.
+"""
+
+import errno
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+from hashing import DEFAULT_ALGORITHM, new_hasher
+from throttle import Throttle
+
+ENGINES = ("auto", "copy_file_range", "sendfile", "buffered")
+CHUNK_SIZE = 1024 * 1024
+# Upper bound per syscall; the kernel caps a single transfer at about 2 GiB anyway
+MAX_SYSCALL_SIZE = 1024 * 1024 * 1024
+# Errors meaning "this engine cannot copy between these files", as opposed to a real I/O error
+FALLBACK_ERRNOS = frozenset({errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.EPERM})
+
+
+def _copy_file_range(source_fd: int, destination_fd: int, offset: int, throttle: Optional[Throttle] = None) -> int:
+    step = CHUNK_SIZE if throttle else MAX_SYSCALL_SIZE
+    while True:
+        copied = os.copy_file_range(source_fd, destination_fd, step, offset, offset)
+        if copied == 0:
+            return offset
+        offset += copied
+        if throttle:
+            throttle.transfer(copied)
+
+
+def _sendfile(source_fd: int, destination_fd: int, offset: int, throttle: Optional[Throttle] = None) -> int:
+    step = CHUNK_SIZE if throttle else MAX_SYSCALL_SIZE
+    os.lseek(destination_fd, offset, os.SEEK_SET)
+    while True:
+        sent = os.sendfile(destination_fd, source_fd, offset, step)
+        if sent == 0:
+            return offset
+        offset += sent
+        if throttle:
+            throttle.transfer(sent)
+
+
+def _buffered(source_fd: int, destination_fd: int, offset: int, throttle: Optional[Throttle] = None) -> int:
+    while True:
+        chunk = os.pread(source_fd, CHUNK_SIZE, offset)
+        if not chunk:
+            return offset
+        if throttle:
+            throttle.read.acquire(len(chunk))
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(destination_fd, view, offset)
+            view = view[written:]
+            offset += written
+            if throttle:
+                throttle.write.acquire(written)
+
+
+_ENGINE_FUNCTIONS = {"copy_file_range": _copy_file_range, "sendfile": _sendfile, "buffered": _buffered}
+
+
+def available_engines(engine: str = "auto") -> list:
+    """Return the engines copy_file tries for the given choice, in order."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unsupported copy engine '{engine}', expected one of {', '.join(ENGINES)}")
+    names = ["copy_file_range", "sendfile", "buffered"] if engine == "auto" else [engine, "buffered"]
+    return [name for name in dict.fromkeys(names) if name == "buffered" or hasattr(os, name)]
+
+
+def copy_file(source_path: str, destination_path: str, engine: str = "auto", throttle: Optional[Throttle] = None) -> str:
+    """
+    Copy the content and metadata of source_path to destination_path.
+
+    Args:
+        source_path (str): File to copy.
+        destination_path (str): Destination file, created or truncated.
+        engine (str): "auto" to try copy_file_range, then sendfile, then buffered copying, or the name of
+            one engine, which still falls back to buffered copying when the syscall is unsupported.
+        throttle (Throttle, optional): Read and write budgets charged for the copied bytes.
+
+    Returns:
+        str: Name of the engine that finished the copy.
+    """
+    engines = available_engines(engine)
+    with open(source_path, "rb") as source, open(destination_path, "wb") as destination:
+        source_fd, destination_fd = source.fileno(), destination.fileno()
+        size = os.fstat(source_fd).st_size
+        offset = 0
+        for name in engines:
+            try:
+                offset = _ENGINE_FUNCTIONS[name](source_fd, destination_fd, offset, throttle)
+            except OSError as e:
+                if e.errno not in FALLBACK_ERRNOS or name == "buffered":
+                    raise
+                continue
+            # Some filesystems (procfs, sysfs) report EOF to the kernel engines before the real end of data
+            if offset >= size or name == "buffered":
+                break
+        destination.truncate(offset)
+    shutil.copystat(source_path, destination_path)
+    return name
+
+
+def copy_and_hash(
+    source_path: str,
+    destination_path: str,
+    algorithm: str = DEFAULT_ALGORITHM,
+    chunk_size: int = CHUNK_SIZE,
+    throttle: Optional[Throttle] = None
+) -> str:
+    """
+    Copy source_path to destination_path and hash the bytes copied, reading the source only once.
+
+    The data goes to a temporary file next to the destination, which replaces the destination atomically
+    once content and metadata are written. The digest therefore always describes exactly the bytes in
+    the destination, even if the source changes while it is being copied, and an interrupted copy leaves
+    the previous destination untouched.
+
+    Args:
+        source_path (str): File to copy.
+        destination_path (str): Destination file, replaced when the copy succeeds.
+        algorithm (str): Hash algorithm name (md5, sha256 or blake2b).
+        chunk_size (int): Number of bytes read, hashed and written at a time.
+        throttle (Throttle, optional): Read and write budgets charged for the copied bytes.
+
+    Returns:
+        str: Hex digest of the copied content.
+    """
+    hasher = new_hasher(algorithm)
+    throttle = throttle or Throttle()
+    with open(source_path, "rb") as raw_source:
+        source = throttle.reader(raw_source)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(destination_path) or ".", prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as raw_destination:
+                destination = throttle.writer(raw_destination)
+                buffer = bytearray(chunk_size)
+                view = memoryview(buffer)
+                while True:
+                    read = source.readinto(buffer)
+                    if not read:
+                        break
+                    hasher.update(view[:read])
+                    destination.write(view[:read])
+            shutil.copystat(source_path, temp_path)
+            os.replace(temp_path, destination_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return hasher.hexdigest()
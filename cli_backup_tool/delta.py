@@ -0,0 +1,104 @@
+"""
+delta.py: Block-level delta transfer for large modified files
+
+The previous version of a file is described by a block signature: a weak Adler-32 checksum and a strong
+16-byte BLAKE2b digest per fixed-size block. When the file changes, each new block is compared with the
+block at the same offset in the signature and only blocks that differ are rewritten in the destination,
+so appends and in-place page writes cost roughly the changed bytes instead of a full copy.
+Insertions that shift data move every following block, which degrades to a full rewrite of the tail.
+"""
+
+import hashlib
+import os
+import shutil
+import zlib
+from array import array
+from typing import NamedTuple, Optional, Tuple
+
+from throttle import Throttle
+
+BLOCK_SIZE = 1024 * 1024
+DELTA_MIN_SIZE = 64 * 1024 * 1024
+STRONG_SIZE = 16
+
+
+class BlockSignature(NamedTuple):
+    block_size: int
+    weak: array
+    strong: bytes
+
+    def block_count(self) -> int:
+        return len(self.weak)
+
+    def matches(self, index: int, weak: int, strong: bytes) -> bool:
+        if index >= len(self.weak) or self.weak[index] != weak:
+            return False
+        return self.strong[index * STRONG_SIZE:(index + 1) * STRONG_SIZE] == strong
+
+    def pack(self) -> Tuple[int, bytes, bytes]:
+        """Return (block_size, weak, strong) as stored in the BlockSignature table."""
+        return self.block_size, self.weak.tobytes(), self.strong
+
+    @classmethod
+    def unpack(cls, block_size: int, weak: bytes, strong: bytes) -> "BlockSignature":
+        checksums = array("I")
+        checksums.frombytes(weak)
+        return cls(block_size, checksums, strong)
+
+
+def block_checksums(block) -> Tuple[int, bytes]:
+    return zlib.adler32(block), hashlib.blake2b(block, digest_size=STRONG_SIZE).digest()
+
+
+def delta_copy(
+    source_path: str,
+    destination_path: str,
+    old_signature: Optional[BlockSignature] = None,
+    block_size: int = BLOCK_SIZE,
+    throttle: Optional[Throttle] = None
+) -> Tuple[BlockSignature, int]:
+    """
+    Bring destination_path up to date with source_path and return the new block signature.
+
+    With an old signature of the same block size and an existing destination, only blocks whose checksums
+    differ from the old signature are written; otherwise the whole file is written. Metadata is copied
+    like shutil.copy2 does.
+
+    Args:
+        source_path (str): File to back up.
+        destination_path (str): Previous backup of the file, described by old_signature.
+        old_signature (BlockSignature, optional): Signature of the destination's current content.
+        block_size (int): Block size for a new signature.
+        throttle (Throttle, optional): Budgets charged for every block read and every block rewritten.
+
+    Returns:
+        tuple: (signature of the new content, number of bytes written).
+    """
+    if old_signature is not None:
+        block_size = old_signature.block_size
+    in_place = old_signature is not None and os.path.isfile(destination_path)
+
+    weak = array("I")
+    strong = bytearray()
+    written = 0
+    throttle = throttle or Throttle()
+    with open(source_path, "rb") as raw_source, open(destination_path, "r+b" if in_place else "wb") as destination:
+        source = throttle.reader(raw_source)
+        offset = 0
+        index = 0
+        while True:
+            block = source.read(block_size)
+            if not block:
+                break
+            block_weak, block_strong = block_checksums(block)
+            weak.append(block_weak)
+            strong += block_strong
+            if not (in_place and old_signature.matches(index, block_weak, block_strong)):
+                os.pwrite(destination.fileno(), block, offset)
+                throttle.write.acquire(len(block))
+                written += len(block)
+            offset += len(block)
+            index += 1
+        destination.truncate(offset)
+    shutil.copystat(source_path, destination_path)
+    return BlockSignature(block_size, weak, bytes(strong)), written
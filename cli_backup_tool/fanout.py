@@ -0,0 +1,270 @@
+"""
+fanout.py: Read-once copies to several backup destinations
+
+A FanOut runs one writer thread per destination. FanOut.copy reads a source file once in CHUNK_SIZE
+chunks, hashes each chunk and queues the same bytes object to every destination that needs the file,
+so the source is read and hashed once however many copies are made. Each writer writes its chunks to a
+temporary file that is renamed over the destination once the file is complete, like
+copier.copy_and_hash does.
+
+Destinations do not wait for each other. The reader only waits for the destination with the shortest
+queue, so the fastest destination sets the pace. A destination whose queue grows more than max_lag
+bytes beyond that is dropped from the file. Its writer copies the file from the source itself after
+the rest of the job, so a slow target only delays its own copies. A write error fails the file on that
+destination alone.
+
+Every finished copy is reported as a Completion, which the caller reads with completed() to record
+per-destination state.
+"""
+
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from collections import deque
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from copier import CHUNK_SIZE, copy_and_hash
+from hashing import DEFAULT_ALGORITHM, new_hasher
+from throttle import Throttle
+
+# How far, in queued bytes, a destination may fall behind the fastest one before it is dropped from a file
+DEFAULT_MAX_LAG = 64 * 1024 * 1024
+
+_OPEN, _DATA, _CLOSE, _ABORT, _STOP = range(5)
+
+
+class Completion(NamedTuple):
+    destination: int
+    key: Any
+    source_path: str
+    destination_path: str
+    digest: Optional[str]
+    error: Optional[str] = None
+    deferred: bool = False
+
+
+class _Ticket:
+    """One source file on its way to several destinations."""
+
+    def __init__(self, source_path: str, destination_paths: Dict[int, str], key: Any):
+        self.source_path = source_path
+        self.destination_paths = destination_paths
+        self.key = key
+        self.digest: Optional[str] = None
+        self.failed: Dict[int, str] = {}
+        self.deferred: List[int] = []
+
+
+class _Destination:
+    def __init__(self):
+        self.queue: deque = deque()
+        self.queued_bytes = 0
+        self.deferred: List[Tuple[str, str, Any]] = []
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.caught_up = 0
+        self.thread: Optional[threading.Thread] = None
+
+
+class FanOut:
+    """
+    Writer threads for a fixed list of destinations, shared by all worker threads of a job.
+
+    Args:
+        destinations (int): Number of destinations; copy() addresses them by index.
+        algorithm (str): Hash algorithm for the digests copy() returns.
+        max_lag (int): Queued bytes a destination may be behind the fastest one before it is dropped from a file.
+        throttle (Throttle, optional): The read budget is charged once per chunk, the write budget once per destination.
+    """
+
+    def __init__(self, destinations: int, algorithm: str = DEFAULT_ALGORITHM, max_lag: int = DEFAULT_MAX_LAG,
+                 throttle: Optional[Throttle] = None):
+        self.algorithm = algorithm
+        self.max_lag = max(max_lag, CHUNK_SIZE)
+        self.throttle = throttle
+        self.condition = threading.Condition()
+        self.completions: "queue.SimpleQueue[Completion]" = queue.SimpleQueue()
+        self.destinations = [_Destination() for _ in range(destinations)]
+        for index, destination in enumerate(self.destinations):
+            destination.thread = threading.Thread(target=self._run, args=(index,), name=f"backup-fanout-{index}", daemon=True)
+            destination.thread.start()
+
+    def __enter__(self) -> "FanOut":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def copy(self, source_path: str, destination_paths: Dict[int, str], key: Any = None) -> str:
+        """
+        Read source_path once and queue its content to each destination in destination_paths.
+
+        Returns once the whole file is queued; the copies themselves are reported through completed().
+
+        Args:
+            source_path (str): File to copy.
+            destination_paths (dict): Destination file path by destination index.
+            key: Passed back unchanged in the Completion of each copy.
+
+        Returns:
+            str: Hex digest of the content read.
+
+        Raises:
+            OSError: The source cannot be read; no destination is changed.
+        """
+        ticket = _Ticket(source_path, dict(destination_paths), key)
+        active = list(ticket.destination_paths)
+        hasher = new_hasher(self.algorithm)
+        with self.condition:
+            for index in active:
+                self.destinations[index].queue.append((ticket, _OPEN, None))
+            self.condition.notify_all()
+        try:
+            with open(source_path, "rb") as source:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if self.throttle:
+                        self.throttle.read.acquire(len(chunk))
+                    hasher.update(chunk)
+                    active = self._send(ticket, active, chunk)
+        except BaseException:
+            self._queue_all(ticket, _ABORT)
+            raise
+        ticket.digest = hasher.hexdigest()
+        # Destinations that failed get the close too, so their error is reported
+        self._queue_all(ticket, _CLOSE)
+        return ticket.digest
+
+    def _send(self, ticket: _Ticket, active: List[int], chunk: bytes) -> List[int]:
+        with self.condition:
+            active = [index for index in active if index not in ticket.failed]
+            # The fastest destination sets the pace of the read
+            while active:
+                shortest = min(self.destinations[index].queued_bytes for index in active)
+                if shortest == 0 or shortest + len(chunk) <= self.max_lag:
+                    break
+                self.condition.wait()
+            still_active = []
+            for index in active:
+                destination = self.destinations[index]
+                if destination.queued_bytes + len(chunk) > shortest + self.max_lag:
+                    # Too far behind the others: copy this file from the source once the job is done
+                    destination.queue.append((ticket, _ABORT, None))
+                    ticket.deferred.append(index)
+                    destination.deferred.append((ticket.source_path, ticket.destination_paths[index], ticket.key))
+                    continue
+                destination.queue.append((ticket, _DATA, chunk))
+                destination.queued_bytes += len(chunk)
+                still_active.append(index)
+            self.condition.notify_all()
+        return still_active
+
+    def _queue_all(self, ticket: _Ticket, kind: int) -> None:
+        with self.condition:
+            for index in ticket.destination_paths:
+                if index not in ticket.deferred:
+                    self.destinations[index].queue.append((ticket, kind, None))
+            self.condition.notify_all()
+
+    def _run(self, index: int) -> None:
+        destination = self.destinations[index]
+        open_files: Dict[_Ticket, Tuple[Any, str]] = {}
+        last_parent = None
+        while True:
+            with self.condition:
+                while not destination.queue:
+                    self.condition.wait()
+                ticket, kind, chunk = destination.queue.popleft()
+                if kind == _DATA:
+                    destination.queued_bytes -= len(chunk)
+                    self.condition.notify_all()
+            if kind == _STOP:
+                break
+            path = ticket.destination_paths[index]
+            try:
+                if index in ticket.failed:
+                    if kind == _CLOSE:
+                        self._report(index, ticket, path, ticket.failed[index])
+                elif kind == _OPEN:
+                    parent = os.path.dirname(path) or "."
+                    if parent != last_parent:
+                        os.makedirs(parent, exist_ok=True)
+                        last_parent = parent
+                    fd, temp_path = tempfile.mkstemp(dir=parent, prefix=".tmp-")
+                    open_files[ticket] = (os.fdopen(fd, "wb"), temp_path)
+                elif kind == _DATA:
+                    open_files[ticket][0].write(chunk)
+                    if self.throttle:
+                        self.throttle.write.acquire(len(chunk))
+                elif kind == _ABORT:
+                    self._discard(open_files.pop(ticket, None))
+                elif kind == _CLOSE:
+                    temp_file, temp_path = open_files.pop(ticket)
+                    size = temp_file.tell()
+                    temp_file.close()
+                    shutil.copystat(ticket.source_path, temp_path)
+                    os.replace(temp_path, path)
+                    destination.files += 1
+                    destination.bytes += size
+                    self._report(index, ticket, path, None)
+            except Exception as e:
+                ticket.failed[index] = str(e)
+                self._discard(open_files.pop(ticket, None))
+                if kind == _CLOSE:
+                    self._report(index, ticket, path, str(e))
+        for source_path, path, key in destination.deferred:
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                digest = copy_and_hash(source_path, path, self.algorithm, throttle=self.throttle)
+            except Exception as e:
+                destination.errors += 1
+                self.completions.put(Completion(index, key, source_path, path, None, str(e), True))
+                continue
+            destination.caught_up += 1
+            destination.files += 1
+            destination.bytes += os.path.getsize(path)
+            self.completions.put(Completion(index, key, source_path, path, digest, None, True))
+
+    def _report(self, index: int, ticket: _Ticket, path: str, error: Optional[str]) -> None:
+        if error is not None:
+            self.destinations[index].errors += 1
+        self.completions.put(Completion(index, ticket.key, ticket.source_path, path, None if error else ticket.digest, error))
+
+    @staticmethod
+    def _discard(open_file: Optional[Tuple[Any, str]]) -> None:
+        if open_file is None:
+            return
+        temp_file, temp_path = open_file
+        temp_file.close()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+    def completed(self) -> Iterator[Completion]:
+        """Yield the copies finished since the last call, without waiting for more."""
+        while True:
+            try:
+                yield self.completions.get_nowait()
+            except queue.Empty:
+                return
+
+    def close(self) -> None:
+        """Wait until every destination has written its queue and caught up on the files it was dropped from."""
+        with self.condition:
+            for destination in self.destinations:
+                if destination.thread is not None:
+                    destination.queue.append((None, _STOP, None))
+            self.condition.notify_all()
+        for destination in self.destinations:
+            if destination.thread is not None:
+                destination.thread.join()
+                destination.thread = None
+
+    def stats(self, index: int) -> Tuple[int, int, int, int]:
+        """Return (files, bytes, errors, caught_up) for one destination."""
+        destination = self.destinations[index]
+        return destination.files, destination.bytes, destination.errors, destination.caught_up
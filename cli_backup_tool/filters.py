@@ -0,0 +1,254 @@
+"""
+filters.py: Include/exclude rules for the source walk
+
+Rules are globs matched against paths relative to the source directory:
+
+    *.pyc          no slash: matches the name at any depth
+    /dist, a/b/*   a slash anywhere but at the end: matches the whole relative path
+    build/         a trailing slash: matches directories only
+    **             matches any number of directories, e.g. logs/**/*.gz
+
+Rules from --include and --exclude are tried in command-line order and the first match decides, as in
+rsync. An ignore file follows .gitignore conventions instead: one exclude per line, "!" re-includes,
+"#" starts a comment, and later lines override earlier ones. Its lines are therefore appended in
+reverse order after the command-line rules. A path no rule matches is backed up.
+
+All rules are compiled once into a PathFilter. Literal names, literal paths and "*.ext" rules go into
+dictionaries. The remaining globs are grouped by their literal prefix (or, for globs that start with a
+wildcard, their literal suffix) into combined regular expressions, so a path only runs the few regexes
+whose prefix or suffix it actually has. Matching therefore costs about one dictionary lookup per
+character of the name, not one test per rule. The walker asks the filter about
+every directory before descending into it, so an excluded directory is never listed. As with rsync and
+git, nothing below an excluded directory can be re-included.
+"""
+
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+INCLUDE = "include"
+EXCLUDE = "exclude"
+GLOB_CHARS = frozenset("*?[")
+
+Rule = Tuple[str, str]
+
+
+def read_ignore_file(path: str) -> List[Rule]:
+    """Return the rules of a .gitignore-style file, in the order they should be tried."""
+    rules = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("!"):
+                rules.append((INCLUDE, line[1:]))
+            else:
+                # "\#" and "\!" escape a leading "#" or "!"
+                rules.append((EXCLUDE, line[1:] if line[:2] in ("\\#", "\\!") else line))
+    # In an ignore file the last matching line wins; the filter stops at the first match
+    rules.reverse()
+    return rules
+
+
+def _glob_to_regex(glob: str) -> str:
+    parts = []
+    i = 0
+    while i < len(glob):
+        char = glob[i]
+        if glob.startswith("**/", i):
+            parts.append("(?:[^/]*/)*")
+            i += 3
+        elif glob.startswith("**", i):
+            parts.append(".*")
+            i += 2
+        elif char == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif char == "?":
+            parts.append("[^/]")
+            i += 1
+        elif char == "[":
+            end = glob.find("]", i + 2 if glob.startswith("[!", i) or glob.startswith("[]", i) else i + 1)
+            if end < 0:
+                parts.append(re.escape(char))
+                i += 1
+                continue
+            body = glob[i + 1:end]
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append("[" + body.replace("\\", "\\\\") + "]")
+            i = end + 1
+        else:
+            parts.append(re.escape(char))
+            i += 1
+    return "".join(parts)
+
+
+def _literal_ends(glob: str) -> Tuple[str, str]:
+    """Return literal text every match of the glob starts and ends with (possibly shorter than the real one)."""
+    start = min((glob.find(char) for char in GLOB_CHARS if char in glob), default=len(glob))
+    end = len(glob)
+    # Stopping at "]" as well keeps the characters of a trailing [...] class out of the suffix
+    while end > start and glob[end - 1] not in "*?[]":
+        end -= 1
+    # "**/" also matches no directory at all, so the slash after it is not always there
+    if glob.startswith("/", end) and glob.endswith("**", 0, end):
+        end += 1
+    return glob[:start], glob[end:]
+
+
+def _combine(alternatives: List[Tuple[int, str]]):
+    # Alternatives are tried left to right, so the first one that matches is the earliest rule
+    try:
+        return re.compile("|".join(f"(?P<r{index}>{regex})" for index, regex in alternatives), re.DOTALL)
+    except re.error as e:
+        raise ValueError(f"Invalid filter pattern: {e}") from e
+
+
+class _GlobIndex:
+    """Globs grouped by literal prefix or suffix; match() only runs the groups the text can match."""
+
+    def __init__(self, globs: List[Tuple[int, str]]):
+        by_prefix: Dict[str, List[Tuple[int, str]]] = {}
+        by_suffix: Dict[str, List[Tuple[int, str]]] = {}
+        always = []
+        for index, glob in globs:
+            prefix, suffix = _literal_ends(glob)
+            regex = _glob_to_regex(glob)
+            if prefix:
+                by_prefix.setdefault(prefix, []).append((index, regex))
+            elif suffix:
+                by_suffix.setdefault(suffix, []).append((index, regex))
+            else:
+                always.append((index, regex))
+        self.prefixes = {key: _combine(group) for key, group in by_prefix.items()}
+        self.suffixes = {key: _combine(group) for key, group in by_suffix.items()}
+        self.prefix_lengths = sorted({len(key) for key in by_prefix})
+        self.suffix_lengths = sorted({len(key) for key in by_suffix})
+        self.always = _combine(always) if always else None
+
+    def match(self, text: str) -> Optional[int]:
+        best = None
+        candidates = [self.always] if self.always is not None else []
+        for length in self.prefix_lengths:
+            if length > len(text):
+                break
+            regex = self.prefixes.get(text[:length])
+            if regex is not None:
+                candidates.append(regex)
+        for length in self.suffix_lengths:
+            if length > len(text):
+                break
+            regex = self.suffixes.get(text[-length:])
+            if regex is not None:
+                candidates.append(regex)
+        for regex in candidates:
+            match = regex.fullmatch(text)
+            if match is not None:
+                index = int(match.lastgroup[1:])
+                if best is None or index < best:
+                    best = index
+        return best
+
+
+class _RuleSet:
+    """Lookup tables for one list of rules; match() returns the index of the first rule that matches."""
+
+    def __init__(self, rules: List[Tuple[int, str, bool]]):
+        self.names: Dict[str, int] = {}
+        self.paths: Dict[str, int] = {}
+        self.suffixes: Dict[str, int] = {}
+        name_globs = []
+        path_globs = []
+        for index, pattern, anchored in rules:
+            if not GLOB_CHARS.intersection(pattern):
+                self._first(self.paths if anchored else self.names, pattern, index)
+            elif not anchored and pattern.startswith("*.") and not GLOB_CHARS.intersection(pattern[1:]):
+                self._first(self.suffixes, pattern[1:], index)
+            else:
+                # Rules without a slash only ever look at the name
+                (path_globs if anchored else name_globs).append((index, pattern))
+        self.name_globs = _GlobIndex(name_globs)
+        self.path_globs = _GlobIndex(path_globs)
+
+    @staticmethod
+    def _first(table: Dict[str, int], key: str, index: int) -> None:
+        if key not in table:
+            table[key] = index
+
+    def match(self, relative_path: str, name: str) -> Optional[int]:
+        best = self.names.get(name)
+        index = self.paths.get(relative_path)
+        if index is not None and (best is None or index < best):
+            best = index
+        if self.suffixes:
+            dot = name.find(".")
+            while dot >= 0:
+                index = self.suffixes.get(name[dot:])
+                if index is not None and (best is None or index < best):
+                    best = index
+                dot = name.find(".", dot + 1)
+        for index in (self.name_globs.match(name), self.path_globs.match(relative_path)):
+            if index is not None and (best is None or index < best):
+                best = index
+        return best
+
+
+class PathFilter:
+    """
+    Compiled include/exclude rules.
+
+    Paths are relative to the source directory and use "/" as separator, as os.path.join does on POSIX.
+    """
+
+    def __init__(self, rules: Iterable[Rule]):
+        self.rules = []
+        file_rules = []
+        directory_rules = []
+        for action, pattern in rules:
+            if action not in (INCLUDE, EXCLUDE):
+                raise ValueError(f"Unknown filter action '{action}', expected {INCLUDE} or {EXCLUDE}")
+            directory_only = pattern.endswith("/")
+            body = pattern.rstrip("/")
+            anchored = "/" in body
+            body = body.lstrip("/")
+            if not body:
+                raise ValueError(f"Empty filter pattern '{pattern}'")
+            index = len(self.rules)
+            self.rules.append((action, pattern))
+            directory_rules.append((index, body, anchored))
+            if not directory_only:
+                file_rules.append((index, body, anchored))
+        self.files = _RuleSet(file_rules)
+        self.directories = _RuleSet(directory_rules)
+
+    def __bool__(self) -> bool:
+        return bool(self.rules)
+
+    def excluded(self, relative_path: str, is_dir: bool = False) -> bool:
+        """Return True if the first rule matching relative_path excludes it."""
+        name = relative_path.rpartition("/")[2]
+        index = (self.directories if is_dir else self.files).match(relative_path, name)
+        return index is not None and self.rules[index][0] == EXCLUDE
+
+    def excluded_path(self, relative_path: str, is_dir: bool = False) -> bool:
+        """Like excluded(), but also True when a parent directory is excluded, for paths that do not come from a walk."""
+        parts = relative_path.split("/")
+        for depth in range(1, len(parts)):
+            if self.excluded("/".join(parts[:depth]), is_dir=True):
+                return True
+        return self.excluded(relative_path, is_dir)
+
+
+def compile_filter(rules: Optional[Iterable[Rule]] = None, ignore_file: Optional[str] = None) -> PathFilter:
+    """
+    Build the filter for a job from the command-line rules and an optional ignore file.
+
+    Raises:
+        OSError: The ignore file cannot be read.
+        ValueError: A rule is invalid.
+    """
+    combined = list(rules or [])
+    if ignore_file:
+        combined.extend(read_ignore_file(ignore_file))
+    return PathFilter(combined)
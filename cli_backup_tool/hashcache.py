@@ -0,0 +1,189 @@
+"""
+hashcache.py: Shared on-disk cache of file hashes for the backup tool
+
+The cache maps (device, inode, size, mtime_ns, algorithm) to a digest in its own SQLite file, so jobs
+with different --database catalogs and destinations that read the same source files hash each of them
+only once. It is bounded to max_entries rows, evicting the least recently used ones as batches are written
+and again on close, and is safe to share
+between concurrent jobs: the database runs in WAL mode with a busy timeout, and each job batches its
+inserts and recency updates into short write transactions.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from hashing import DEFAULT_ALGORITHM, hash_file
+from throttle import IOLimiter
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+FLUSH_SIZE = 500
+BUSY_TIMEOUT_MS = 30_000
+# Files modified this recently may change again within the same mtime tick, so their hash is not cached
+RACY_WINDOW_NS = 2_000_000_000
+
+CacheKey = Tuple[int, int, int, int, str]
+
+
+def cache_key(file_stat: os.stat_result, algorithm: str) -> CacheKey:
+    return file_stat.st_dev, file_stat.st_ino, file_stat.st_size, file_stat.st_mtime_ns, algorithm
+
+
+class HashCache:
+    """
+    Hash cache shared between jobs through one SQLite file.
+
+    get_md5_hash in backup.py calls hash_file() instead of hashing directly when a cache is configured.
+    hits, misses and evicted count this instance's activity.
+    """
+
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max(1, max_entries)
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.pending: Dict[CacheKey, Tuple[Optional[str], int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS HashCache (
+                    Device INTEGER NOT NULL,
+                    Inode INTEGER NOT NULL,
+                    Size INTEGER NOT NULL,
+                    Mtime_ns INTEGER NOT NULL,
+                    Algorithm TEXT NOT NULL,
+                    Digest TEXT NOT NULL,
+                    Last_used INTEGER NOT NULL,
+                    PRIMARY KEY (Device, Inode, Size, Mtime_ns, Algorithm)
+                ) WITHOUT ROWID
+            ''')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS idx_hashcache_last_used ON HashCache (Last_used)')
+        # Upper bound on the rows, kept without counting on every batch; rows added by other jobs show up on the next count
+        self.rows = self.conn.execute('SELECT COUNT(*) FROM HashCache').fetchone()[0]
+
+    def __enter__(self) -> "HashCache":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def get(self, file_stat: os.stat_result, algorithm: str = DEFAULT_ALGORITHM) -> Optional[str]:
+        key = cache_key(file_stat, algorithm)
+        with self.lock:
+            if key in self.pending and self.pending[key][0] is not None:
+                digest = self.pending[key][0]
+            else:
+                row = self.conn.execute('''
+                    SELECT Digest FROM HashCache
+                    WHERE Device = ? AND Inode = ? AND Size = ? AND Mtime_ns = ? AND Algorithm = ?
+                ''', key).fetchone()
+                digest = row[0] if row else None
+            if digest is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Only the recency changes; it is written with the next batch
+            self._queue(key, self.pending.get(key, (None, 0))[0])
+            return digest
+
+    def put(self, file_stat: os.stat_result, algorithm: str, digest: str) -> None:
+        if time.time_ns() - file_stat.st_mtime_ns < RACY_WINDOW_NS:
+            return
+        with self.lock:
+            self._queue(cache_key(file_stat, algorithm), digest)
+
+    def hash_file(self, file_path: str, algorithm: str = DEFAULT_ALGORITHM, use_mmap: bool = False,
+                  limiter: Optional[IOLimiter] = None, refresh: bool = False) -> Optional[str]:
+        """
+        Return the digest of file_path from the cache, or hash the file and cache the result.
+
+        The result is only cached if the file's stat is the same before and after hashing, so a file
+        that changes while it is read never gets a digest under the wrong key. With refresh, the cached
+        digest is not trusted: the file is always hashed and the result replaces the cached one.
+        """
+        try:
+            before = os.stat(file_path)
+        except OSError:
+            return hash_file(file_path, algorithm, use_mmap=use_mmap, limiter=limiter)
+        if refresh:
+            with self.lock:
+                self.misses += 1
+        else:
+            digest = self.get(before, algorithm)
+            if digest is not None:
+                return digest
+        digest = hash_file(file_path, algorithm, use_mmap=use_mmap, limiter=limiter)
+        if digest is not None:
+            try:
+                after = os.stat(file_path)
+            except OSError:
+                return digest
+            if cache_key(after, algorithm) == cache_key(before, algorithm):
+                self.put(after, algorithm, digest)
+        return digest
+
+    def _queue(self, key: CacheKey, digest: Optional[str]) -> None:
+        self.pending[key] = (digest, time.time_ns())
+        if len(self.pending) >= FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self.pending:
+            return
+        inserts = [key + (digest, last_used) for key, (digest, last_used) in self.pending.items() if digest is not None]
+        touches = [(last_used,) + key for key, (digest, last_used) in self.pending.items() if digest is None]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO HashCache VALUES (?, ?, ?, ?, ?, ?, ?)', inserts)
+            self.conn.executemany('''
+                UPDATE HashCache SET Last_used = MAX(Last_used, ?)
+                WHERE Device = ? AND Inode = ? AND Size = ? AND Mtime_ns = ? AND Algorithm = ?
+            ''', touches)
+        self.pending.clear()
+        self.rows += len(inserts)
+        if self.rows > self.max_entries:
+            self._evict()
+
+    def flush(self) -> None:
+        with self.lock:
+            self._flush()
+
+    def evict(self) -> int:
+        """Delete the least recently used rows above max_entries and return how many were deleted."""
+        with self.lock:
+            evicted = self.evicted
+            self._flush()
+            self._evict()
+            return self.evicted - evicted
+
+    def _evict(self) -> None:
+        with self.conn:
+            # Take the write lock before counting so a concurrent job cannot change the count underneath
+            self.conn.execute('BEGIN IMMEDIATE')
+            count = self.conn.execute('SELECT COUNT(*) FROM HashCache').fetchone()[0]
+            excess = count - self.max_entries
+            self.rows = min(count, self.max_entries)
+            if excess <= 0:
+                return
+            self.conn.execute('''
+                DELETE FROM HashCache WHERE (Device, Inode, Size, Mtime_ns, Algorithm) IN (
+                    SELECT Device, Inode, Size, Mtime_ns, Algorithm FROM HashCache
+                    ORDER BY Last_used LIMIT ?
+                )
+            ''', (excess,))
+        self.evicted += excess
+
+    def close(self) -> None:
+        if self.conn is None:
+            return
+        self.evict()
+        with self.lock:
+            self.conn.close()
+            self.conn = None
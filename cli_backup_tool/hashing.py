@@ -0,0 +1,96 @@
+"""
+hashing.py: Streaming file hashing for the backup tool
+
+Files are hashed in fixed-size chunks so memory use does not depend on the file size.
+Large files can optionally be hashed through a read-only mmap instead of read() calls.
+"""
+
+import hashlib
+import mmap
+import os
+from typing import Optional
+
+from throttle import IOLimiter, ThrottledReader
+
+CHUNK_SIZE = 1024 * 1024
+MMAP_THRESHOLD = 64 * 1024 * 1024
+MMAP_WINDOW = 64 * 1024 * 1024
+SUPPORTED_ALGORITHMS = ("md5", "sha256", "blake2b")
+DEFAULT_ALGORITHM = "md5"
+
+
+def algorithm_for_digest(digest: str) -> str:
+    """Return the supported algorithm whose hex digests have the length of digest."""
+    for algorithm in SUPPORTED_ALGORITHMS:
+        if hashlib.new(algorithm).digest_size * 2 == len(digest):
+            return algorithm
+    raise ValueError(f"No supported hash algorithm produces {len(digest)}-character digests")
+
+
+def new_hasher(algorithm: str = DEFAULT_ALGORITHM):
+    """
+    Create a hashlib object for one of the supported algorithms.
+
+    Args:
+        algorithm (str): One of SUPPORTED_ALGORITHMS.
+
+    Returns:
+        hashlib hash object.
+    """
+    if algorithm not in SUPPORTED_ALGORITHMS:
+        raise ValueError(f"Unsupported hash algorithm '{algorithm}', expected one of {', '.join(SUPPORTED_ALGORITHMS)}")
+    return hashlib.new(algorithm)
+
+
+def hash_file(
+    file_path: str,
+    algorithm: str = DEFAULT_ALGORITHM,
+    chunk_size: int = CHUNK_SIZE,
+    use_mmap: bool = False,
+    mmap_threshold: int = MMAP_THRESHOLD,
+    limiter: Optional[IOLimiter] = None
+) -> Optional[str]:
+    """
+    Calculate the hex digest of a file without loading it into memory.
+
+    Args:
+        file_path (str): Path to the file.
+        algorithm (str): Hash algorithm name (md5, sha256 or blake2b).
+        chunk_size (int): Number of bytes fed to the hasher at a time.
+        use_mmap (bool): Hash files of at least mmap_threshold bytes through mmap.
+        mmap_threshold (int): Minimum file size for the mmap path.
+        limiter (IOLimiter, optional): Read budget charged for the bytes hashed.
+
+    Returns:
+        str or None: Hex digest of the file, or None if the path is not a regular file.
+    """
+    if not os.path.isfile(file_path):
+        return None
+
+    hasher = new_hasher(algorithm)
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if use_mmap and size and size >= mmap_threshold:
+            # Map a bounded window at a time so resident pages stay capped for huge files
+            window = max(MMAP_WINDOW - MMAP_WINDOW % mmap.ALLOCATIONGRANULARITY, mmap.ALLOCATIONGRANULARITY)
+            for window_offset in range(0, size, window):
+                length = min(window, size - window_offset)
+                with mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ, offset=window_offset) as mapped:
+                    view = memoryview(mapped)
+                    try:
+                        for offset in range(0, length, chunk_size):
+                            if limiter:
+                                limiter.acquire(min(chunk_size, length - offset))
+                            hasher.update(view[offset:offset + chunk_size])
+                    finally:
+                        view.release()
+        else:
+            reader = ThrottledReader(f, limiter) if limiter else f
+            buffer = bytearray(chunk_size)
+            view = memoryview(buffer)
+            while True:
+                read = reader.readinto(buffer)
+                if not read:
+                    break
+                hasher.update(view[:read])
+    return hasher.hexdigest()
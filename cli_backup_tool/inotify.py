@@ -0,0 +1,217 @@
+"""
+inotify.py: Linux inotify watcher for the continuous backup mode
+
+TreeWatcher puts an inotify watch on every directory of a source tree through ctypes (no external
+packages) and turns the kernel's events into batches of dirty paths relative to the tree. Events are
+coalesced until the tree has been quiet for a debounce window, so a file written in many small chunks
+is backed up once. When the kernel's event queue overflows, or a directory cannot be watched because
+the inotify watch limit is reached, events have been lost and the batch asks for a full rescan instead.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import time
+from typing import Callable, Iterator, NamedTuple, Optional, Set
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR | IN_DONT_FOLLOW)
+EVENT_HEADER = struct.Struct("iIII")
+READ_SIZE = 64 * 1024
+DEFAULT_DEBOUNCE = 2.0
+# A tree that never goes quiet is still backed up at least this many debounce windows apart
+MAX_DELAY_FACTOR = 10
+
+_libc = None
+
+
+def _load_libc():
+    global _libc
+    if _libc is None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError(errno.ENOSYS, "inotify is not available on this platform")
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        _libc = libc
+    return _libc
+
+
+def inotify_available() -> bool:
+    try:
+        _load_libc()
+    except OSError:
+        return False
+    return True
+
+
+class WatchBatch(NamedTuple):
+    paths: Set[str]
+    full_rescan: bool
+
+
+class TreeWatcher:
+    """
+    inotify watches on every directory below source_dir.
+
+    Use as a context manager; wait() returns the next debounced batch of dirty paths. Directories the
+    optional exclude predicate rejects (called with the relative path and True) are not watched. Only
+    source_dir itself must be watchable: a subdirectory that cannot be watched is passed to the optional
+    on_error callback with the OSError and skipped.
+    """
+
+    def __init__(self, source_dir: str, exclude: Optional[Callable[[str, bool], bool]] = None,
+                 on_error: Optional[Callable[[str, OSError], None]] = None):
+        self.source_dir = source_dir
+        self.exclude = exclude
+        self.on_error = on_error
+        libc = _load_libc()
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.directories = {}
+        self.dirty = set()
+        self.full_rescan = False
+        try:
+            self.watch_tree("")
+        except BaseException:
+            self.close()
+            raise
+        # The caller's initial scan covers the directories that could not be watched
+        self.full_rescan = False
+
+    def __enter__(self) -> "TreeWatcher":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    def add_watch(self, relative_dir: str) -> None:
+        path = os.path.join(self.source_dir, relative_dir) if relative_dir else self.source_dir
+        wd = _libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), path)
+        # Watching an already watched inode (a moved directory) returns its wd, which then gets the new path
+        self.directories[wd] = relative_dir
+
+    def watch_tree(self, relative_dir: str) -> None:
+        """Watch relative_dir and every directory below it."""
+        pending = [relative_dir]
+        while pending:
+            current = pending.pop()
+            try:
+                self.add_watch(current)
+            except OSError as e:
+                if not current:
+                    raise
+                if e.errno == errno.ENOSPC:
+                    self.full_rescan = True
+                if self.on_error is not None:
+                    self.on_error(os.path.join(self.source_dir, current), e)
+                continue
+            directory = os.path.join(self.source_dir, current) if current else self.source_dir
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            relative_path = os.path.join(current, entry.name) if current else entry.name
+                            if self.exclude is None or not self.exclude(relative_path, True):
+                                pending.append(relative_path)
+            except OSError:
+                continue
+
+    def handle_event(self, wd: int, mask: int, name: str) -> None:
+        """Fold one inotify event into the pending batch."""
+        if mask & IN_Q_OVERFLOW:
+            self.full_rescan = True
+            return
+        if mask & IN_IGNORED:
+            self.directories.pop(wd, None)
+            return
+        relative_dir = self.directories.get(wd)
+        if relative_dir is None or not name:
+            return
+        relative_path = os.path.join(relative_dir, name) if relative_dir else name
+        if mask & IN_ISDIR:
+            if self.exclude is not None and self.exclude(relative_path, True):
+                return
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # Files may have appeared before the watch was added, so the whole new directory is dirty
+                self.watch_tree(relative_path)
+                self.dirty.add(relative_path)
+            return
+        self.dirty.add(relative_path)
+
+    def read_events(self, timeout: Optional[float]) -> bool:
+        """Read and handle the events available within timeout seconds; return False if none arrived."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, READ_SIZE)
+        except BlockingIOError:
+            return False
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            self.handle_event(wd, mask, name)
+        return True
+
+    def wait(self, debounce: float = DEFAULT_DEBOUNCE, timeout: Optional[float] = None) -> Optional[WatchBatch]:
+        """
+        Wait for changes and return them once the tree has been quiet for debounce seconds.
+
+        Args:
+            debounce (float): Quiet period that ends a batch.
+            timeout (float, optional): Give up and return None if nothing changes within this many seconds.
+
+        Returns:
+            WatchBatch or None: Dirty paths relative to source_dir, or a request for a full rescan.
+        """
+        if not self.dirty and not self.full_rescan:
+            if not self.read_events(timeout):
+                return None
+        deadline = time.monotonic() + debounce * MAX_DELAY_FACTOR
+        while time.monotonic() < deadline and self.read_events(debounce):
+            pass
+        batch = WatchBatch(self.dirty, self.full_rescan)
+        self.dirty = set()
+        self.full_rescan = False
+        return batch
+
+    def batches(self, debounce: float = DEFAULT_DEBOUNCE) -> Iterator[WatchBatch]:
+        while True:
+            batch = self.wait(debounce, timeout=1.0)
+            if batch is not None and (batch.paths or batch.full_rescan):
+                yield batch
@@ -0,0 +1,133 @@
+"""
+logsink.py: Background writers for the backup tool's logs
+
+LogSink moves Logentry inserts off the backup loop: rows are queued and a writer thread inserts them
+with executemany once flush_size rows are waiting or flush_interval seconds have passed. The rows join
+the catalog's pending batch and are committed with it, so the sink never cuts a job's batch short. start_queued_logging does the same for the text log by putting the file and console handlers
+behind a logging.handlers.QueueHandler, so a slow disk or terminal never blocks copying.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import List, Optional
+
+from catalog import Catalog
+
+DEFAULT_FLUSH_INTERVAL = 1.0
+
+INSERT_LOG_ENTRY = '''
+    INSERT INTO Logentry (entry_datetime, severity_level, Message, file_id, job_id)
+    VALUES (?, ?, ?, ?, ?)
+'''
+
+_CLOSE = object()
+
+
+class LogSink:
+    """
+    Queue of Logentry rows written to the catalog by a background thread.
+
+    put() never touches the database. flush() and close() block until every row queued before them is
+    in the catalog's batch, which the catalog commits; use the sink as a context manager so rows are written even when the backup raises.
+    An error in the writer thread is re-raised by the next flush() or close().
+    """
+
+    def __init__(self, catalog: Catalog, flush_size: Optional[int] = None, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        self.catalog = catalog
+        self.flush_size = max(1, flush_size or catalog.batch_size)
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue()
+        self.error = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="logentry-writer", daemon=True)
+        self.thread.start()
+
+    def __enter__(self) -> "LogSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def put(self, entry_datetime, severity_level: str, message: str, file_id: Optional[int] = None, job_id: Optional[int] = None) -> None:
+        self.queue.put((entry_datetime, severity_level, message, file_id, job_id))
+
+    def flush(self) -> None:
+        if not self.closed:
+            done = threading.Event()
+            self.queue.put(done)
+            done.wait()
+        self._raise_error()
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            self.queue.put(_CLOSE)
+            self.thread.join()
+        self._raise_error()
+
+    def _raise_error(self) -> None:
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def _write(self, rows: List[tuple]) -> None:
+        if not rows:
+            return
+        try:
+            self.catalog.executemany(INSERT_LOG_ENTRY, rows)
+        except Exception as e:
+            self.error = e
+        rows.clear()
+
+    def _run(self) -> None:
+        rows = []
+        deadline = None
+        while True:
+            try:
+                item = self.queue.get(timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                self._write(rows)
+                deadline = None
+                continue
+            if item is _CLOSE:
+                self._write(rows)
+                return
+            if isinstance(item, threading.Event):
+                self._write(rows)
+                deadline = None
+                item.set()
+                continue
+            rows.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.flush_interval
+            if len(rows) >= self.flush_size:
+                self._write(rows)
+                deadline = None
+
+
+def start_queued_logging(logger: logging.Logger, handlers: List[logging.Handler]) -> QueueListener:
+    """
+    Attach handlers to logger through a queue so records are formatted and written on a listener thread.
+
+    The listener is stopped at interpreter exit, which writes any records still queued.
+
+    Returns:
+        QueueListener: The started listener.
+    """
+    log_queue = queue.Queue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(QueueHandler(log_queue))
+    return listener
+
+
+def flush_queued_logging(logger: logging.Logger) -> None:
+    """Block until the listener threads have handled every record queued on logger so far."""
+    for handler in logger.handlers:
+        if isinstance(handler, QueueHandler):
+            handler.queue.join()
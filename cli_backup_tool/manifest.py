@@ -0,0 +1,137 @@
+"""
+manifest.py: Compact per-job manifests and linear-time diffs between jobs
+
+A manifest lists every file a backup job saw, as four parallel columns sorted by path id (the file's
+File_id in the catalog): array-backed int64 columns for the ids, sizes and mtimes, and one bytes column
+holding the raw digests back to back at a fixed width. Stored in the catalog, a million-file manifest
+is about 40 MB with MD5 digests, and it loads with four frombytes() calls instead of a million row tuples.
+
+diff_manifests merge-joins two manifests on path id in a single pass and returns the added, changed
+and removed path ids, again as arrays.
+"""
+
+import threading
+from array import array
+from typing import NamedTuple, Tuple
+
+
+def _column(values=()) -> array:
+    return array("q", values)
+
+
+class Manifest(NamedTuple):
+    ids: array
+    sizes: array
+    mtimes: array
+    digests: bytes
+    digest_size: int
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def digest(self, index: int) -> bytes:
+        return self.digests[index * self.digest_size:(index + 1) * self.digest_size]
+
+    def pack(self) -> Tuple[int, int, bytes, bytes, bytes, bytes]:
+        """Return (entries, digest_size, ids, sizes, mtimes, digests) as stored in the Manifest table."""
+        return len(self.ids), self.digest_size, self.ids.tobytes(), self.sizes.tobytes(), self.mtimes.tobytes(), self.digests
+
+    @classmethod
+    def unpack(cls, digest_size: int, ids: bytes, sizes: bytes, mtimes: bytes, digests: bytes) -> "Manifest":
+        columns = []
+        for data in (ids, sizes, mtimes):
+            column = _column()
+            column.frombytes(data)
+            columns.append(column)
+        return cls(*columns, digests, digest_size)
+
+
+class ManifestBuilder:
+    """
+    Collects the files of one job while it runs and sorts them into a Manifest at the end.
+
+    add() may be called from several threads. Digests of different lengths (a job that reuses catalog
+    hashes from an earlier algorithm) are zero-padded to the longest one.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = _column()
+        self.sizes = _column()
+        self.mtimes = _column()
+        self.digests = []
+
+    def add(self, path_id: int, size: int, mtime_ns: int, hex_digest: str) -> None:
+        digest = bytes.fromhex(hex_digest)
+        with self.lock:
+            self.ids.append(path_id)
+            self.sizes.append(size or 0)
+            self.mtimes.append(mtime_ns or 0)
+            self.digests.append(digest)
+
+    def build(self) -> Manifest:
+        with self.lock:
+            order = sorted(range(len(self.ids)), key=self.ids.__getitem__)
+            digest_size = max((len(digest) for digest in self.digests), default=0)
+            ids, sizes, mtimes = _column(), _column(), _column()
+            digests = bytearray()
+            previous = None
+            for index in order:
+                path_id = self.ids[index]
+                if path_id == previous:
+                    # The same path reported twice (e.g. a resumed file): keep the later one
+                    ids.pop()
+                    sizes.pop()
+                    mtimes.pop()
+                    del digests[len(digests) - digest_size:]
+                ids.append(path_id)
+                sizes.append(self.sizes[index])
+                mtimes.append(self.mtimes[index])
+                digests += self.digests[index].ljust(digest_size, b"\0")
+                previous = path_id
+            return Manifest(ids, sizes, mtimes, bytes(digests), digest_size)
+
+
+class ManifestDiff(NamedTuple):
+    added: array
+    changed: array
+    removed: array
+
+
+def diff_manifests(old: Manifest, new: Manifest) -> ManifestDiff:
+    """
+    Compare two manifests in one merge pass over their sorted path ids.
+
+    A path is changed when its size or digest differs; a new mtime alone does not count.
+
+    Returns:
+        ManifestDiff: Path ids added in new, changed between them, and removed from old.
+    """
+    added, changed, removed = _column(), _column(), _column()
+    old_ids, new_ids = old.ids, new.ids
+    old_count, new_count = len(old_ids), len(new_ids)
+    width = max(old.digest_size, new.digest_size)
+    old_digests, new_digests = memoryview(old.digests), memoryview(new.digests)
+    old_size, new_size = old.digest_size, new.digest_size
+    same_width = old_size == new_size
+    i = j = 0
+    while i < old_count and j < new_count:
+        old_id, new_id = old_ids[i], new_ids[j]
+        if old_id == new_id:
+            old_digest = old_digests[i * old_size:(i + 1) * old_size]
+            new_digest = new_digests[j * new_size:(j + 1) * new_size]
+            if not same_width:
+                old_digest, new_digest = bytes(old_digest).ljust(width, b"\0"), bytes(new_digest).ljust(width, b"\0")
+            if old.sizes[i] != new.sizes[j] or old_digest != new_digest:
+                changed.append(new_id)
+            i += 1
+            j += 1
+        elif old_id < new_id:
+            removed.append(old_id)
+            i += 1
+        else:
+            added.append(new_id)
+            j += 1
+    removed.extend(old_ids[i:])
+    added.extend(new_ids[j:])
+    return ManifestDiff(added, changed, removed)
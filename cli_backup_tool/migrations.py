@@ -0,0 +1,305 @@
+"""
+migrations.py: Versioned schema for the backup tool database
+
+The schema version is stored in PRAGMA user_version. migrate() applies only the steps above the stored
+version, so a database that is already current costs one PRAGMA read and no DDL on startup.
+Every step is idempotent (IF NOT EXISTS, column checks), so a step interrupted before its version
+was recorded is simply run again.
+"""
+
+from typing import Union
+
+from catalog import Catalog, open_catalog
+
+FILE_STAT_COLUMNS = ("Size", "Mtime_ns", "Inode", "Device")
+
+
+def create_file_table(catalog: Catalog) -> None:
+    """Create the 'file' table, adding the stat columns to tables created before stat tracking."""
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS file (
+            File_id INTEGER PRIMARY KEY,
+            Directory TEXT NOT NULL,
+            Filename TEXT NOT NULL,
+            Last_backup_datetime TEXT,
+            Md5hash TEXT NOT NULL,
+            Size INTEGER,
+            Mtime_ns INTEGER,
+            Inode INTEGER,
+            Device INTEGER
+        )
+    ''')
+    columns = {row[1] for row in catalog.fetchall('PRAGMA table_info(file)')}
+    for column in FILE_STAT_COLUMNS:
+        if column not in columns:
+            catalog.execute(f'ALTER TABLE file ADD COLUMN {column} INTEGER')
+
+
+def create_file_history(catalog: Catalog) -> None:
+    """
+    Create the 'FileVersion' table and its trigger, and make (Directory, Filename) unique.
+
+    Older hashes of a path move to FileVersion whenever the current row gets a new hash.
+    Duplicate rows left by earlier versions of the tool are collapsed before the unique index is built.
+    """
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS FileVersion (
+            Version_id INTEGER PRIMARY KEY,
+            File_id INTEGER NOT NULL,
+            Backup_datetime TEXT,
+            Md5hash TEXT NOT NULL,
+            Size INTEGER,
+            Mtime_ns INTEGER,
+            FOREIGN KEY (File_id) REFERENCES file(File_id)
+        )
+    ''')
+    catalog.execute('''
+        CREATE TRIGGER IF NOT EXISTS file_version_history
+        AFTER UPDATE OF Md5hash ON file
+        WHEN old.Md5hash IS NOT new.Md5hash
+        BEGIN
+            INSERT INTO FileVersion (File_id, Backup_datetime, Md5hash, Size, Mtime_ns)
+            VALUES (old.File_id, old.Last_backup_datetime, old.Md5hash, old.Size, old.Mtime_ns);
+        END
+    ''')
+    if not catalog.fetchone("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_file_path'"):
+        collapse_duplicate_files(catalog)
+        catalog.execute('CREATE UNIQUE INDEX idx_file_path ON file (Directory, Filename)')
+
+
+def collapse_duplicate_files(catalog: Catalog) -> None:
+    """Keep the newest row per (Directory, Filename), move older hashes to FileVersion and repoint their log entries."""
+    catalog.execute('''
+        CREATE TEMP TABLE file_merge AS
+        SELECT file.File_id AS Old_id, newest.Keep_id
+        FROM file
+        JOIN (
+            SELECT Directory, Filename, MAX(File_id) AS Keep_id
+            FROM file
+            GROUP BY Directory, Filename
+            HAVING COUNT(*) > 1
+        ) AS newest ON file.Directory = newest.Directory AND file.Filename = newest.Filename
+        WHERE file.File_id < newest.Keep_id
+    ''')
+    catalog.execute('''
+        INSERT INTO FileVersion (File_id, Backup_datetime, Md5hash, Size, Mtime_ns)
+        SELECT file_merge.Keep_id, file.Last_backup_datetime, file.Md5hash, file.Size, file.Mtime_ns
+        FROM file_merge
+        JOIN file ON file.File_id = file_merge.Old_id
+        ORDER BY file.File_id
+    ''')
+    if catalog.fetchone("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'Logentry'"):
+        catalog.execute('''
+            UPDATE Logentry
+            SET file_id = (SELECT Keep_id FROM file_merge WHERE Old_id = Logentry.file_id)
+            WHERE file_id IN (SELECT Old_id FROM file_merge)
+        ''')
+    catalog.execute('DELETE FROM file WHERE File_id IN (SELECT Old_id FROM file_merge)')
+    catalog.execute('DROP TABLE file_merge')
+
+
+def create_notes_table(catalog: Catalog) -> None:
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS Notes (
+            note_id INTEGER PRIMARY KEY,
+            note_text TEXT NOT NULL,
+            entry_id INTEGER,
+            FOREIGN KEY (entry_id) REFERENCES Logentry(entry_id)
+        )
+    ''')
+
+
+def create_logentry_table(catalog: Catalog) -> None:
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS Logentry (
+            entry_id INTEGER PRIMARY KEY,
+            entry_datetime TEXT NOT NULL,
+            severity_level TEXT NOT NULL,
+            Message TEXT NOT NULL,
+            file_id INTEGER,
+            job_id INTEGER,
+            FOREIGN KEY (file_id) REFERENCES file(File_id),
+            FOREIGN KEY (job_id) REFERENCES BackupJob(Job_id)
+        )
+    ''')
+
+
+def create_backup_job_table(catalog: Catalog) -> None:
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS BackupJob (
+            Job_id INTEGER PRIMARY KEY,
+            Commandline TEXT NOT NULL,
+            Execution_datetime TEXT NOT NULL
+        );
+    ''')
+
+
+def create_base_tables(catalog: Catalog) -> None:
+    create_file_table(catalog)
+    create_notes_table(catalog)
+    create_logentry_table(catalog)
+    create_backup_job_table(catalog)
+
+
+def create_log_indexes(catalog: Catalog) -> None:
+    """Index the columns used by the job, file and dashboard log queries."""
+    catalog.execute('CREATE INDEX IF NOT EXISTS idx_logentry_file_id ON Logentry (file_id)')
+    catalog.execute('CREATE INDEX IF NOT EXISTS idx_logentry_job_id ON Logentry (job_id)')
+    catalog.execute('CREATE INDEX IF NOT EXISTS idx_logentry_entry_datetime ON Logentry (entry_datetime)')
+    catalog.execute('CREATE INDEX IF NOT EXISTS idx_logentry_severity_level ON Logentry (severity_level)')
+    catalog.execute('CREATE INDEX IF NOT EXISTS idx_notes_entry_id ON Notes (entry_id)')
+    # Give the planner row counts so it can choose between the severity and datetime indexes
+    catalog.execute('ANALYZE')
+
+
+def create_block_signature_table(catalog: Catalog) -> None:
+    """Per-file block checksums of the last backed up version, used by delta transfer."""
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS BlockSignature (
+            File_id INTEGER PRIMARY KEY,
+            Block_size INTEGER NOT NULL,
+            Weak BLOB NOT NULL,
+            Strong BLOB NOT NULL,
+            FOREIGN KEY (File_id) REFERENCES file(File_id)
+        )
+    ''')
+
+
+def add_file_storage_columns(catalog: Catalog) -> None:
+    """Record how each file is stored: compression codec (NULL for raw copies) and stored size."""
+    columns = {row[1] for row in catalog.fetchall('PRAGMA table_info(file)')}
+    if "Codec" not in columns:
+        catalog.execute('ALTER TABLE file ADD COLUMN Codec TEXT')
+    if "Stored_size" not in columns:
+        catalog.execute('ALTER TABLE file ADD COLUMN Stored_size INTEGER')
+
+
+def create_snapshot_table(catalog: Catalog) -> None:
+    """One row per snapshot tree, linked to the BackupJob that wrote it."""
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS Snapshot (
+            Snapshot_id INTEGER PRIMARY KEY,
+            Job_id INTEGER,
+            Destination TEXT NOT NULL,
+            Path TEXT NOT NULL,
+            Created_datetime TEXT NOT NULL,
+            FOREIGN KEY (Job_id) REFERENCES BackupJob(Job_id)
+        )
+    ''')
+    catalog.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_destination ON Snapshot (Destination)')
+    catalog.execute('CREATE INDEX IF NOT EXISTS idx_snapshot_job_id ON Snapshot (Job_id)')
+
+
+def create_job_progress_table(catalog: Catalog) -> None:
+    """Journal of the source paths each job has finished, used to resume interrupted jobs."""
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS JobProgress (
+            Job_id INTEGER NOT NULL,
+            Path TEXT NOT NULL,
+            PRIMARY KEY (Job_id, Path),
+            FOREIGN KEY (Job_id) REFERENCES BackupJob(Job_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def create_pack_entry_table(catalog: Catalog) -> None:
+    """Index of the files stored in pack segments: where the latest version of each one is."""
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS PackEntry (
+            File_id INTEGER PRIMARY KEY,
+            Job_id INTEGER,
+            Segment TEXT NOT NULL,
+            Offset INTEGER NOT NULL,
+            Length INTEGER NOT NULL,
+            Md5hash TEXT NOT NULL,
+            FOREIGN KEY (File_id) REFERENCES file(File_id),
+            FOREIGN KEY (Job_id) REFERENCES BackupJob(Job_id)
+        )
+    ''')
+
+
+def create_manifest_table(catalog: Catalog) -> None:
+    """Per-job manifests: the columns of manifest.Manifest as BLOBs, sorted by File_id."""
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS Manifest (
+            Job_id INTEGER PRIMARY KEY,
+            Entries INTEGER NOT NULL,
+            Digest_size INTEGER NOT NULL,
+            Ids BLOB NOT NULL,
+            Sizes BLOB NOT NULL,
+            Mtimes BLOB NOT NULL,
+            Digests BLOB NOT NULL,
+            FOREIGN KEY (Job_id) REFERENCES BackupJob(Job_id)
+        )
+    ''')
+
+
+def add_job_stats_columns(catalog: Catalog) -> None:
+    """Record what each backup job did and how long it took, for estimating the duration of later jobs."""
+    columns = {row[1] for row in catalog.fetchall('PRAGMA table_info(BackupJob)')}
+    for column, column_type in (("Files_scanned", "INTEGER"), ("Files_copied", "INTEGER"), ("Bytes_copied", "INTEGER"), ("Duration_seconds", "REAL")):
+        if column not in columns:
+            catalog.execute(f'ALTER TABLE BackupJob ADD COLUMN {column} {column_type}')
+
+
+def create_destination_file_table(catalog: Catalog) -> None:
+    """Per-destination state for backups to several destinations: which content each destination holds."""
+    catalog.execute('''
+        CREATE TABLE IF NOT EXISTS DestinationFile (
+            Destination TEXT NOT NULL,
+            Directory TEXT NOT NULL,
+            Filename TEXT NOT NULL,
+            Md5hash TEXT NOT NULL,
+            Backup_datetime TEXT,
+            Job_id INTEGER,
+            PRIMARY KEY (Directory, Filename, Destination),
+            FOREIGN KEY (Job_id) REFERENCES BackupJob(Job_id)
+        ) WITHOUT ROWID
+    ''')
+
+
+# (version, description, step); a database at version N has had every step up to N applied
+MIGRATIONS = [
+    (1, "base tables", create_base_tables),
+    (2, "unique file rows with version history", create_file_history),
+    (3, "Logentry and Notes indexes", create_log_indexes),
+    (4, "block signatures for delta transfer", create_block_signature_table),
+    (5, "file codec and stored size", add_file_storage_columns),
+    (6, "snapshot trees per backup job", create_snapshot_table),
+    (7, "progress journal for resuming jobs", create_job_progress_table),
+    (8, "pack segment index for small files", create_pack_entry_table),
+    (9, "binary job manifests", create_manifest_table),
+    (10, "backup job statistics", add_job_stats_columns),
+    (11, "per-destination file state", create_destination_file_table),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(db: Union[str, Catalog]) -> int:
+    with open_catalog(db) as catalog:
+        return catalog.fetchone('PRAGMA user_version')[0]
+
+
+def migrate(db: Union[str, Catalog], target_version: int = SCHEMA_VERSION) -> int:
+    """
+    Bring the database schema up to target_version.
+
+    Args:
+        db (str or Catalog): Database path or an open Catalog.
+        target_version (int): Version to migrate to (default: latest).
+
+    Returns:
+        int: Schema version after migrating.
+    """
+    with open_catalog(db) as catalog:
+        version = get_schema_version(catalog)
+        if version >= target_version:
+            return version
+        for step_version, _, step in MIGRATIONS:
+            if version < step_version <= target_version:
+                step(catalog)
+                catalog.commit()
+                catalog.execute(f'PRAGMA user_version = {step_version}')
+                catalog.commit()
+                version = step_version
+        return version
@@ -0,0 +1,112 @@
+"""
+pipeline.py: Bounded scanner -> workers -> writer pipeline for the backup tool
+
+Items produced by an iterable are consumed on a scanner thread, processed by a pool of worker threads
+and handed back to the calling thread in their original order, so a single thread owns all catalog writes.
+Hashing and file I/O release the GIL, which lets the worker threads overlap disk reads and writes.
+"""
+
+import queue
+import threading
+from typing import Any, Callable, Iterable
+
+_DONE = object()
+
+
+def run_pipeline(
+    items: Iterable,
+    work: Callable[[Any], Any],
+    emit: Callable[[Any], None],
+    workers: int = 1,
+    queue_size: int = 0
+) -> None:
+    """
+    Run work() over items on worker threads and call emit() with each result on the calling thread.
+
+    Results are emitted in the order items were produced. At most queue_size items are in flight
+    between the scanner and emit(), which bounds memory no matter how large the input is.
+
+    Args:
+        items (iterable): Source of work items, consumed lazily on a scanner thread.
+        work (callable): Function run on a worker thread for each item.
+        emit (callable): Function run on the calling thread for each result.
+        workers (int): Number of worker threads. With 1 or less everything runs on the calling thread.
+        queue_size (int): Maximum number of in-flight items (default 4 per worker).
+
+    Raises:
+        Exception: The first error raised by items, work() or emit(), after all threads have stopped.
+    """
+    if workers <= 1:
+        for item in items:
+            emit(work(item))
+        return
+
+    queue_size = queue_size or workers * 4
+    window = threading.Semaphore(queue_size)
+    work_queue = queue.Queue(queue_size + workers)
+    result_queue = queue.Queue()
+    stop = threading.Event()
+    scan_errors = []
+
+    def scan():
+        try:
+            for sequence, item in enumerate(items):
+                window.acquire()
+                if stop.is_set():
+                    break
+                work_queue.put((sequence, item))
+        except BaseException as e:
+            scan_errors.append(e)
+        finally:
+            for _ in range(workers):
+                work_queue.put(_DONE)
+
+    def run_worker():
+        while True:
+            job = work_queue.get()
+            if job is _DONE:
+                result_queue.put(_DONE)
+                return
+            sequence, item = job
+            if stop.is_set():
+                result_queue.put((sequence, None, None))
+                continue
+            try:
+                result_queue.put((sequence, work(item), None))
+            except BaseException as e:
+                result_queue.put((sequence, None, e))
+
+    threads = [threading.Thread(target=scan, name="backup-scanner", daemon=True)]
+    threads += [threading.Thread(target=run_worker, name=f"backup-worker-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+
+    pending = {}
+    next_sequence = 0
+    finished = 0
+    try:
+        while finished < workers:
+            message = result_queue.get()
+            if message is _DONE:
+                finished += 1
+                continue
+            sequence, result, error = message
+            pending[sequence] = (result, error)
+            while next_sequence in pending:
+                result, error = pending.pop(next_sequence)
+                next_sequence += 1
+                window.release()
+                if error is not None:
+                    raise error
+                emit(result)
+    finally:
+        if finished < workers:
+            # Unblock the scanner and let the workers drain without doing more work
+            stop.set()
+            for _ in range(queue_size + 1):
+                window.release()
+        for thread in threads:
+            thread.join()
+
+    if scan_errors:
+        raise scan_errors[0]
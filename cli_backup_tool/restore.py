@@ -0,0 +1,156 @@
+"""
+restore.py: Restoring and verifying backed up files
+
+restore_file puts one file back from the destination, decompressing it if it was stored with a codec,
+and hashes the bytes as they are written. The data goes to a temporary file that is renamed into place,
+so a restore that fails halfway never leaves a truncated file under the real name.
+hash_backup_file computes the same digest without writing anything, for scrubbing the destination.
+restore_packed and hash_packed do the same for a file stored in a pack segment, reading only its extent.
+"""
+
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+from compression import CHUNK_SIZE, iter_decompressed, new_decompressor
+from copier import copy_and_hash
+from hashing import DEFAULT_ALGORITHM, new_hasher
+from pack import read_entry
+from throttle import IOLimiter, ThrottledReader
+
+
+def restore_file(
+    backup_path: str,
+    target_path: str,
+    codec: Optional[str] = None,
+    algorithm: str = DEFAULT_ALGORITHM,
+    chunk_size: int = CHUNK_SIZE
+) -> Tuple[str, int]:
+    """
+    Restore backup_path to target_path and hash the restored content.
+
+    Args:
+        backup_path (str): File in the backup destination.
+        target_path (str): Where to restore it; parent directories are created.
+        codec (str, optional): Codec the backup was compressed with, or None for a plain copy.
+        algorithm (str): Hash algorithm of the catalog digests.
+        chunk_size (int): Number of bytes read, hashed and written at a time.
+
+    Returns:
+        tuple: (hex digest of the restored content, restored size in bytes).
+    """
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    if codec is None:
+        digest = copy_and_hash(backup_path, target_path, algorithm, chunk_size)
+        return digest, os.path.getsize(target_path)
+
+    hasher = new_hasher(algorithm)
+    size = 0
+    with open(backup_path, "rb") as backup:
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or ".", prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as target:
+                for chunk in iter_decompressed(backup, new_decompressor(codec), chunk_size):
+                    hasher.update(chunk)
+                    target.write(chunk)
+                    size += len(chunk)
+            shutil.copystat(backup_path, temp_path)
+            os.replace(temp_path, target_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+    return hasher.hexdigest(), size
+
+
+def hash_backup_file(
+    backup_path: str,
+    codec: Optional[str] = None,
+    algorithm: str = DEFAULT_ALGORITHM,
+    limiter: Optional[IOLimiter] = None,
+    chunk_size: int = CHUNK_SIZE
+) -> Tuple[str, int]:
+    """
+    Hash the original content of a backed up file, decompressing it if needed.
+
+    Args:
+        backup_path (str): File in the backup destination.
+        codec (str, optional): Codec the backup was compressed with, or None for a plain copy.
+        algorithm (str): Hash algorithm of the catalog digests.
+        limiter (IOLimiter, optional): Budget every read of backup_path is charged against.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        tuple: (hex digest of the original content, original size in bytes).
+    """
+    hasher = new_hasher(algorithm)
+    size = 0
+    with open(backup_path, "rb", buffering=0) as raw:
+        backup = ThrottledReader(raw, limiter) if limiter else raw
+        if codec is None:
+            chunks = iter(lambda: backup.read(chunk_size), b"")
+        else:
+            chunks = iter_decompressed(backup, new_decompressor(codec), chunk_size)
+        for chunk in chunks:
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def restore_packed(
+    segment_path: str,
+    offset: int,
+    length: int,
+    target_path: str,
+    algorithm: str = DEFAULT_ALGORITHM,
+    mtime_ns: Optional[int] = None
+) -> Tuple[str, int]:
+    """
+    Restore one file from a pack segment to target_path and hash the restored content.
+
+    Packs keep no file metadata, so the modification time comes from the catalog.
+
+    Args:
+        segment_path (str): Pack segment in the backup destination.
+        offset (int): Offset of the file in the segment.
+        length (int): Size of the file.
+        target_path (str): Where to restore it; parent directories are created.
+        algorithm (str): Hash algorithm of the catalog digests.
+        mtime_ns (int, optional): Modification time to set on the restored file.
+
+    Returns:
+        tuple: (hex digest of the restored content, restored size in bytes).
+    """
+    data = read_entry(segment_path, offset, length)
+    os.makedirs(os.path.dirname(target_path) or ".", exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target_path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            target.write(data)
+        if mtime_ns is not None:
+            os.utime(temp_path, ns=(mtime_ns, mtime_ns))
+        os.replace(temp_path, target_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    hasher = new_hasher(algorithm)
+    hasher.update(data)
+    return hasher.hexdigest(), len(data)
+
+
+def hash_packed(
+    segment_path: str,
+    offset: int,
+    length: int,
+    algorithm: str = DEFAULT_ALGORITHM,
+    limiter: Optional[IOLimiter] = None
+) -> Tuple[str, int]:
+    """Hash one file in a pack segment, charging the read against limiter; returns (hex digest, size)."""
+    if limiter:
+        limiter.acquire(length)
+    hasher = new_hasher(algorithm)
+    data = read_entry(segment_path, offset, length)
+    hasher.update(data)
+    return hasher.hexdigest(), len(data)
@@ -0,0 +1,84 @@
+"""
+snapshot.py: Dated snapshot trees with hardlinks to unchanged files
+
+Every backup job in snapshot mode writes a complete tree under snapshots/<date>_job<id> in the destination.
+Changed files are copied into the new tree, while unchanged files are hardlinked to their copy in the
+previous snapshot, so each restore point costs only the changed bytes plus directory entries.
+"""
+
+import os
+from datetime import datetime
+from typing import Optional
+
+from copier import copy_file
+from throttle import Throttle
+
+SNAPSHOTS_DIR = "snapshots"
+
+
+def snapshot_dir(destination_dir: str, job_id: Optional[int], created: datetime) -> str:
+    name = created.strftime("%Y-%m-%d_%H%M%S")
+    if job_id is not None:
+        name += f"_job{job_id}"
+    return os.path.join(destination_dir, SNAPSHOTS_DIR, name)
+
+
+def find_snapshot_dir(destination_dir: str, job_id: int) -> Optional[str]:
+    """Return the existing snapshot tree of job_id, e.g. to resume an interrupted job, or None."""
+    snapshots_dir = os.path.join(destination_dir, SNAPSHOTS_DIR)
+    if not os.path.isdir(snapshots_dir):
+        return None
+    names = sorted(name for name in os.listdir(snapshots_dir) if name.endswith(f"_job{job_id}"))
+    return os.path.join(snapshots_dir, names[-1]) if names else None
+
+
+def unlink_existing(path: str) -> None:
+    """
+    Remove path if it exists, so the next write creates a new file.
+
+    A tree being resumed may already hold a hardlink to the previous snapshot at path. Opening that
+    path for writing would change the previous snapshot's copy as well.
+    """
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def link_unchanged(
+    previous_path: Optional[str],
+    path: str,
+    source_path: str,
+    file_stat: os.stat_result,
+    copy_engine: str = "auto",
+    throttle: Optional[Throttle] = None
+) -> bool:
+    """
+    Put an unchanged file into a snapshot tree, hardlinking it to the previous snapshot when possible.
+
+    The previous copy is only reused if it still has the source's size and mtime (copies preserve both),
+    so a previous snapshot that was edited or only partly written is never linked. Otherwise, or when
+    the filesystem refuses the link, the source is copied.
+
+    Args:
+        previous_path (str, optional): Path of the file in the previous snapshot, or None.
+        path (str): Path of the file in the new snapshot.
+        source_path (str): File being backed up.
+        file_stat (os.stat_result): Stat of the source file.
+        copy_engine (str): Engine passed to copier.copy_file when the file has to be copied.
+        throttle (Throttle, optional): Budgets passed to copier.copy_file.
+
+    Returns:
+        bool: True if the file was hardlinked, False if it was copied.
+    """
+    unlink_existing(path)
+    if previous_path is not None:
+        try:
+            previous_stat = os.stat(previous_path)
+            if previous_stat.st_size == file_stat.st_size and previous_stat.st_mtime_ns == file_stat.st_mtime_ns:
+                os.link(previous_path, path)
+                return True
+        except OSError:
+            pass
+    copy_file(source_path, path, copy_engine, throttle)
+    return False
@@ -0,0 +1,806 @@
+# test_backup.py
+import hashlib
+import json
+import os
+import sqlite3
+
+import pytest
+
+import backup
+import hashcache
+import migrations
+from compression import decompress_file, parse_policy
+from filters import EXCLUDE, INCLUDE, compile_filter
+from hashcache import HashCache
+from backup import (
+    setup_logger,
+    create_database,
+    create_logentry_table,
+    create_backup_job_table,
+    backup_files,
+)
+
+
+@pytest.fixture
+def logger(tmp_path):
+    return setup_logger(tmp_path / "test_backup.log", verbose=False, db_name=tmp_path / "test_db.db")
+
+@pytest.fixture
+def backup_env(tmp_path):
+    source_dir = tmp_path / "test_source"
+    destination_dir = tmp_path / "test_destination"
+    db_name = tmp_path / "test_db.db"
+    os.makedirs(source_dir)
+    (source_dir / "test_file.txt").write_bytes(b"Test file content")
+
+    create_database(db_name)
+    create_logentry_table(db_name)
+    create_backup_job_table(db_name)
+    return str(source_dir), str(destination_dir), db_name
+
+def count_hashes(monkeypatch):
+    calls = []
+    original = backup.get_md5_hash
+
+    def counting_hash(*args, **kwargs):
+        calls.append(args[0])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(backup, "get_md5_hash", counting_hash)
+    return calls
+
+def test_backup_files_records_stat(backup_env, logger):
+    source_dir, destination_dir, db_name = backup_env
+
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1)
+
+    source_stat = os.stat(os.path.join(source_dir, "test_file.txt"))
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT Size, Mtime_ns, Inode, Device FROM file WHERE Filename = ?', ("test_file.txt",))
+    result = cursor.fetchone()
+    conn.close()
+
+    assert result == (source_stat.st_size, source_stat.st_mtime_ns, source_stat.st_ino, source_stat.st_dev)
+    assert open(os.path.join(destination_dir, "test_file.txt"), "rb").read() == b"Test file content"
+
+def test_backup_files_skips_hashing_unchanged_files(backup_env, logger, monkeypatch):
+    source_dir, destination_dir, db_name = backup_env
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1)
+
+    calls = count_hashes(monkeypatch)
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=2)
+
+    assert calls == []
+
+def test_backup_files_paranoid_hashes_unchanged_files(backup_env, logger, monkeypatch):
+    source_dir, destination_dir, db_name = backup_env
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1)
+
+    calls = count_hashes(monkeypatch)
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=2, paranoid=True)
+
+    assert len(calls) == 1
+
+def test_backup_files_copies_modified_file(backup_env, logger):
+    source_dir, destination_dir, db_name = backup_env
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1)
+
+    with open(os.path.join(source_dir, "test_file.txt"), "wb") as f:
+        f.write(b"Modified content")
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=2)
+
+    assert open(os.path.join(destination_dir, "test_file.txt"), "rb").read() == b"Modified content"
+
+def test_create_database_builds_current_schema(tmp_path):
+    db_name = tmp_path / "test_db.db"
+    create_database(db_name)
+
+    assert migrations.get_schema_version(db_name) == migrations.SCHEMA_VERSION
+    conn = sqlite3.connect(db_name)
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    assert {"file", "BlockSignature", "Snapshot", "PackEntry", "Manifest", "DestinationFile"} <= tables
+
+def test_create_database_adds_stat_columns_to_old_schema(tmp_path):
+    db_name = tmp_path / "old_db.db"
+    conn = sqlite3.connect(db_name)
+    conn.execute('''
+        CREATE TABLE file (
+            File_id INTEGER PRIMARY KEY,
+            Directory TEXT NOT NULL,
+            Filename TEXT NOT NULL,
+            Last_backup_datetime TEXT,
+            Md5hash TEXT NOT NULL
+        )
+    ''')
+    conn.close()
+
+    create_database(db_name)
+
+    conn = sqlite3.connect(db_name)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(file)')}
+    conn.close()
+    assert {"Size", "Mtime_ns", "Inode", "Device"} <= columns
+
+def test_backup_files_mirrors_subdirectories(backup_env, logger):
+    source_dir, destination_dir, db_name = backup_env
+    nested_dir = os.path.join(source_dir, "sub", "nested")
+    os.makedirs(nested_dir)
+    with open(os.path.join(nested_dir, "deep.txt"), "wb") as f:
+        f.write(b"deep")
+
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1)
+
+    assert open(os.path.join(destination_dir, "sub", "nested", "deep.txt"), "rb").read() == b"deep"
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT Directory FROM file WHERE Filename = ?', ("deep.txt",))
+    result = cursor.fetchone()
+    cursor.execute("SELECT COUNT(*) FROM Logentry WHERE severity_level = 'WARNING'")
+    warnings = cursor.fetchone()[0]
+    conn.close()
+    assert result == (nested_dir,)
+    assert warnings == 0
+
+def test_backup_files_parallel_matches_sequential(tmp_path, logger):
+    results = []
+    for workers in (1, 4):
+        source_dir = tmp_path / f"run{workers}" / "source"
+        for i in range(20):
+            file_dir = source_dir / f"dir_{i % 3}"
+            file_dir.mkdir(parents=True, exist_ok=True)
+            (file_dir / f"file_{i}.txt").write_bytes(f"content {i}".encode())
+        db_name = tmp_path / f"db_{workers}.db"
+        create_database(db_name)
+        create_logentry_table(db_name)
+
+        backup_files(str(source_dir), str(tmp_path / f"run{workers}" / "destination"), db_name, logger, job_id=1, workers=workers)
+
+        conn = sqlite3.connect(db_name)
+        cursor = conn.cursor()
+        cursor.execute('SELECT Filename, Md5hash FROM file ORDER BY File_id')
+        files = cursor.fetchall()
+        cursor.execute('SELECT severity_level, replace(Message, ?, ?), file_id FROM Logentry ORDER BY entry_id', (f"run{workers}", "runN"))
+        logs = cursor.fetchall()
+        conn.close()
+        results.append((files, logs))
+
+    assert len(results[0][0]) == 20
+    assert results[0] == results[1]
+
+def test_insert_file_info_keeps_one_row_per_path(tmp_path):
+    db_name = tmp_path / "test_db.db"
+    create_database(db_name)
+
+    first_id = backup.insert_file_info(db_name, "test_directory", "test_file.txt", "2022-01-01 12:00:00", "old_hash")
+    second_id = backup.insert_file_info(db_name, "test_directory", "test_file.txt", "2022-01-02 12:00:00", "new_hash")
+
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT File_id, Md5hash FROM file')
+    files = cursor.fetchall()
+    cursor.execute('SELECT File_id, Backup_datetime, Md5hash FROM FileVersion')
+    versions = cursor.fetchall()
+    conn.close()
+
+    assert first_id == second_id
+    assert files == [(first_id, "new_hash")]
+    assert versions == [(first_id, "2022-01-01 12:00:00", "old_hash")]
+
+def test_create_database_collapses_duplicate_rows(tmp_path):
+    db_name = tmp_path / "old_db.db"
+    conn = sqlite3.connect(db_name)
+    conn.execute('''
+        CREATE TABLE file (
+            File_id INTEGER PRIMARY KEY,
+            Directory TEXT NOT NULL,
+            Filename TEXT NOT NULL,
+            Last_backup_datetime TEXT,
+            Md5hash TEXT NOT NULL
+        )
+    ''')
+    conn.executemany('INSERT INTO file (Directory, Filename, Last_backup_datetime, Md5hash) VALUES (?, ?, ?, ?)', [
+        ("dir", "a.txt", "2022-01-01", "hash_1"),
+        ("dir", "b.txt", "2022-01-01", "hash_b"),
+        ("dir", "a.txt", "2022-01-02", "hash_2"),
+        ("dir", "a.txt", "2022-01-03", "hash_3"),
+    ])
+    conn.commit()
+    conn.close()
+    create_logentry_table(db_name)
+    backup.insert_log_entry(db_name, "2022-01-01", "INFO", "copied", file_id=1, job_id=1)
+
+    create_database(db_name)
+
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT File_id, Filename, Md5hash FROM file ORDER BY File_id')
+    files = cursor.fetchall()
+    cursor.execute('SELECT File_id, Md5hash FROM FileVersion ORDER BY Version_id')
+    versions = cursor.fetchall()
+    cursor.execute('SELECT file_id FROM Logentry')
+    log_file_ids = cursor.fetchall()
+    conn.close()
+
+    assert files == [(2, "b.txt", "hash_b"), (4, "a.txt", "hash_3")]
+    assert versions == [(4, "hash_1"), (4, "hash_2")]
+    assert log_file_ids == [(4,)]
+    conn = sqlite3.connect(db_name)
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute('INSERT INTO file (Directory, Filename, Md5hash) VALUES (?, ?, ?)', ("dir", "a.txt", "hash_4"))
+    conn.close()
+
+def test_backup_files_cas_stores_identical_content_once(backup_env, logger):
+    source_dir, destination_dir, db_name = backup_env
+    for directory in ("a", "b"):
+        os.makedirs(os.path.join(source_dir, directory))
+        with open(os.path.join(source_dir, directory, "same.txt"), "wb") as f:
+            f.write(b"shared content")
+
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=7, store="cas")
+
+    tree = os.path.join(destination_dir, "jobs", "7")
+    first = os.path.join(tree, "a", "same.txt")
+    second = os.path.join(tree, "b", "same.txt")
+    assert os.path.samefile(first, second)
+    assert open(os.path.join(tree, "test_file.txt"), "rb").read() == b"Test file content"
+    blobs = [name for _, _, names in os.walk(os.path.join(destination_dir, "objects")) for name in names]
+    assert len(blobs) == 2
+
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Logentry WHERE Message LIKE '%DEDUPLICATED'")
+    deduplicated = cursor.fetchone()[0]
+    conn.close()
+    assert deduplicated == 1
+
+def test_backup_files_cas_links_unchanged_files_into_new_job(backup_env, logger, monkeypatch):
+    source_dir, destination_dir, db_name = backup_env
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1, store="cas")
+
+    calls = count_hashes(monkeypatch)
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=2, store="cas")
+
+    assert calls == []
+    assert os.path.samefile(
+        os.path.join(destination_dir, "jobs", "1", "test_file.txt"),
+        os.path.join(destination_dir, "jobs", "2", "test_file.txt"),
+    )
+
+def test_backup_files_delta_updates_changed_blocks(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    content = bytearray(os.urandom(3 * 1024 * 1024))
+    (source_dir / "large.bin").write_bytes(content)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, delta=True, delta_min_size=1024)
+    content[1024 * 1024 + 5] ^= 0xFF
+    (source_dir / "large.bin").write_bytes(content)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2, delta=True, delta_min_size=1024)
+
+    assert (destination_dir / "large.bin").read_bytes() == bytes(content)
+    log = open(tmp_path / "test_backup.log").read()
+    assert "Delta transfer: 1 files, 1048576 of 3145728 bytes written" in log
+
+def test_backup_files_delta_after_full_copy_does_not_use_stale_signature(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    block = 1024 * 1024
+    original = os.urandom(3 * block)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    (source_dir / "large.bin").write_bytes(original)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, delta=True, delta_min_size=1024)
+
+    # A full copy rewrites block 1; the next delta run restores it and changes block 2
+    (source_dir / "large.bin").write_bytes(original[:block] + os.urandom(block) + original[2 * block:])
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2)
+    final = original[:2 * block] + os.urandom(block)
+    (source_dir / "large.bin").write_bytes(final)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=3, delta=True, delta_min_size=1024)
+
+    assert (destination_dir / "large.bin").read_bytes() == final
+
+def test_backup_files_compresses_by_policy(backup_env, logger):
+    source_dir, destination_dir, db_name = backup_env
+    with open(os.path.join(source_dir, "photo.jpg"), "wb") as f:
+        f.write(b"jpeg data")
+    migrations.migrate(db_name)
+
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1, compression=parse_policy("zlib"))
+
+    compressed = os.path.join(destination_dir, "test_file.txt.zz")
+    assert decompress_file(compressed, os.path.join(destination_dir, "restored.txt"), "zlib") == len(b"Test file content")
+    assert open(os.path.join(destination_dir, "photo.jpg"), "rb").read() == b"jpeg data"
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT Filename, Codec, Stored_size FROM file ORDER BY Filename')
+    files = cursor.fetchall()
+    conn.close()
+    assert files == [("photo.jpg", None, None), ("test_file.txt", "zlib", os.path.getsize(compressed))]
+
+def test_backup_files_snapshot_links_unchanged_files(backup_env, logger):
+    source_dir, destination_dir, db_name = backup_env
+    with open(os.path.join(source_dir, "changing.txt"), "wb") as f:
+        f.write(b"version 1")
+    migrations.migrate(db_name)
+
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1, store="snapshot")
+    with open(os.path.join(source_dir, "changing.txt"), "wb") as f:
+        f.write(b"version 2")
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=2, store="snapshot")
+
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT Job_id, Path FROM Snapshot ORDER BY Snapshot_id')
+    snapshots = cursor.fetchall()
+    conn.close()
+    assert [job_id for job_id, _ in snapshots] == [1, 2]
+    first, second = (path for _, path in snapshots)
+    assert first.endswith("_job1") and second.endswith("_job2")
+    assert os.path.samefile(os.path.join(first, "test_file.txt"), os.path.join(second, "test_file.txt"))
+    assert open(os.path.join(first, "changing.txt"), "rb").read() == b"version 1"
+    assert open(os.path.join(second, "changing.txt"), "rb").read() == b"version 2"
+
+def test_backup_files_single_pass_reads_changed_files_once(backup_env, logger, monkeypatch):
+    source_dir, destination_dir, db_name = backup_env
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1, single_pass=True)
+    with open(os.path.join(source_dir, "test_file.txt"), "wb") as f:
+        f.write(b"Modified content")
+
+    calls = count_hashes(monkeypatch)
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=2, single_pass=True)
+
+    assert calls == []
+    assert open(os.path.join(destination_dir, "test_file.txt"), "rb").read() == b"Modified content"
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT Md5hash FROM file WHERE Filename = ?', ("test_file.txt",))
+    result = cursor.fetchone()
+    conn.close()
+    assert result == (hashlib.md5(b"Modified content").hexdigest(),)
+
+def test_backup_files_resume_skips_journaled_files_and_redoes_partial_copies(tmp_path, logger, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for i in range(6):
+        (source_dir / f"file_{i}.txt").write_bytes(f"content {i}".encode() * 100)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    original_process_file = backup.process_file
+    processed = []
+
+    def interrupted_process_file(entry, *args, **kwargs):
+        if len(processed) == 3:
+            raise KeyboardInterrupt
+        processed.append(entry.name)
+        return original_process_file(entry, *args, **kwargs)
+
+    monkeypatch.setattr(backup, "process_file", interrupted_process_file)
+    with pytest.raises(KeyboardInterrupt):
+        backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1)
+    monkeypatch.setattr(backup, "process_file", original_process_file)
+
+    assert backup.get_journal(db_name, 1) == {str(source_dir / name) for name in processed}
+    with open(destination_dir / processed[0], "r+b") as f:
+        f.truncate(10)
+
+    calls = count_hashes(monkeypatch)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, resume=True)
+
+    assert sorted(os.path.basename(path) for path in calls) == sorted({f"file_{i}.txt" for i in range(6)} - set(processed[1:]))
+    for i in range(6):
+        assert (destination_dir / f"file_{i}.txt").read_bytes() == f"content {i}".encode() * 100
+    assert backup.get_journal(db_name, 1) == set()
+    assert "Resumed job 1: 2 files already done were skipped" in open(tmp_path / "test_backup.log").read()
+
+def test_backup_files_resume_does_not_repack_journaled_files(tmp_path, logger, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for i in range(6):
+        (source_dir / f"file_{i}.txt").write_bytes(f"content {i}".encode() * 10)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    original_process_file = backup.process_file
+    processed = []
+
+    def interrupted_process_file(entry, *args, **kwargs):
+        if len(processed) == 3:
+            raise KeyboardInterrupt
+        processed.append(entry.name)
+        return original_process_file(entry, *args, **kwargs)
+
+    monkeypatch.setattr(backup, "process_file", interrupted_process_file)
+    with pytest.raises(KeyboardInterrupt):
+        backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, pack_threshold=4096)
+    monkeypatch.setattr(backup, "process_file", original_process_file)
+
+    resumed = []
+
+    def recording_process_file(entry, *args, **kwargs):
+        resumed.append(entry.name)
+        return original_process_file(entry, *args, **kwargs)
+
+    monkeypatch.setattr(backup, "process_file", recording_process_file)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, pack_threshold=4096, resume=True)
+
+    assert sorted(resumed) == sorted({f"file_{i}.txt" for i in range(6)} - set(processed))
+    packed = sum(os.path.getsize(path) for path in (destination_dir / "packs").iterdir())
+    assert packed == sum(os.path.getsize(source_dir / f"file_{i}.txt") for i in range(6))
+
+def test_resumed_copy_of_packed_file_drops_pack_entry(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    (source_dir / "a.txt").write_bytes(b"small")
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, pack_threshold=4096)
+
+    # The file outgrows the threshold and a stale copy makes the resumed job see a partial write
+    (source_dir / "a.txt").write_bytes(b"large" * 2000)
+    (destination_dir / "a.txt").write_bytes(b"stale")
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2, pack_threshold=4096, resume=True)
+
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*) FROM PackEntry").fetchone()[0] == 0
+    conn.close()
+    items = backup.get_restore_items(db_name, str(source_dir), str(destination_dir))
+    assert [item.pack for item in items] == [None]
+    assert (destination_dir / "a.txt").read_bytes() == b"large" * 2000
+
+def test_resumed_snapshot_does_not_write_through_links_to_previous_snapshot(tmp_path, logger, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for name in ("a.txt", "b.txt"):
+        (source_dir / name).write_bytes(b"v1")
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, store="snapshot")
+    first_snapshot = backup.get_latest_snapshot(db_name, str(destination_dir))
+
+    original_process_file = backup.process_file
+    processed = []
+
+    def interrupted_process_file(entry, *args, **kwargs):
+        if processed:
+            raise KeyboardInterrupt
+        processed.append(entry.name)
+        return original_process_file(entry, *args, **kwargs)
+
+    monkeypatch.setattr(backup, "process_file", interrupted_process_file)
+    with pytest.raises(KeyboardInterrupt):
+        backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2, store="snapshot")
+    monkeypatch.setattr(backup, "process_file", original_process_file)
+
+    # The file linked into the interrupted tree changes before the job is resumed
+    (source_dir / processed[0]).write_bytes(b"v2-changed")
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2, store="snapshot", resume=True)
+
+    second_snapshot = backup.get_latest_snapshot(db_name, str(destination_dir))
+    assert second_snapshot != first_snapshot
+    assert open(os.path.join(first_snapshot, processed[0]), "rb").read() == b"v1"
+    assert open(os.path.join(second_snapshot, processed[0]), "rb").read() == b"v2-changed"
+
+def test_backup_files_paths_only_processes_selected_files(backup_env, logger, monkeypatch):
+    source_dir, destination_dir, db_name = backup_env
+    with open(os.path.join(source_dir, "other.txt"), "wb") as f:
+        f.write(b"other")
+
+    calls = count_hashes(monkeypatch)
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1, paths={"other.txt"})
+
+    assert [os.path.basename(path) for path in calls] == ["other.txt"]
+    assert os.listdir(destination_dir) == ["other.txt"]
+
+def test_backup_files_paranoid_does_not_trust_hash_cache(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    path = source_dir / "same_stat.txt"
+    path.write_bytes(b"original")
+    os.utime(path, ns=(1_600_000_000_000_000_000,) * 2)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    with HashCache(str(tmp_path / "cache.db")) as cache:
+        backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, hash_cache=cache, paranoid=True)
+        # Same size, mtime and inode, different content
+        path.write_bytes(b"modified")
+        os.utime(path, ns=(1_600_000_000_000_000_000,) * 2)
+        backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2, hash_cache=cache, paranoid=True)
+
+    assert (destination_dir / "same_stat.txt").read_bytes() == b"modified"
+
+def test_backup_files_hash_cache_shared_across_catalogs(tmp_path, logger, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    (source_dir / "shared.txt").write_bytes(b"shared content")
+    os.utime(source_dir / "shared.txt", ns=(1_600_000_000_000_000_000,) * 2)
+    reads = []
+    original = hashcache.hash_file
+    monkeypatch.setattr(hashcache, "hash_file", lambda path, *args, **kwargs: reads.append(path) or original(path, *args, **kwargs))
+
+    for name in ("first", "second"):
+        db_name = tmp_path / f"{name}.db"
+        migrations.migrate(db_name)
+        with HashCache(str(tmp_path / "hashcache.db")) as hash_cache:
+            backup_files(str(source_dir), str(tmp_path / name), db_name, logger, job_id=1, hash_cache=hash_cache)
+
+    assert len(reads) == 1
+    assert (tmp_path / "second" / "shared.txt").read_bytes() == b"shared content"
+    assert "Hash cache: 1 hits, 0 misses" in open(tmp_path / "test_backup.log").read()
+
+def test_restore_files_restores_and_verifies(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    for i in range(12):
+        file_dir = source_dir / f"dir_{i % 3}"
+        file_dir.mkdir(parents=True, exist_ok=True)
+        (file_dir / f"file_{i}.txt").write_bytes(f"content {i}".encode() * 50)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, compression=parse_policy(None, [".txt=zlib"]))
+    (destination_dir / "dir_0" / "file_3.txt.zz").unlink()
+
+    totals = backup.restore_files(str(source_dir), str(destination_dir), str(tmp_path / "target"), db_name, logger, job_id=2, workers=4)
+
+    assert (totals["restored"], totals["missing"], totals["mismatch"]) == (11, 1, 0)
+    for i in range(12):
+        if i != 3:
+            assert (tmp_path / "target" / f"dir_{i % 3}" / f"file_{i}.txt").read_bytes() == f"content {i}".encode() * 50
+    conn = sqlite3.connect(db_name)
+    errors = conn.execute("SELECT Message FROM Logentry WHERE severity_level = 'ERROR' AND job_id = 2").fetchall()
+    conn.close()
+    assert len(errors) == 1 and "Backup file is missing" in errors[0][0]
+
+def test_restore_items_match_source_dir_case_sensitively(tmp_path, logger):
+    for name in ("src", "SRC"):
+        (tmp_path / name / "sub").mkdir(parents=True)
+        (tmp_path / name / "sub" / f"{name}.txt").write_text(name)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    backup_files(str(tmp_path / "SRC"), str(destination_dir / "upper"), db_name, logger, job_id=1)
+    backup_files(str(tmp_path / "src"), str(destination_dir / "lower"), db_name, logger, job_id=2)
+
+    items = list(backup.get_restore_items(db_name, str(tmp_path / "src") + os.sep, str(destination_dir / "lower")))
+
+    assert [item.relative_path for item in items] == [os.path.join("sub", "src.txt")]
+
+def test_restore_files_job_tree_and_mismatch(backup_env, logger):
+    source_dir, destination_dir, db_name = backup_env
+    migrations.migrate(db_name)
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=1, store="cas")
+    with open(os.path.join(source_dir, "test_file.txt"), "wb") as f:
+        f.write(b"Modified content")
+    backup_files(source_dir, destination_dir, db_name, logger, job_id=2, store="cas")
+    target_dir = os.path.join(os.path.dirname(destination_dir), "target")
+
+    totals = backup.restore_files(source_dir, destination_dir, target_dir, db_name, logger, store="cas", restore_job=1)
+
+    assert totals["restored"] == 1
+    assert open(os.path.join(target_dir, "test_file.txt"), "rb").read() == b"Test file content"
+
+    blob = os.path.join(destination_dir, "jobs", "2", "test_file.txt")
+    os.chmod(blob, 0o644)
+    with open(blob, "r+b") as f:
+        f.write(b"X")
+    totals = backup.restore_files(source_dir, destination_dir, target_dir, db_name, logger, store="cas")
+    assert (totals["restored"], totals["mismatch"]) == (0, 1)
+
+def test_verify_files_reports_corruption(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for i in range(5):
+        (source_dir / f"file_{i}.txt").write_bytes(f"content {i}".encode() * 100)
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, compression=parse_policy(None, ["file_0.txt=zlib"]))
+
+    totals = backup.verify_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2, workers=2)
+    assert (totals["verified"], totals["mismatch"], totals["missing"]) == (5, 0, 0)
+
+    with open(destination_dir / "file_4.txt", "r+b") as f:
+        f.write(b"X")
+    totals = backup.verify_files(str(source_dir), str(destination_dir), db_name, logger, job_id=3, workers=2,
+                                 max_read_bps=1024 * 1024, max_iops=1000)
+    assert (totals["verified"], totals["mismatch"]) == (4, 1)
+    conn = sqlite3.connect(db_name)
+    errors = conn.execute("SELECT Message FROM Logentry WHERE severity_level = 'ERROR' AND job_id = 3").fetchall()
+    summary = conn.execute("SELECT Message FROM Logentry WHERE Message LIKE 'Verify:%' AND job_id = 3").fetchone()
+    conn.close()
+    assert len(errors) == 1 and "file_4.txt" in errors[0][0] and "HASH MISMATCH" in errors[0][0]
+    assert "throttled" in summary[0]
+
+def test_backup_files_throttles_and_reports(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for i in range(4):
+        (source_dir / f"file_{i}.bin").write_bytes(os.urandom(64 * 1024))
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+
+    backup_files(str(source_dir), str(tmp_path / "destination"), db_name, logger, job_id=1, workers=2,
+                 max_read_bps=1024 * 1024, max_write_bps=512 * 1024)
+
+    for i in range(4):
+        assert (tmp_path / "destination" / f"file_{i}.bin").read_bytes() == (source_dir / f"file_{i}.bin").read_bytes()
+    log = open(tmp_path / "test_backup.log").read()
+    assert "Throttling:" in log and "for the write budget" in log
+
+def test_backup_files_packs_small_files(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    for i in range(20):
+        file_dir = source_dir / f"dir_{i % 4}"
+        file_dir.mkdir(parents=True, exist_ok=True)
+        (file_dir / f"small_{i}.txt").write_bytes(f"small {i}".encode())
+    (source_dir / "large.bin").write_bytes(os.urandom(10_000))
+    destination_dir = tmp_path / "destination"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=1, workers=3, pack_threshold=1024)
+
+    assert not (destination_dir / "dir_0" / "small_0.txt").exists()
+    assert (destination_dir / "large.bin").read_bytes() == (source_dir / "large.bin").read_bytes()
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*) FROM PackEntry").fetchone()[0] == 20
+    conn.close()
+
+    # A small file that grows past the threshold moves out of the pack
+    (source_dir / "dir_1" / "small_1.txt").write_bytes(b"y" * 5000)
+    (source_dir / "dir_2" / "small_2.txt").write_bytes(b"changed")
+    backup_files(str(source_dir), str(destination_dir), db_name, logger, job_id=2, pack_threshold=1024)
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*) FROM PackEntry").fetchone()[0] == 19
+    assert conn.execute("SELECT Job_id FROM PackEntry JOIN file USING (File_id) WHERE Filename = 'small_2.txt'").fetchone() == (2,)
+    conn.close()
+
+    target_dir = tmp_path / "target"
+    totals = backup.restore_files(str(source_dir), str(destination_dir), str(target_dir), db_name, logger, workers=2)
+    assert (totals["restored"], totals["mismatch"], totals["missing"]) == (21, 0, 0)
+    for path in source_dir.rglob("*"):
+        if path.is_file():
+            restored = target_dir / path.relative_to(source_dir)
+            assert restored.read_bytes() == path.read_bytes()
+            assert restored.stat().st_mtime_ns == path.stat().st_mtime_ns
+
+    assert backup.verify_files(str(source_dir), str(destination_dir), db_name, logger)["verified"] == 21
+
+def test_diff_jobs_lists_changes_between_manifests(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for name in ("keep.txt", "edit.txt", "drop.txt"):
+        (source_dir / name).write_bytes(name.encode())
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    backup_files(str(source_dir), str(tmp_path / "destination"), db_name, logger, job_id=1)
+
+    (source_dir / "edit.txt").write_bytes(b"edited")
+    (source_dir / "drop.txt").unlink()
+    (source_dir / "new.txt").write_bytes(b"new")
+    backup_files(str(source_dir), str(tmp_path / "destination"), db_name, logger, job_id=2)
+
+    diff = backup.diff_jobs(db_name, 1, 2, logger)
+    conn = sqlite3.connect(db_name)
+    names = lambda ids: [conn.execute("SELECT Filename FROM file WHERE File_id = ?", (i,)).fetchone()[0] for i in ids]
+    assert (names(diff.added), names(diff.changed), names(diff.removed)) == (["new.txt"], ["edit.txt"], ["drop.txt"])
+    conn.close()
+    backup.flush_queued_logging(logger)
+    assert "REMOVED - " + str(source_dir / "drop.txt") in open(tmp_path / "test_backup.log").read()
+    assert backup.diff_jobs(db_name, 1, 3, logger) is None
+
+def test_job_stats_add_up_over_watch_batches(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for i in range(3):
+        (source_dir / f"file_{i}.txt").write_bytes(b"x" * 1000)
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    job_id = backup.insert_backup_job(db_name, "backup.py", "2026-01-01 00:00:00")
+    backup_files(str(source_dir), str(tmp_path / "destination"), db_name, logger, job_id=job_id)
+    (source_dir / "file_0.txt").write_bytes(b"y" * 500)
+    backup_files(str(source_dir), str(tmp_path / "destination"), db_name, logger, job_id=job_id, paths={"file_0.txt"})
+
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT Files_scanned, Files_copied, Bytes_copied FROM BackupJob").fetchone() == (4, 4, 3500)
+    conn.close()
+
+def test_plan_backup_uses_stat_fast_path_and_history(tmp_path, logger, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for i in range(4):
+        (source_dir / f"file_{i}.txt").write_bytes(b"x" * 1000)
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    job_id = backup.insert_backup_job(db_name, "backup.py", "2026-01-01 00:00:00")
+    backup_files(str(source_dir), str(tmp_path / "destination"), db_name, logger, job_id=job_id)
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT Files_scanned, Files_copied, Bytes_copied FROM BackupJob").fetchone() == (4, 4, 4000)
+    conn.close()
+
+    (source_dir / "file_0.txt").write_bytes(b"y" * 3000)
+    (source_dir / "new.txt").write_bytes(b"z" * 500)
+    hashes = count_hashes(monkeypatch)
+    plan = backup.plan_backup(str(source_dir), db_name, logger, json_path=str(tmp_path / "plan.json"))
+
+    assert hashes == []
+    assert (plan["files"], plan["new"], plan["changed"], plan["unchanged"]) == (5, 1, 1, 3)
+    assert (plan["bytes_to_copy"], plan["bytes_total"]) == (3500, 6500)
+    assert plan["throughput_bps"] > 0 and plan["estimated_seconds"] is not None
+    assert json.load(open(tmp_path / "plan.json")) == plan
+
+def test_backup_files_applies_filter_during_walk(tmp_path, logger, monkeypatch):
+    source_dir = tmp_path / "source"
+    (source_dir / ".git" / "objects").mkdir(parents=True)
+    (source_dir / ".git" / "objects" / "ab").write_bytes(b"object")
+    (source_dir / "src").mkdir()
+    (source_dir / "src" / "app.py").write_bytes(b"print()")
+    (source_dir / "src" / "app.pyc").write_bytes(b"bytecode")
+    (source_dir / "debug.log").write_bytes(b"log")
+    (source_dir / "keep.log").write_bytes(b"keep")
+    ignore_file = tmp_path / ".backupignore"
+    ignore_file.write_text(".git/\n*.pyc\n")
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+    path_filter = compile_filter([(INCLUDE, "keep.log"), (EXCLUDE, "*.log")], str(ignore_file))
+    hashes = count_hashes(monkeypatch)
+
+    backup_files(str(source_dir), str(tmp_path / "destination"), db_name, logger, job_id=1, path_filter=path_filter)
+    plan = backup.plan_backup(str(source_dir), db_name, logger, path_filter=path_filter)
+
+    backed_up = sorted(os.path.relpath(path, source_dir) for path in hashes)
+    assert backed_up == ["keep.log", os.path.join("src", "app.py")]
+    assert sorted(p.name for p in (tmp_path / "destination").rglob("*") if p.is_file()) == ["app.py", "keep.log"]
+    assert (plan["files"], plan["unchanged"]) == (2, 2)
+
+def test_fan_out_files_tracks_each_destination(tmp_path, logger):
+    source_dir = tmp_path / "source"
+    (source_dir / "sub").mkdir(parents=True)
+    for i in range(4):
+        (source_dir / "sub" / f"file_{i}.txt").write_bytes(f"content {i}".encode() * 1000)
+    onsite, offsite = tmp_path / "onsite", tmp_path / "offsite"
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+
+    # The first destination already holds a single-destination backup, which the fan-out adopts without copying
+    backup_files(str(source_dir), str(onsite), db_name, logger, job_id=1)
+    inode = os.stat(onsite / "sub" / "file_0.txt").st_ino
+    backup.fan_out_files(str(source_dir), [str(onsite), str(offsite)], db_name, logger, job_id=2, workers=2)
+    assert os.stat(onsite / "sub" / "file_0.txt").st_ino == inode
+    for i in range(4):
+        assert (offsite / "sub" / f"file_{i}.txt").read_bytes() == (source_dir / "sub" / f"file_{i}.txt").read_bytes()
+
+    # A failed copy on one destination leaves that destination's row at the old version only
+    (source_dir / "sub" / "file_1.txt").write_bytes(b"changed")
+    os.remove(offsite / "sub" / "file_1.txt")
+    (offsite / "sub" / "file_1.txt").mkdir()
+    (offsite / "sub" / "file_1.txt" / "blocker").write_bytes(b"")
+    backup.fan_out_files(str(source_dir), [str(onsite), str(offsite)], db_name, logger, job_id=3)
+    conn = sqlite3.connect(db_name)
+    rows = dict(conn.execute("SELECT Destination, Md5hash FROM DestinationFile WHERE Filename = 'file_1.txt'").fetchall())
+    errors = conn.execute("SELECT Message FROM Logentry WHERE severity_level = 'ERROR' AND job_id = 3").fetchall()
+    conn.close()
+    new_hash = hashlib.md5(b"changed").hexdigest()
+    assert rows[str(onsite)] == new_hash and rows[str(offsite)] != new_hash
+    assert len(errors) == 1 and str(offsite) in errors[0][0]
+
+    # The next run copies the file to the destination that missed it and leaves the other one alone
+    (offsite / "sub" / "file_1.txt" / "blocker").unlink()
+    (offsite / "sub" / "file_1.txt").rmdir()
+    inode = os.stat(onsite / "sub" / "file_1.txt").st_ino
+    backup.fan_out_files(str(source_dir), [str(onsite), str(offsite)], db_name, logger, job_id=4)
+    assert os.stat(onsite / "sub" / "file_1.txt").st_ino == inode
+    assert (offsite / "sub" / "file_1.txt").read_bytes() == b"changed"
+    conn = sqlite3.connect(db_name)
+    assert conn.execute("SELECT COUNT(*) FROM DestinationFile WHERE Md5hash = ?", (new_hash,)).fetchone()[0] == 2
+    conn.close()
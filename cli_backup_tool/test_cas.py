@@ -0,0 +1,30 @@
+# test_cas.py
+import os
+
+from cas import blob_path, link_blob, store_blob
+
+
+def test_store_blob_stores_content_once(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"Test file content")
+    store_dir = str(tmp_path / "store")
+
+    assert store_blob(store_dir, source, "abcdef") is True
+    assert store_blob(store_dir, source, "abcdef") is False
+
+    assert open(blob_path(store_dir, "abcdef"), "rb").read() == b"Test file content"
+    assert os.listdir(os.path.dirname(blob_path(store_dir, "abcdef"))) == ["cdef"]
+
+def test_link_blob_hardlinks_tree_entry(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"Test file content")
+    store_dir = str(tmp_path / "store")
+    store_blob(store_dir, source, "abcdef")
+    tree_path = tmp_path / "tree.txt"
+    tree_path.write_bytes(b"stale")
+
+    link_blob(store_dir, "abcdef", tree_path)
+    link_blob(store_dir, "abcdef", tree_path)
+
+    assert os.path.samefile(tree_path, blob_path(store_dir, "abcdef"))
+    assert tree_path.read_bytes() == b"Test file content"
@@ -0,0 +1,78 @@
+# test_catalog.py
+import sqlite3
+
+import catalog as catalog_module
+from catalog import Catalog, open_catalog
+
+
+def count_rows(db_name, table="test"):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT COUNT(*) FROM {table}')
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+def test_catalog_commits_in_batches(tmp_path):
+    db_name = tmp_path / "test_db.db"
+    catalog = Catalog(db_name, batch_size=3)
+    catalog.execute('CREATE TABLE test (value INTEGER)')
+    catalog.commit()
+
+    catalog.execute('INSERT INTO test VALUES (1)')
+    catalog.execute('INSERT INTO test VALUES (2)')
+    assert count_rows(db_name) == 0
+    assert catalog.fetchone('SELECT COUNT(*) FROM test') == (2,)
+
+    catalog.execute('INSERT INTO test VALUES (3)')
+    assert count_rows(db_name) == 3
+
+    catalog.execute('INSERT INTO test VALUES (4)')
+    catalog.close()
+    assert count_rows(db_name) == 4
+
+def test_catalog_execute_returns_lastrowid(tmp_path):
+    with Catalog(tmp_path / "test_db.db") as catalog:
+        catalog.execute('CREATE TABLE test (id INTEGER PRIMARY KEY, value TEXT)')
+        first = catalog.execute('INSERT INTO test (value) VALUES (?)', ("a",))
+        second = catalog.execute('INSERT INTO test (value) VALUES (?)', ("b",))
+
+    assert (first, second) == (1, 2)
+
+def test_open_catalog_borrows_open_catalog(tmp_path):
+    with Catalog(tmp_path / "test_db.db") as catalog:
+        with open_catalog(catalog) as borrowed:
+            assert borrowed is catalog
+        assert catalog.conn is not None
+
+def test_open_catalog_closes_path_catalog(tmp_path):
+    with open_catalog(tmp_path / "test_db.db") as catalog:
+        catalog.execute('CREATE TABLE test (value INTEGER)')
+        catalog.execute('INSERT INTO test VALUES (1)')
+
+    assert catalog.conn is None
+    assert count_rows(tmp_path / "test_db.db") == 1
+
+def test_backup_job_uses_one_connection(tmp_path, monkeypatch):
+    import backup
+
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    for i in range(5):
+        (source_dir / f"file_{i}.txt").write_bytes(f"content {i}".encode())
+    connections = []
+    original_connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        connections.append(args[0])
+        return original_connect(*args, **kwargs)
+
+    monkeypatch.setattr(catalog_module.sqlite3, "connect", counting_connect)
+    logger = backup.setup_logger(tmp_path / "test_backup.log", verbose=False, db_name=tmp_path / "test_db.db")
+    with Catalog(tmp_path / "test_db.db") as catalog:
+        backup.create_database(catalog)
+        backup.create_logentry_table(catalog)
+        backup.backup_files(str(source_dir), str(tmp_path / "destination"), catalog, logger, job_id=1)
+
+    assert len(connections) == 1
+    assert count_rows(tmp_path / "test_db.db", "Logentry") == 5
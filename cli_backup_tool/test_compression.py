@@ -0,0 +1,44 @@
+# test_compression.py
+import os
+
+import pytest
+
+from compression import CODECS, compress_file, decompress_file, parse_policy
+
+
+def test_policy_uses_default_and_extension_rules():
+    policy = parse_policy("zlib", [".log=lzma", "csv=none"])
+
+    assert policy.codec_for("notes.txt") == "zlib"
+    assert policy.codec_for("app.LOG") == "lzma"
+    assert policy.codec_for("data.csv") is None
+    assert policy.codec_for("photo.jpg") is None
+
+def test_policy_rejects_unknown_codec():
+    with pytest.raises(ValueError):
+        parse_policy(None, [".log=zstd"])
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_compress_file_round_trip(tmp_path, codec):
+    source = tmp_path / "source.txt"
+    content = b"repetitive line\n" * 100000 + os.urandom(4096)
+    source.write_bytes(content)
+    compressed = tmp_path / "source.txt.c"
+    restored = tmp_path / "restored.txt"
+
+    stored_size = compress_file(str(source), str(compressed), codec, chunk_size=4096)
+
+    assert stored_size == os.path.getsize(compressed) < len(content)
+    assert os.stat(compressed).st_mtime_ns == os.stat(source).st_mtime_ns
+    assert decompress_file(str(compressed), str(restored), codec, chunk_size=4096) == len(content)
+    assert restored.read_bytes() == content
+
+def test_decompress_file_rejects_truncated_stream(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"some content " * 1000)
+    compressed = tmp_path / "source.txt.xz"
+    compress_file(str(source), str(compressed), "lzma")
+    compressed.write_bytes(compressed.read_bytes()[:-20])
+
+    with pytest.raises(EOFError):
+        decompress_file(str(compressed), str(tmp_path / "restored.txt"), "lzma")
@@ -0,0 +1,105 @@
+# test_copier.py
+import errno
+import hashlib
+import os
+import time
+
+import pytest
+
+import copier
+from copier import available_engines, copy_and_hash, copy_file
+from throttle import Throttle
+
+
+@pytest.mark.parametrize("engine", ["copy_file_range", "sendfile", "buffered"])
+def test_copy_file_copies_content_and_metadata(tmp_path, engine):
+    if engine not in available_engines(engine):
+        pytest.skip(f"{engine} is not available on this platform")
+    source = tmp_path / "source.bin"
+    content = os.urandom(3 * copier.CHUNK_SIZE + 123)
+    source.write_bytes(content)
+    os.chmod(source, 0o640)
+    destination = tmp_path / "destination.bin"
+    destination.write_bytes(b"stale content that is longer than nothing")
+
+    assert copy_file(str(source), str(destination), engine) == engine
+
+    assert destination.read_bytes() == content
+    assert destination.stat().st_mtime_ns == source.stat().st_mtime_ns
+    assert destination.stat().st_mode == source.stat().st_mode
+
+def test_copy_file_falls_back_when_syscall_is_unsupported(tmp_path, monkeypatch):
+    source = tmp_path / "source.bin"
+    content = os.urandom(1024 * 1024)
+    source.write_bytes(content)
+
+    def cross_device(*args):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(os, "copy_file_range", cross_device, raising=False)
+    monkeypatch.setattr(os, "sendfile", cross_device, raising=False)
+
+    assert copy_file(str(source), str(tmp_path / "destination.bin")) == "buffered"
+    assert (tmp_path / "destination.bin").read_bytes() == content
+
+def test_copy_file_raises_real_io_errors(tmp_path, monkeypatch):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"content")
+
+    def disk_full(*args):
+        raise OSError(errno.ENOSPC, "No space left on device")
+
+    monkeypatch.setattr(os, "copy_file_range", disk_full, raising=False)
+
+    with pytest.raises(OSError):
+        copy_file(str(source), str(tmp_path / "destination.bin"), "copy_file_range")
+
+def test_available_engines_rejects_unknown_engine():
+    with pytest.raises(ValueError):
+        available_engines("splice")
+
+def test_copy_and_hash_returns_digest_of_copied_bytes(tmp_path):
+    source = tmp_path / "source.bin"
+    content = os.urandom(2 * copier.CHUNK_SIZE + 7)
+    source.write_bytes(content)
+    destination = tmp_path / "destination.bin"
+    destination.write_bytes(b"previous version")
+
+    digest = copy_and_hash(str(source), str(destination), "sha256")
+
+    assert digest == hashlib.sha256(content).hexdigest()
+    assert destination.read_bytes() == content
+    assert destination.stat().st_mtime_ns == source.stat().st_mtime_ns
+    assert sorted(os.listdir(tmp_path)) == ["destination.bin", "source.bin"]
+
+def test_copy_and_hash_keeps_destination_on_failure(tmp_path, monkeypatch):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"new version")
+    destination = tmp_path / "destination.bin"
+    destination.write_bytes(b"previous version")
+
+    def failing_copystat(*args):
+        raise OSError(errno.EIO, "Input/output error")
+
+    monkeypatch.setattr(copier.shutil, "copystat", failing_copystat)
+
+    with pytest.raises(OSError):
+        copy_and_hash(str(source), str(destination))
+    assert destination.read_bytes() == b"previous version"
+    assert sorted(os.listdir(tmp_path)) == ["destination.bin", "source.bin"]
+
+@pytest.mark.parametrize("engine", ["copy_file_range", "sendfile", "buffered"])
+def test_copy_file_respects_throttle(tmp_path, engine):
+    if engine not in available_engines(engine):
+        pytest.skip(f"{engine} is not available on this platform")
+    source = tmp_path / "source.bin"
+    content = os.urandom(3 * copier.CHUNK_SIZE)
+    source.write_bytes(content)
+    throttle = Throttle(max_write_bps=10 * copier.CHUNK_SIZE)
+    started = time.monotonic()
+
+    copy_file(str(source), str(tmp_path / "destination.bin"), engine, throttle)
+
+    assert time.monotonic() - started >= 0.15
+    assert throttle.write.throttled_seconds > 0 and throttle.read.throttled_seconds == 0
+    assert (tmp_path / "destination.bin").read_bytes() == content
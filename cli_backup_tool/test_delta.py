@@ -0,0 +1,55 @@
+# test_delta.py
+import os
+
+from delta import BlockSignature, delta_copy
+
+BLOCK_SIZE = 1024
+
+
+def write_file(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+
+def test_delta_copy_writes_everything_without_signature(tmp_path):
+    content = os.urandom(BLOCK_SIZE * 4 + 100)
+    write_file(tmp_path / "source.bin", content)
+
+    signature, written = delta_copy(tmp_path / "source.bin", tmp_path / "destination.bin", block_size=BLOCK_SIZE)
+
+    assert written == len(content)
+    assert signature.block_count() == 5
+    assert (tmp_path / "destination.bin").read_bytes() == content
+
+def test_delta_copy_rewrites_only_changed_blocks(tmp_path):
+    content = bytearray(os.urandom(BLOCK_SIZE * 8))
+    write_file(tmp_path / "source.bin", content)
+    signature, _ = delta_copy(tmp_path / "source.bin", tmp_path / "destination.bin", block_size=BLOCK_SIZE)
+
+    content[BLOCK_SIZE * 3 + 10:BLOCK_SIZE * 3 + 20] = b"x" * 10
+    write_file(tmp_path / "source.bin", content)
+    signature, written = delta_copy(tmp_path / "source.bin", tmp_path / "destination.bin", signature)
+
+    assert written == BLOCK_SIZE
+    assert (tmp_path / "destination.bin").read_bytes() == bytes(content)
+
+def test_delta_copy_appends_and_truncates(tmp_path):
+    content = os.urandom(BLOCK_SIZE * 4)
+    write_file(tmp_path / "source.bin", content)
+    signature, _ = delta_copy(tmp_path / "source.bin", tmp_path / "destination.bin", block_size=BLOCK_SIZE)
+
+    appended = content + os.urandom(BLOCK_SIZE + 1)
+    write_file(tmp_path / "source.bin", appended)
+    signature, written = delta_copy(tmp_path / "source.bin", tmp_path / "destination.bin", signature)
+    assert written == BLOCK_SIZE + 1
+    assert (tmp_path / "destination.bin").read_bytes() == appended
+
+    write_file(tmp_path / "source.bin", content[:BLOCK_SIZE * 2])
+    _, written = delta_copy(tmp_path / "source.bin", tmp_path / "destination.bin", signature)
+    assert written == 0
+    assert (tmp_path / "destination.bin").read_bytes() == content[:BLOCK_SIZE * 2]
+
+def test_block_signature_pack_round_trip(tmp_path):
+    write_file(tmp_path / "source.bin", os.urandom(BLOCK_SIZE * 3))
+    signature, _ = delta_copy(tmp_path / "source.bin", tmp_path / "destination.bin", block_size=BLOCK_SIZE)
+
+    assert BlockSignature.unpack(*signature.pack()) == signature
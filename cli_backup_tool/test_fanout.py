@@ -0,0 +1,76 @@
+# test_fanout.py
+import hashlib
+import os
+import threading
+
+import pytest
+
+from copier import CHUNK_SIZE
+from fanout import FanOut, _ABORT, _Ticket
+
+
+def write_source(tmp_path, size):
+    source = tmp_path / "source.bin"
+    data = os.urandom(size)
+    source.write_bytes(data)
+    return str(source), data
+
+def test_fan_out_reads_once_and_writes_every_destination(tmp_path):
+    source, data = write_source(tmp_path, 3 * CHUNK_SIZE + 17)
+    paths = {index: str(tmp_path / f"d{index}" / "sub" / "file.bin") for index in range(3)}
+
+    with FanOut(3, "sha256") as fan_out:
+        digest = fan_out.copy(source, paths, key="file")
+    completions = sorted(fan_out.completed())
+
+    assert digest == hashlib.sha256(data).hexdigest()
+    assert [(c.destination, c.key, c.digest, c.error) for c in completions] == [(i, "file", digest, None) for i in range(3)]
+    for path in paths.values():
+        assert open(path, "rb").read() == data
+        assert os.stat(path).st_mtime_ns == os.stat(source).st_mtime_ns
+    assert fan_out.stats(1) == (1, len(data), 0, 0)
+
+def test_failed_destination_does_not_affect_the_others(tmp_path):
+    source, data = write_source(tmp_path, CHUNK_SIZE + 1)
+    (tmp_path / "blocked").write_text("a file where a directory is expected")
+    paths = {0: str(tmp_path / "blocked" / "file.bin"), 1: str(tmp_path / "ok" / "file.bin")}
+
+    with FanOut(2) as fan_out:
+        fan_out.copy(source, paths)
+    completions = {c.destination: c for c in fan_out.completed()}
+
+    assert completions[0].error and completions[0].digest is None
+    assert completions[1].error is None
+    assert open(paths[1], "rb").read() == data
+    assert not [name for name in os.listdir(tmp_path / "ok") if name.startswith(".tmp-")]
+
+def test_unreadable_source_changes_no_destination(tmp_path):
+    with FanOut(2) as fan_out:
+        with pytest.raises(OSError):
+            fan_out.copy(str(tmp_path / "missing"), {0: str(tmp_path / "a" / "x"), 1: str(tmp_path / "b" / "x")})
+    assert list(fan_out.completed()) == []
+    assert not os.listdir(tmp_path / "a") and not os.listdir(tmp_path / "b")
+
+def test_lagging_destination_is_caught_up_after_the_job(tmp_path):
+    source, data = write_source(tmp_path, 6 * CHUNK_SIZE)
+    paths = {0: str(tmp_path / "fast" / "file.bin"), 1: str(tmp_path / "slow" / "file.bin")}
+    release = threading.Event()
+
+    class Blocking(dict):
+        def __getitem__(self, index):
+            release.wait()
+            return "unused"
+
+    fan_out = FanOut(2, max_lag=CHUNK_SIZE)
+    # Stall the second writer so its queue only grows while the first keeps writing
+    with fan_out.condition:
+        fan_out.destinations[1].queue.append((_Ticket("stall", Blocking(), None), _ABORT, None))
+    fan_out.copy(source, paths)
+    release.set()
+    fan_out.close()
+    completions = {c.destination: c for c in fan_out.completed()}
+
+    assert not completions[0].deferred and completions[1].deferred
+    assert completions[0].digest == completions[1].digest == hashlib.md5(data).hexdigest()
+    assert open(paths[0], "rb").read() == open(paths[1], "rb").read() == data
+    assert fan_out.stats(1)[3] == 1
@@ -0,0 +1,76 @@
+# test_filters.py
+import pytest
+
+from filters import EXCLUDE, INCLUDE, PathFilter, compile_filter, read_ignore_file
+
+
+@pytest.mark.parametrize("pattern, path, is_dir, excluded", [
+    ("*.pyc", "a/b/c.pyc", False, True),
+    ("*.pyc", "c.py", False, False),
+    ("*.gz", "a.tar.gz", False, True),
+    ("node_modules", "web/node_modules", True, True),
+    (".git/", "repo/.git", True, True),
+    (".git/", "repo/.git", False, False),
+    ("/build", "build", True, True),
+    ("/build", "src/build", True, False),
+    ("docs/*.tmp", "docs/a.tmp", False, True),
+    ("docs/*.tmp", "docs/sub/a.tmp", False, False),
+    ("logs/**/*.gz", "logs/2024/01/app.gz", False, True),
+    ("logs/**/*.gz", "logs/app.gz", False, True),
+    ("cache-[0-9]?", "x/cache-1a", False, True),
+    ("cache-[!0-9]", "x/cache-1", False, False),
+    ("*~", "notes.txt~", False, True),
+    ("**/node_modules/", "node_modules", True, True),
+    ("**/node_modules/", "web/app/node_modules", True, True),
+    ("**/build", "build", False, True),
+    ("**/build", "src/build", True, True),
+    ("**/build", "src/rebuild", False, False),
+    ("logs/**/debug", "logs/debug", False, True),
+])
+def test_pattern_semantics(pattern, path, is_dir, excluded):
+    assert PathFilter([(EXCLUDE, pattern)]).excluded(path, is_dir) is excluded
+
+def test_first_matching_rule_wins():
+    path_filter = PathFilter([(INCLUDE, "keep.log"), (EXCLUDE, "*.log"), (INCLUDE, "*.log"), (EXCLUDE, "*")])
+
+    assert not path_filter.excluded("a/keep.log")
+    assert path_filter.excluded("a/other.log")
+    assert path_filter.excluded("a/data.bin")
+
+def test_first_rule_wins_across_tables():
+    # A regex rule listed before a literal rule for the same path must take precedence
+    path_filter = PathFilter([(INCLUDE, "*/keep*"), (EXCLUDE, "keep.txt"), (EXCLUDE, "*.txt")])
+    assert not path_filter.excluded("a/keep.txt")
+    assert path_filter.excluded("keep.txt")
+
+def test_first_rule_wins_across_glob_groups():
+    # Globs indexed under different prefixes and suffixes still resolve to the earliest rule
+    path_filter = PathFilter([(INCLUDE, "*-1?"), (EXCLUDE, "cache-*"), (INCLUDE, "cache*"), (EXCLUDE, "[*]x")])
+    assert not path_filter.excluded("a/cache-12")
+    assert path_filter.excluded("a/cache-2")
+    assert path_filter.excluded("*x")
+    assert not path_filter.excluded("]x")
+
+def test_excluded_path_checks_parent_directories():
+    path_filter = PathFilter([(EXCLUDE, "build/")])
+    assert path_filter.excluded_path("src/build/out/app.o")
+    assert not path_filter.excluded("src/build/out/app.o")
+    assert not path_filter.excluded_path("src/app.c")
+
+def test_ignore_file_uses_gitignore_order(tmp_path):
+    ignore_file = tmp_path / ".backupignore"
+    ignore_file.write_text("# caches\n*.log\n!keep.log\n\n\\#literal\n")
+
+    assert read_ignore_file(str(ignore_file)) == [(EXCLUDE, "#literal"), (INCLUDE, "keep.log"), (EXCLUDE, "*.log")]
+    path_filter = compile_filter([(INCLUDE, "special.log")], str(ignore_file))
+    assert not path_filter.excluded("keep.log")
+    assert not path_filter.excluded("special.log")
+    assert path_filter.excluded("other.log")
+    assert path_filter.excluded("#literal")
+
+def test_invalid_rules_raise_value_error():
+    with pytest.raises(ValueError):
+        PathFilter([(EXCLUDE, "/")])
+    with pytest.raises(ValueError):
+        PathFilter([("skip", "*.tmp")])
+    assert not compile_filter()
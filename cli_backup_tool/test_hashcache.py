@@ -0,0 +1,123 @@
+# test_hashcache.py
+import hashlib
+import os
+import sqlite3
+import threading
+
+import hashcache
+from hashcache import HashCache
+
+OLD_MTIME_NS = 1_600_000_000_000_000_000
+
+
+def make_file(path, content, mtime_ns=OLD_MTIME_NS):
+    path.write_bytes(content)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+def count_reads(monkeypatch):
+    reads = []
+    original = hashcache.hash_file
+
+    def counting_hash_file(file_path, *args, **kwargs):
+        reads.append(file_path)
+        return original(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(hashcache, "hash_file", counting_hash_file)
+    return reads
+
+def test_hash_cache_is_shared_between_instances(tmp_path, monkeypatch):
+    path = make_file(tmp_path / "file.txt", b"Test file content")
+    reads = count_reads(monkeypatch)
+
+    with HashCache(str(tmp_path / "cache.db")) as first:
+        assert first.hash_file(path, "sha256") == hashlib.sha256(b"Test file content").hexdigest()
+        assert (first.hits, first.misses) == (0, 1)
+    with HashCache(str(tmp_path / "cache.db")) as second:
+        assert second.hash_file(path, "sha256") == hashlib.sha256(b"Test file content").hexdigest()
+        assert second.hash_file(path, "md5") == hashlib.md5(b"Test file content").hexdigest()
+        assert (second.hits, second.misses) == (1, 1)
+
+    assert len(reads) == 2
+
+def test_hash_cache_refresh_rehashes_and_replaces_entry(tmp_path, monkeypatch):
+    path = make_file(tmp_path / "file.txt", b"original")
+    reads = count_reads(monkeypatch)
+    with HashCache(str(tmp_path / "cache.db")) as cache:
+        cache.hash_file(path)
+        # Same size, mtime and inode: only a re-read can tell the content changed
+        make_file(tmp_path / "file.txt", b"modified")
+        assert cache.hash_file(path) == hashlib.md5(b"original").hexdigest()
+        assert cache.hash_file(path, refresh=True) == hashlib.md5(b"modified").hexdigest()
+        assert cache.hash_file(path) == hashlib.md5(b"modified").hexdigest()
+
+    assert len(reads) == 2
+
+def test_hash_cache_misses_after_modification(tmp_path, monkeypatch):
+    path = make_file(tmp_path / "file.txt", b"old")
+    reads = count_reads(monkeypatch)
+
+    with HashCache(str(tmp_path / "cache.db")) as cache:
+        cache.hash_file(path)
+        make_file(tmp_path / "file.txt", b"new", OLD_MTIME_NS + 1)
+        assert cache.hash_file(path) == hashlib.md5(b"new").hexdigest()
+
+    assert len(reads) == 2
+
+def test_hash_cache_skips_recently_modified_files(tmp_path, monkeypatch):
+    path = tmp_path / "fresh.txt"
+    path.write_bytes(b"just written")
+    reads = count_reads(monkeypatch)
+
+    with HashCache(str(tmp_path / "cache.db")) as cache:
+        cache.hash_file(str(path))
+        cache.hash_file(str(path))
+
+    assert len(reads) == 2
+
+def test_hash_cache_evicts_least_recently_used(tmp_path):
+    paths = [make_file(tmp_path / f"file_{i}.txt", f"content {i}".encode()) for i in range(3)]
+    with HashCache(str(tmp_path / "cache.db"), max_entries=2) as cache:
+        cache.hash_file(paths[0])
+        cache.hash_file(paths[1])
+        cache.flush()
+        cache.hash_file(paths[0])
+        cache.hash_file(paths[2])
+        cache.flush()
+
+        # The bound holds as soon as the batch is written, not only on close
+        assert cache.evicted == 1
+        conn = sqlite3.connect(tmp_path / "cache.db")
+        assert conn.execute('SELECT COUNT(*) FROM HashCache').fetchone() == (2,)
+        conn.close()
+        assert cache.evict() == 0
+        hits = cache.hits
+        cache.hash_file(paths[0])
+        cache.hash_file(paths[2])
+        cache.hash_file(paths[1])
+
+        assert cache.hits - hits == 2
+        assert cache.evicted == 1
+
+def test_hash_cache_concurrent_jobs(tmp_path):
+    paths = [make_file(tmp_path / f"file_{i}.txt", f"content {i}".encode()) for i in range(200)]
+    errors = []
+
+    def job():
+        try:
+            with HashCache(str(tmp_path / "cache.db")) as cache:
+                for path in paths:
+                    assert cache.hash_file(path) == hashlib.md5(open(path, "rb").read()).hexdigest()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with HashCache(str(tmp_path / "cache.db")) as cache:
+        assert all(cache.hash_file(path) for path in paths)
+        assert cache.misses == 0
@@ -0,0 +1,40 @@
+# test_hashing.py
+import hashlib
+
+import pytest
+
+import hashing
+from hashing import hash_file, new_hasher
+
+TEST_CONTENT = b"Test file content" * 1000
+
+
+@pytest.mark.parametrize("algorithm", ["md5", "sha256", "blake2b"])
+def test_hash_file_matches_hashlib(tmp_path, algorithm):
+    test_file = tmp_path / "test_file.bin"
+    test_file.write_bytes(TEST_CONTENT)
+
+    assert hash_file(test_file, algorithm=algorithm, chunk_size=1000) == hashlib.new(algorithm, TEST_CONTENT).hexdigest()
+
+def test_hash_file_mmap_matches_chunked(tmp_path, monkeypatch):
+    test_file = tmp_path / "test_file.bin"
+    test_file.write_bytes(TEST_CONTENT)
+    # Force several mmap windows for a small file
+    monkeypatch.setattr(hashing, "MMAP_WINDOW", 1)
+
+    chunked = hash_file(test_file, chunk_size=4096)
+    mapped = hash_file(test_file, chunk_size=4096, use_mmap=True, mmap_threshold=0)
+    assert mapped == chunked == hashlib.md5(TEST_CONTENT).hexdigest()
+
+def test_hash_file_empty_file(tmp_path):
+    test_file = tmp_path / "empty.bin"
+    test_file.write_bytes(b"")
+
+    assert hash_file(test_file, use_mmap=True, mmap_threshold=0) == hashlib.md5(b"").hexdigest()
+
+def test_hash_file_directory_returns_none(tmp_path):
+    assert hash_file(tmp_path) is None
+
+def test_new_hasher_rejects_unknown_algorithm():
+    with pytest.raises(ValueError):
+        new_hasher("crc32")
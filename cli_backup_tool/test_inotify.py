@@ -0,0 +1,79 @@
+# test_inotify.py
+import errno
+import os
+
+import pytest
+
+from inotify import IN_Q_OVERFLOW, TreeWatcher, WatchBatch, inotify_available
+
+pytestmark = pytest.mark.skipif(not inotify_available(), reason="inotify is only available on Linux")
+
+
+def test_watcher_reports_changed_files_once_per_batch(tmp_path):
+    (tmp_path / "sub").mkdir()
+    with TreeWatcher(str(tmp_path)) as watcher:
+        for i in range(5):
+            with open(tmp_path / "sub" / "file.txt", "ab") as f:
+                f.write(b"chunk")
+        (tmp_path / "top.txt").write_bytes(b"top")
+
+        batch = watcher.wait(debounce=0.05, timeout=5)
+
+        assert batch.paths == {os.path.join("sub", "file.txt"), "top.txt"}
+        assert batch.full_rescan is False
+        assert watcher.wait(debounce=0.05, timeout=0.1) is None
+
+def test_watcher_watches_new_directories(tmp_path):
+    with TreeWatcher(str(tmp_path)) as watcher:
+        (tmp_path / "new").mkdir()
+        assert watcher.wait(debounce=0.05, timeout=5).paths == {"new"}
+
+        (tmp_path / "new" / "inner.txt").write_bytes(b"inner")
+        assert watcher.wait(debounce=0.05, timeout=5).paths == {os.path.join("new", "inner.txt")}
+
+def test_watcher_requests_full_rescan_on_overflow(tmp_path):
+    with TreeWatcher(str(tmp_path)) as watcher:
+        watcher.handle_event(-1, IN_Q_OVERFLOW, "")
+
+        assert watcher.wait(debounce=0.01, timeout=0).full_rescan is True
+
+def test_watcher_skips_directories_it_cannot_watch(tmp_path, monkeypatch):
+    (tmp_path / "full").mkdir()
+    (tmp_path / "gone").mkdir()
+    (tmp_path / "ok").mkdir()
+    add_watch = TreeWatcher.add_watch
+
+    def limited_add_watch(self, relative_dir):
+        if relative_dir in ("full", "gone"):
+            error = errno.ENOSPC if relative_dir == "full" else errno.ENOENT
+            raise OSError(error, os.strerror(error))
+        add_watch(self, relative_dir)
+
+    monkeypatch.setattr(TreeWatcher, "add_watch", limited_add_watch)
+    errors = []
+    with TreeWatcher(str(tmp_path), on_error=lambda path, error: errors.append((path, error.errno))) as watcher:
+        assert sorted(errors) == [(str(tmp_path / "full"), errno.ENOSPC), (str(tmp_path / "gone"), errno.ENOENT)]
+        assert sorted(watcher.directories.values()) == ["", "ok"]
+
+        (tmp_path / "ok" / "new").mkdir()
+        (tmp_path / "full" / "new").mkdir()
+        assert watcher.wait(debounce=0.05, timeout=5) == WatchBatch({os.path.join("ok", "new")}, False)
+
+def test_watcher_requests_full_rescan_when_out_of_watches(tmp_path, monkeypatch):
+    add_watch = TreeWatcher.add_watch
+
+    def limited_add_watch(self, relative_dir):
+        if relative_dir:
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        add_watch(self, relative_dir)
+
+    monkeypatch.setattr(TreeWatcher, "add_watch", limited_add_watch)
+    with TreeWatcher(str(tmp_path)) as watcher:
+        (tmp_path / "new").mkdir()
+        batch = watcher.wait(debounce=0.05, timeout=5)
+
+        assert batch.paths == {"new"} and batch.full_rescan is True
+
+def test_watcher_raises_when_the_root_cannot_be_watched(tmp_path):
+    with pytest.raises(OSError):
+        TreeWatcher(str(tmp_path / "missing"))
@@ -0,0 +1,78 @@
+# test_logsink.py
+import logging
+import sqlite3
+import time
+
+import pytest
+
+import migrations
+from catalog import Catalog
+from logsink import LogSink, flush_queued_logging, start_queued_logging
+
+
+def logentry_rows(db_name):
+    conn = sqlite3.connect(db_name)
+    rows = conn.execute('SELECT severity_level, Message, file_id, job_id FROM Logentry ORDER BY entry_id').fetchall()
+    conn.close()
+    return rows
+
+def test_log_sink_writes_rows_in_order_on_close(tmp_path):
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+
+    with Catalog(db_name, batch_size=1000) as catalog:
+        with LogSink(catalog, flush_interval=60) as sink:
+            for i in range(25):
+                sink.put("2024-01-01 12:00:00", "INFO", f"message {i}", file_id=i, job_id=1)
+
+    assert logentry_rows(db_name) == [("INFO", f"message {i}", i, 1) for i in range(25)]
+
+def test_log_sink_leaves_commits_to_the_catalog(tmp_path):
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+
+    with Catalog(db_name, batch_size=1000) as catalog:
+        with LogSink(catalog, flush_interval=0.01) as sink:
+            sink.put("2024-01-01 12:00:00", "INFO", "message")
+            sink.flush()
+            assert catalog.fetchall('SELECT Message FROM Logentry') == [("message",)]
+            assert logentry_rows(db_name) == []
+        catalog.commit()
+        assert [row[1] for row in logentry_rows(db_name)] == ["message"]
+
+def test_log_sink_flushes_by_size_and_time(tmp_path):
+    db_name = tmp_path / "test_db.db"
+    migrations.migrate(db_name)
+
+    with Catalog(db_name, batch_size=1000) as catalog, LogSink(catalog, flush_size=3, flush_interval=0.05) as sink:
+        for i in range(3):
+            sink.put("2024-01-01 12:00:00", "INFO", f"message {i}")
+        sink.put("2024-01-01 12:00:00", "WARNING", "late message")
+        deadline = time.monotonic() + 5
+        while len(catalog.fetchall('SELECT Message FROM Logentry')) < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        assert catalog.fetchall('SELECT Message FROM Logentry ORDER BY entry_id') == [
+            ("message 0",), ("message 1",), ("message 2",), ("late message",)]
+
+def test_log_sink_reraises_write_errors(tmp_path):
+    db_name = tmp_path / "test_db.db"
+    catalog = Catalog(db_name)
+    sink = LogSink(catalog)
+    sink.put("2024-01-01 12:00:00", "INFO", "no Logentry table yet")
+
+    with pytest.raises(sqlite3.OperationalError):
+        sink.close()
+    catalog.close()
+
+def test_queued_logging_writes_after_flush(tmp_path):
+    logger = logging.getLogger("test_logsink_queued")
+    logger.setLevel(logging.INFO)
+    handler = logging.FileHandler(tmp_path / "queued.log")
+    start_queued_logging(logger, [handler])
+
+    for i in range(100):
+        logger.info("line %d", i)
+    flush_queued_logging(logger)
+
+    assert (tmp_path / "queued.log").read_text().splitlines() == [f"line {i}" for i in range(100)]
@@ -0,0 +1,46 @@
+# test_manifest.py
+import hashlib
+
+from manifest import Manifest, ManifestBuilder, diff_manifests
+
+
+def build(entries):
+    builder = ManifestBuilder()
+    for path_id, size, content in entries:
+        builder.add(path_id, size, 1_000, hashlib.md5(content).hexdigest())
+    return builder.build()
+
+def test_builder_sorts_by_path_id_and_keeps_last_duplicate():
+    manifest = build([(5, 1, b"e"), (2, 1, b"b"), (9, 1, b"i"), (2, 2, b"bb")])
+
+    assert manifest.ids.tolist() == [2, 5, 9]
+    assert manifest.sizes.tolist() == [2, 1, 1]
+    assert manifest.digest(0) == hashlib.md5(b"bb").digest()
+    assert len(manifest.digests) == 3 * 16
+
+def test_manifest_pack_round_trip():
+    manifest = build([(1, 10, b"a"), (3, 30, b"c")])
+    entries, digest_size, *columns = manifest.pack()
+
+    assert entries == 2
+    assert Manifest.unpack(digest_size, *columns) == manifest
+
+def test_diff_manifests_finds_added_changed_removed():
+    old = build([(1, 1, b"a"), (2, 1, b"b"), (3, 1, b"c"), (4, 1, b"d")])
+    new = build([(2, 1, b"b"), (3, 1, b"C"), (4, 2, b"d"), (5, 1, b"e"), (6, 1, b"f")])
+
+    diff = diff_manifests(old, new)
+
+    assert diff.added.tolist() == [5, 6]
+    assert diff.changed.tolist() == [3, 4]
+    assert diff.removed.tolist() == [1]
+
+def test_diff_manifests_handles_empty_and_mixed_digest_sizes():
+    empty = ManifestBuilder().build()
+    manifest = build([(1, 1, b"a")])
+    assert diff_manifests(empty, manifest).added.tolist() == [1]
+    assert diff_manifests(manifest, empty).removed.tolist() == [1]
+
+    builder = ManifestBuilder()
+    builder.add(1, 1, 1_000, hashlib.sha256(b"a").hexdigest())
+    assert diff_manifests(manifest, builder.build()).changed.tolist() == [1]
@@ -0,0 +1,83 @@
+# test_migrations.py
+import sqlite3
+
+import catalog as catalog_module
+import migrations
+from migrations import SCHEMA_VERSION, get_schema_version, migrate
+
+
+def index_names(db_name):
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    names = {row[0] for row in cursor.fetchall()}
+    conn.close()
+    return names
+
+def test_migrate_new_database(tmp_path):
+    db_name = tmp_path / "test_db.db"
+
+    assert migrate(db_name) == SCHEMA_VERSION
+
+    assert get_schema_version(db_name) == SCHEMA_VERSION
+    assert {
+        "idx_file_path",
+        "idx_logentry_file_id",
+        "idx_logentry_job_id",
+        "idx_logentry_entry_datetime",
+        "idx_logentry_severity_level",
+        "idx_notes_entry_id",
+    } <= index_names(db_name)
+
+def test_migrate_current_database_runs_no_ddl(tmp_path, monkeypatch):
+    db_name = tmp_path / "test_db.db"
+    migrate(db_name)
+    statements = []
+    original_execute = catalog_module.Catalog.execute
+
+    def recording_execute(self, sql, parameters=()):
+        statements.append(sql)
+        return original_execute(self, sql, parameters)
+
+    monkeypatch.setattr(catalog_module.Catalog, "execute", recording_execute)
+    migrate(db_name)
+
+    assert statements == []
+
+def test_migrate_upgrades_legacy_database(tmp_path):
+    db_name = tmp_path / "old_db.db"
+    conn = sqlite3.connect(db_name)
+    conn.execute('''
+        CREATE TABLE file (
+            File_id INTEGER PRIMARY KEY,
+            Directory TEXT NOT NULL,
+            Filename TEXT NOT NULL,
+            Last_backup_datetime TEXT,
+            Md5hash TEXT NOT NULL
+        )
+    ''')
+    conn.execute("INSERT INTO file (Directory, Filename, Md5hash) VALUES ('dir', 'a.txt', 'hash_1')")
+    conn.execute("INSERT INTO file (Directory, Filename, Md5hash) VALUES ('dir', 'a.txt', 'hash_2')")
+    conn.commit()
+    conn.close()
+
+    migrate(db_name)
+
+    conn = sqlite3.connect(db_name)
+    cursor = conn.cursor()
+    cursor.execute('SELECT File_id, Md5hash, Size FROM file')
+    files = cursor.fetchall()
+    conn.close()
+    assert files == [(2, "hash_2", None)]
+
+def test_migrate_to_intermediate_version(tmp_path):
+    db_name = tmp_path / "test_db.db"
+
+    assert migrate(db_name, target_version=2) == 2
+    assert "idx_logentry_job_id" not in index_names(db_name)
+
+    assert migrate(db_name) == SCHEMA_VERSION
+    assert "idx_logentry_job_id" in index_names(db_name)
+
+def test_migration_versions_are_sequential():
+    assert [version for version, _, _ in migrations.MIGRATIONS] == list(range(1, SCHEMA_VERSION + 1))
@@ -0,0 +1,51 @@
+# test_pack.py
+import os
+
+import pytest
+
+from pack import PackLocation, PackWriter, read_entry, read_small_file
+
+
+def test_pack_writer_appends_and_reads_back(tmp_path):
+    contents = [os.urandom(size) for size in (0, 1, 100, 4000)]
+    with PackWriter(str(tmp_path), "7") as writer:
+        locations = [writer.append(data) for data in contents]
+
+    assert writer.files == 4 and writer.bytes == sum(len(data) for data in contents)
+    assert all(location.segment == os.path.join("packs", "7-00001.pack") for location in locations)
+    for data, location in zip(contents, locations):
+        assert read_entry(str(tmp_path / location.segment), location.offset, location.length) == data
+
+def test_pack_writer_rotates_segments(tmp_path):
+    with PackWriter(str(tmp_path), "job", segment_size=1000) as writer:
+        locations = [writer.append(bytes([i]) * 400) for i in range(5)]
+
+    assert writer.segments == 3
+    assert [location.offset for location in locations] == [0, 400, 0, 400, 0]
+    assert len({location.segment for location in locations}) == 3
+    # A file larger than a segment still gets a segment of its own
+    with PackWriter(str(tmp_path), "big", segment_size=10) as writer:
+        assert writer.append(b"x" * 50) == PackLocation(os.path.join("packs", "big-00001.pack"), 0, 50)
+
+def test_pack_writer_never_reopens_existing_segments(tmp_path):
+    with PackWriter(str(tmp_path), "1") as writer:
+        first = writer.append(b"first run")
+    with PackWriter(str(tmp_path), "1") as writer:
+        second = writer.append(b"resumed run")
+
+    assert first.segment != second.segment
+    assert read_entry(str(tmp_path / first.segment), first.offset, first.length) == b"first run"
+
+def test_read_entry_rejects_truncated_segment(tmp_path):
+    with PackWriter(str(tmp_path), "1") as writer:
+        location = writer.append(b"x" * 100)
+    os.truncate(tmp_path / location.segment, 50)
+
+    with pytest.raises(ValueError):
+        read_entry(str(tmp_path / location.segment), location.offset, location.length)
+
+def test_read_small_file_reads_files_that_grew(tmp_path):
+    path = tmp_path / "grown.txt"
+    path.write_bytes(b"x" * 300)
+    assert read_small_file(str(path), 100) == b"x" * 300
+    assert read_small_file(str(path), 300) == b"x" * 300
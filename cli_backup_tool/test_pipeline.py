@@ -0,0 +1,61 @@
+# test_pipeline.py
+import threading
+import time
+
+import pytest
+
+from pipeline import run_pipeline
+
+
+def test_run_pipeline_emits_in_input_order():
+    emitted = []
+
+    def work(item):
+        # Later items finish first
+        time.sleep((10 - item) / 1000)
+        return item * 2
+
+    run_pipeline(range(10), work, emitted.append, workers=4)
+
+    assert emitted == [item * 2 for item in range(10)]
+
+def test_run_pipeline_emits_on_calling_thread():
+    emit_threads = set()
+    work_threads = set()
+
+    def work(item):
+        work_threads.add(threading.current_thread().name)
+        return item
+
+    run_pipeline(range(20), work, lambda result: emit_threads.add(threading.current_thread().name), workers=3)
+
+    assert emit_threads == {threading.current_thread().name}
+    assert threading.current_thread().name not in work_threads
+
+def test_run_pipeline_sequential_without_workers():
+    emitted = []
+
+    run_pipeline(iter([1, 2, 3]), lambda item: item + 1, emitted.append, workers=1)
+
+    assert emitted == [2, 3, 4]
+
+def test_run_pipeline_propagates_work_errors():
+    def work(item):
+        if item == 5:
+            raise ValueError("bad item")
+        return item
+
+    with pytest.raises(ValueError):
+        run_pipeline(range(100), work, lambda result: None, workers=4, queue_size=2)
+
+def test_run_pipeline_propagates_scan_errors_after_emitting_earlier_items():
+    emitted = []
+
+    def items():
+        yield 1
+        yield 2
+        raise FileNotFoundError("gone")
+
+    with pytest.raises(FileNotFoundError):
+        run_pipeline(items(), lambda item: item, emitted.append, workers=2)
+    assert emitted == [1, 2]
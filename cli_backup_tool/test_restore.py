@@ -0,0 +1,42 @@
+# test_restore.py
+import hashlib
+import os
+
+import pytest
+
+from compression import compress_file
+from restore import restore_file
+
+
+def test_restore_file_plain_copy(tmp_path):
+    backup = tmp_path / "backup.txt"
+    backup.write_bytes(b"Test file content")
+
+    digest, size = restore_file(str(backup), str(tmp_path / "target" / "sub" / "file.txt"), algorithm="sha256")
+
+    assert digest == hashlib.sha256(b"Test file content").hexdigest()
+    assert size == len(b"Test file content")
+    assert (tmp_path / "target" / "sub" / "file.txt").read_bytes() == b"Test file content"
+
+def test_restore_file_decompresses(tmp_path):
+    source = tmp_path / "source.txt"
+    content = b"line of text\n" * 10000
+    source.write_bytes(content)
+    compress_file(str(source), str(tmp_path / "source.txt.xz"), "lzma")
+
+    digest, size = restore_file(str(tmp_path / "source.txt.xz"), str(tmp_path / "restored.txt"), "lzma")
+
+    assert (digest, size) == (hashlib.md5(content).hexdigest(), len(content))
+    assert (tmp_path / "restored.txt").read_bytes() == content
+    assert os.stat(tmp_path / "restored.txt").st_mtime_ns == os.stat(source).st_mtime_ns
+
+def test_restore_file_leaves_no_partial_file(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"content " * 1000)
+    compress_file(str(source), str(tmp_path / "source.txt.bz2"), "bz2")
+    (tmp_path / "source.txt.bz2").write_bytes((tmp_path / "source.txt.bz2").read_bytes()[:-10])
+    (tmp_path / "target").mkdir()
+
+    with pytest.raises(EOFError):
+        restore_file(str(tmp_path / "source.txt.bz2"), str(tmp_path / "target" / "restored.txt"), "bz2")
+    assert os.listdir(tmp_path / "target") == []
@@ -0,0 +1,26 @@
+# test_snapshot.py
+import os
+
+from snapshot import link_unchanged
+
+
+def test_link_unchanged_links_matching_previous_copy(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"Test file content")
+    previous = tmp_path / "previous.txt"
+    previous.write_bytes(b"Test file content")
+    os.utime(previous, ns=(source.stat().st_atime_ns, source.stat().st_mtime_ns))
+
+    assert link_unchanged(str(previous), str(tmp_path / "new.txt"), str(source), source.stat()) is True
+    assert os.path.samefile(previous, tmp_path / "new.txt")
+
+def test_link_unchanged_copies_when_previous_differs(tmp_path):
+    source = tmp_path / "source.txt"
+    source.write_bytes(b"Test file content")
+    previous = tmp_path / "previous.txt"
+    previous.write_bytes(b"Edited")
+
+    assert link_unchanged(str(previous), str(tmp_path / "new.txt"), str(source), source.stat()) is False
+    assert link_unchanged(None, str(tmp_path / "other.txt"), str(source), source.stat()) is False
+    assert not os.path.samefile(previous, tmp_path / "new.txt")
+    assert (tmp_path / "new.txt").read_bytes() == b"Test file content"
@@ -0,0 +1,77 @@
+# test_throttle.py
+import io
+import threading
+import time
+
+import pytest
+
+from throttle import IOLimiter, Throttle, ThrottledReader, TokenBucket, parse_ioprio
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(1000, burst=100)
+    assert bucket.reserve(100) == 0.0
+    assert 0.09 < bucket.reserve(100) <= 0.1
+
+def test_limiter_enforces_shared_byte_rate():
+    limiter = IOLimiter(bytes_per_second=200_000)
+    started = time.monotonic()
+
+    def read():
+        for _ in range(5):
+            limiter.acquire(10_000)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 200 kB at 200 kB/s, minus the 20 kB burst
+    assert time.monotonic() - started >= 0.85
+    assert limiter.throttled_seconds > 0
+
+def test_limiter_enforces_iops():
+    limiter = IOLimiter(ops_per_second=100)
+    started = time.monotonic()
+    for _ in range(41):
+        limiter.acquire(0)
+    assert time.monotonic() - started >= 0.25
+
+def test_unlimited_limiter_is_falsy_and_never_waits():
+    limiter = IOLimiter()
+    assert not limiter
+    limiter.acquire(10 ** 12)
+    assert limiter.throttled_seconds == 0.0
+
+def test_throttled_reader_charges_reads():
+    limiter = IOLimiter(bytes_per_second=1_000_000)
+    reader = ThrottledReader(io.BytesIO(b"x" * 300_000), limiter)
+    buffer = bytearray(100_000)
+    assert reader.readinto(buffer) == 100_000
+    assert reader.read() == b"x" * 200_000
+    assert limiter.throttled_seconds > 0
+
+def test_throttle_charges_reads_and_writes_separately():
+    throttle = Throttle(max_read_bps=1_000_000, max_write_bps=500_000)
+    reader = throttle.reader(io.BytesIO(b"x" * 200_000))
+    writer = throttle.writer(io.BytesIO())
+    writer.write(reader.read())
+    assert throttle.read.throttled_seconds > 0
+    assert throttle.write.throttled_seconds > throttle.read.throttled_seconds
+    assert throttle.throttled_seconds == throttle.read.throttled_seconds + throttle.write.throttled_seconds
+
+def test_unlimited_throttle_returns_raw_files():
+    raw = io.BytesIO()
+    throttle = Throttle()
+    assert not throttle
+    assert throttle.reader(raw) is raw and throttle.writer(raw) is raw
+
+def test_parse_ioprio():
+    assert parse_ioprio("idle") == ("idle", 0)
+    assert parse_ioprio("best-effort") == ("best-effort", 4)
+    assert parse_ioprio("best-effort:7") == ("best-effort", 7)
+    with pytest.raises(ValueError):
+        parse_ioprio("background")
+    with pytest.raises(ValueError):
+        parse_ioprio("best-effort:8")
@@ -0,0 +1,67 @@
+# test_walker.py
+import os
+
+import pytest
+
+from walker import scan_paths, scan_tree
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    source_dir = tmp_path / "source"
+    (source_dir / "sub" / "nested").mkdir(parents=True)
+    (source_dir / "top.txt").write_bytes(b"top")
+    (source_dir / "sub" / "middle.txt").write_bytes(b"middle")
+    (source_dir / "sub" / "nested" / "deep.txt").write_bytes(b"deep")
+    return str(source_dir)
+
+def test_scan_tree_yields_nested_files(source_tree):
+    entries = {entry.relative_path: entry for entry in scan_tree(source_tree)}
+
+    assert set(entries) == {"top.txt", os.path.join("sub", "middle.txt"), os.path.join("sub", "nested", "deep.txt")}
+    deep = entries[os.path.join("sub", "nested", "deep.txt")]
+    assert deep.directory == os.path.join(source_tree, "sub", "nested")
+    assert deep.name == "deep.txt"
+    assert deep.stat.st_size == 4
+    assert entries["top.txt"].directory == source_tree
+
+def test_scan_tree_is_lazy(source_tree):
+    entries = scan_tree(source_tree)
+
+    first = next(entries)
+    assert first.path.startswith(source_tree)
+
+def test_scan_tree_does_not_follow_directory_symlinks(source_tree):
+    os.symlink(os.path.join(source_tree, "sub"), os.path.join(source_tree, "link"))
+
+    paths = [entry.relative_path for entry in scan_tree(source_tree)]
+
+    assert not any(path.startswith(os.path.join("link", "")) for path in paths)
+    assert "link" not in paths
+    assert "link" not in [entry.relative_path for entry in scan_paths(source_tree, ["link"])]
+
+def test_scan_tree_missing_root_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        list(scan_tree(str(tmp_path / "missing")))
+
+def test_scan_paths_yields_selected_files_and_directories(source_tree):
+    selected = ["top.txt", "sub", os.path.join("sub", "middle.txt"), "missing.txt"]
+    entries = {entry.relative_path: entry for entry in scan_paths(source_tree, selected)}
+
+    assert set(entries) == {"top.txt", os.path.join("sub", "middle.txt"), os.path.join("sub", "nested", "deep.txt")}
+    assert entries["top.txt"] == next(entry for entry in scan_tree(source_tree) if entry.relative_path == "top.txt")
+
+def test_scan_tree_prunes_excluded_directories(source_tree, monkeypatch):
+    listed = []
+    original_scandir = os.scandir
+    monkeypatch.setattr(os, "scandir", lambda path: listed.append(path) or original_scandir(path))
+
+    entries = [entry.relative_path for entry in scan_tree(source_tree, exclude=lambda path, is_dir: path == os.path.join("sub", "nested") or path == "top.txt")]
+
+    assert entries == [os.path.join("sub", "middle.txt")]
+    assert os.path.join(source_tree, "sub", "nested") not in listed
+
+def test_scan_paths_skips_paths_below_excluded_directories(source_tree):
+    exclude_path = lambda path, is_dir: path.split(os.sep)[0] == "sub"
+    entries = [entry.relative_path for entry in scan_paths(source_tree, ["top.txt", "sub", os.path.join("sub", "nested", "deep.txt")], exclude_path=exclude_path)]
+    assert entries == ["top.txt"]
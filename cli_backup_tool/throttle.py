@@ -0,0 +1,186 @@
+"""
+throttle.py: Token-bucket I/O rate limiting for the backup tool
+
+A TokenBucket refills at a fixed rate and lets a caller go into debt: the caller that overdraws sleeps
+until the debt is paid off, so large reads are allowed but the long-run rate never exceeds the limit.
+IOLimiter combines a bytes/sec bucket and an operations/sec bucket and is shared by all worker threads
+of a job, which makes the limits a budget for the whole job rather than per thread. Throttle pairs a
+read and a write limiter for the copy path of a backup.
+
+set_priority lowers the CPU (nice) and I/O (ioprio) priority of the process, so a backup yields to the
+application instead of only being held below a fixed rate.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import platform
+import threading
+import time
+from typing import Optional
+
+# Burst allowance in seconds of rate, so short pauses do not turn into a full-speed burst afterwards
+BURST_SECONDS = 0.1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = burst if burst is not None else max(1.0, self.rate * BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens and return how long the caller has to wait before using them."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class IOLimiter:
+    """
+    Shared bytes/sec and IOPS budget; a limit of None or 0 means unlimited.
+
+    throttled_seconds is the total time callers spent sleeping, summed over threads.
+    """
+
+    def __init__(self, bytes_per_second: Optional[float] = None, ops_per_second: Optional[float] = None):
+        self.bytes = TokenBucket(bytes_per_second) if bytes_per_second else None
+        self.ops = TokenBucket(ops_per_second) if ops_per_second else None
+        self.throttled_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return self.bytes is not None or self.ops is not None
+
+    def acquire(self, nbytes: int, ops: int = 1) -> None:
+        """Account for one I/O of nbytes, sleeping if the budget is exhausted."""
+        wait = 0.0
+        if self.bytes is not None and nbytes:
+            wait = self.bytes.reserve(nbytes)
+        if self.ops is not None and ops:
+            wait = max(wait, self.ops.reserve(ops))
+        if wait > 0:
+            time.sleep(wait)
+            with self.lock:
+                self.throttled_seconds += wait
+
+
+class Throttle:
+    """
+    Read and write budgets of one backup job, charged by every function in the copy path.
+
+    The kernel copy engines charge both budgets for each transfer, since they read and write the same bytes.
+    """
+
+    def __init__(self, max_read_bps: Optional[float] = None, max_write_bps: Optional[float] = None):
+        self.read = IOLimiter(max_read_bps)
+        self.write = IOLimiter(max_write_bps)
+
+    def __bool__(self) -> bool:
+        return bool(self.read) or bool(self.write)
+
+    @property
+    def throttled_seconds(self) -> float:
+        return self.read.throttled_seconds + self.write.throttled_seconds
+
+    def transfer(self, nbytes: int) -> None:
+        """Account for nbytes read from the source and written to the destination."""
+        self.read.acquire(nbytes)
+        self.write.acquire(nbytes)
+
+    def reader(self, raw):
+        return ThrottledReader(raw, self.read) if self.read else raw
+
+    def writer(self, raw):
+        return ThrottledWriter(raw, self.write) if self.write else raw
+
+
+class ThrottledReader:
+    """File wrapper that charges every read() and readinto() against an IOLimiter."""
+
+    def __init__(self, raw, limiter: IOLimiter):
+        self.raw = raw
+        self.limiter = limiter
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.raw.read(size)
+        self.limiter.acquire(len(data))
+        return data
+
+    def readinto(self, buffer) -> int:
+        read = self.raw.readinto(buffer)
+        self.limiter.acquire(read or 0)
+        return read
+
+
+class ThrottledWriter:
+    """File wrapper that charges every write() against an IOLimiter."""
+
+    def __init__(self, raw, limiter: IOLimiter):
+        self.raw = raw
+        self.limiter = limiter
+
+    def write(self, data) -> int:
+        written = self.raw.write(data)
+        self.limiter.acquire(len(data) if written is None else written)
+        return written
+
+
+# ioprio_set(2) has no wrapper in libc or the os module
+SYS_IOPRIO_SET = {"x86_64": 251, "i386": 289, "i686": 289, "aarch64": 30, "armv7l": 314, "ppc64le": 273, "s390x": 282}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_CLASSES = {"realtime": 1, "best-effort": 2, "idle": 3}
+
+
+def parse_ioprio(value: str) -> tuple:
+    """Parse "CLASS[:LEVEL]", e.g. "idle" or "best-effort:7", into (class name, level)."""
+    io_class, _, level = value.partition(":")
+    if io_class not in IOPRIO_CLASSES:
+        raise ValueError(f"Unsupported I/O priority class '{io_class}', expected one of {', '.join(IOPRIO_CLASSES)}")
+    level = int(level) if level else (0 if io_class == "idle" else 4)
+    if not 0 <= level <= 7:
+        raise ValueError(f"I/O priority level must be between 0 and 7, got {level}")
+    return io_class, level
+
+
+def set_io_priority(io_class: str, level: int = 4) -> None:
+    """
+    Set the I/O scheduling class and level of the calling thread, which threads started later inherit.
+
+    Only I/O schedulers that implement priorities (BFQ, and CFQ on older kernels) act on it.
+
+    Raises:
+        OSError: ioprio_set is unavailable on this platform or the kernel refused the priority.
+    """
+    number = SYS_IOPRIO_SET.get(platform.machine())
+    if number is None:
+        raise OSError(errno.ENOSYS, f"ioprio_set is not supported on {platform.machine() or 'this platform'}")
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    value = IOPRIO_CLASSES[io_class] << IOPRIO_CLASS_SHIFT | level
+    if libc.syscall(number, IOPRIO_WHO_PROCESS, 0, value) < 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+
+def set_priority(nice: Optional[int] = None, ioprio: Optional[str] = None) -> None:
+    """
+    Lower the CPU and I/O priority of the current process before its worker threads start.
+
+    Args:
+        nice (int, optional): Niceness passed to os.setpriority, from -20 (highest) to 19 (lowest).
+        ioprio (str, optional): I/O priority as "CLASS[:LEVEL]", see parse_ioprio.
+
+    Raises:
+        OSError: A priority could not be set.
+    """
+    if nice is not None:
+        os.setpriority(os.PRIO_PROCESS, 0, nice)
+    if ioprio is not None:
+        set_io_priority(*parse_ioprio(ioprio))
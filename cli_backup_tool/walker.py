@@ -0,0 +1,139 @@
+"""
+walker.py: Lazy recursive directory scanner for the backup tool
+
+Walks a source tree with os.scandir and yields one entry per non-directory file as soon as it is seen,
+so the backup loop can start copying before the walk has finished.
+Only the directories still waiting to be visited are kept in memory. An optional exclude predicate
+(filters.PathFilter.excluded) is asked about every entry, and excluded directories are not descended into.
+"""
+
+import os
+import stat
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional
+
+
+class ScanEntry(NamedTuple):
+    directory: str
+    name: str
+    path: str
+    relative_path: str
+    stat: Optional[os.stat_result]
+
+
+def scan_tree(
+    source_dir: str,
+    onerror: Optional[Callable[[str, OSError], None]] = None,
+    exclude: Optional[Callable[[str, bool], bool]] = None
+) -> Iterator[ScanEntry]:
+    """
+    Yield every file below source_dir, depth first.
+
+    Symlinked directories are neither descended into nor yielded. The stat of each entry comes from the
+    DirEntry cache, so no extra stat call is made per file after the scan.
+
+    Args:
+        source_dir (str): Root of the tree to walk.
+        onerror (callable, optional): Called with (path, error) when a subdirectory cannot be listed.
+            Errors on source_dir itself are raised.
+        exclude (callable, optional): Called with (relative path, is_dir); entries it returns True for are
+            skipped, directories without being listed.
+
+    Yields:
+        ScanEntry: directory (parent as it is recorded in the catalog), name, full path,
+        path relative to source_dir and the stat result (None if stat failed).
+    """
+    return _walk(source_dir, [""], onerror, exclude)
+
+
+def _walk(
+    source_dir: str,
+    pending: List[str],
+    onerror: Optional[Callable[[str, OSError], None]],
+    exclude: Optional[Callable[[str, bool], bool]] = None
+) -> Iterator[ScanEntry]:
+    pending = list(reversed(pending))
+    while pending:
+        relative_dir = pending.pop()
+        directory = os.path.join(source_dir, relative_dir) if relative_dir else source_dir
+        subdirectories = []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    relative_path = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if exclude is None or not exclude(relative_path, True):
+                                subdirectories.append(relative_path)
+                            continue
+                        if entry.is_symlink() and entry.is_dir():
+                            # Not descended into, and not a file either
+                            continue
+                        if exclude is not None and exclude(relative_path, False):
+                            continue
+                        entry_stat = entry.stat()
+                    except OSError:
+                        entry_stat = None
+                    yield ScanEntry(directory, entry.name, entry.path, relative_path, entry_stat)
+        except OSError as e:
+            if not relative_dir:
+                raise
+            if onerror:
+                onerror(directory, e)
+            continue
+        # Reversed so subdirectories are visited in the order scandir returned them
+        pending.extend(reversed(subdirectories))
+
+
+def scan_paths(
+    source_dir: str,
+    relative_paths: Iterable[str],
+    onerror: Optional[Callable[[str, OSError], None]] = None,
+    exclude_path: Optional[Callable[[str, bool], bool]] = None
+) -> Iterator[ScanEntry]:
+    """
+    Yield the entries for selected paths of a tree, as scan_tree would for the whole tree.
+
+    Directories are walked recursively and files inside a listed directory are only yielded once.
+    Paths that no longer exist are skipped.
+
+    Args:
+        source_dir (str): Root of the tree.
+        relative_paths (iterable): Files and directories relative to source_dir.
+        onerror (callable, optional): Called with (path, error) when a directory cannot be listed.
+        exclude_path (callable, optional): Called with (relative path, is_dir); unlike scan_tree's exclude it
+            must also reject paths below an excluded directory (filters.PathFilter.excluded_path).
+
+    Yields:
+        ScanEntry: Same fields as scan_tree.
+    """
+    files = []
+    directories = []
+    for relative_path in sorted(set(relative_paths)):
+        path = os.path.join(source_dir, relative_path)
+        try:
+            link_stat = os.lstat(path)
+        except OSError:
+            continue
+        if exclude_path is not None and exclude_path(relative_path, stat.S_ISDIR(link_stat.st_mode)):
+            continue
+        if stat.S_ISDIR(link_stat.st_mode):
+            if not any(relative_path.startswith(directory + os.sep) for directory in directories):
+                directories.append(relative_path)
+            continue
+        try:
+            # Follows symlinks like DirEntry.stat() in scan_tree
+            path_stat = os.stat(path)
+        except OSError:
+            path_stat = None
+        if path_stat is not None and stat.S_ISDIR(path_stat.st_mode):
+            # A symlink to a directory, which scan_tree skips as well
+            continue
+        files.append((relative_path, path_stat))
+    for relative_path, path_stat in files:
+        if any(relative_path.startswith(directory + os.sep) for directory in directories):
+            continue
+        relative_dir, name = os.path.split(relative_path)
+        directory = os.path.join(source_dir, relative_dir) if relative_dir else source_dir
+        yield ScanEntry(directory, name, os.path.join(directory, name), relative_path, path_stat)
+    if directories:
+        yield from _walk(source_dir, directories, onerror, exclude_path)